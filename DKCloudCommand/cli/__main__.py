@@ -2,8 +2,12 @@
 
 import click
 import os
+import io
+import time
+import threading
 from sys import path, exit
 import sys
+from contextlib import redirect_stdout, redirect_stderr
 from os.path import expanduser
 from signal import signal, SIGUSR1, SIGQUIT, SIGINT, getsignal, pause
 from datetime import datetime
@@ -18,22 +22,20 @@ from DKCloudCommand.modules.DKCloudCommandConfig import DKCloudCommandConfig
 from DKCloudCommand.modules.DKCloudCommandRunner import DKCloudCommandRunner
 from DKCloudCommand.modules.DKKitchenDisk import DKKitchenDisk
 from DKCloudCommand.modules.DKRecipeDisk import DKRecipeDisk
+from DKCloudCommand.modules.DKProfiler import DKProfiler
+from DKCloudCommand.modules.DKDaemon import DKDaemon
 
 DK_VERSION = '1.0.10'
 
-alias_exceptions = {'recipe-conflicts': 'rf', 'kitchen-config': 'kf', 'recipe-create': 're'}
+alias_exceptions = {'recipe-conflicts': 'rf', 'kitchen-config': 'kf', 'recipe-create': 're', 'daemon-start': 'da',
+                    'daemon-stop': 'dx'}
 
 class Backend(object):
     _short_commands = {}
 
     def __init__(self, config_path_param=None):
-        if config_path_param is None:
-            if os.environ.get('DKCLI_CONFIG_LOCATION') is not None:
-                config_file_location = os.path.expandvars('${DKCLI_CONFIG_LOCATION}').strip()
-            else:
-                config_file_location = home + "/dev/DKCloudCommand/DKCloudCommand/DKCloudCommandConfig.json"
-        else:
-            config_file_location = config_path_param
+        config_file_location = Backend.get_config_location(config_path_param)
+        self.config_location = config_file_location
 
         if not os.path.isfile(config_file_location):
             raise click.ClickException("Config file '%s' not found" % config_file_location)
@@ -42,14 +44,42 @@ class Backend(object):
         if not cfg.init_from_file(config_file_location):
             s = "Unable to load configuration from '%s'" % config_file_location
             raise click.ClickException(s)
-        self.dki = DKCloudAPI(cfg)
-        if self.dki is None:
+        self._dki = DKCloudAPI(cfg)
+        if self._dki is None:
             s = 'Unable to create and/or connect to backend object.'
             raise click.ClickException(s)
-        token = self.dki.login()
+        self._logged_in = False
+
+    @property
+    def dki(self):
+        # logged in on first use, so a command answered from disk needs no server
+        if not self._logged_in:
+            self.login()
+        return self._dki
+
+    def login(self):
+        token = self._dki.login()
         if token is None:
             s = 'login failed'
             raise click.ClickException(s)
+        self._logged_in = True
+
+    def get_offline_dki(self):
+        """
+        :rtype: DKCloudAPI -- not logged in, for commands that do not talk to the server
+        """
+        return self._dki
+
+    @staticmethod
+    def get_config_location(config_path_param=None):
+        if config_path_param is None:
+            if os.environ.get('DKCLI_CONFIG_LOCATION') is not None:
+                config_file_location = os.path.expandvars('${DKCLI_CONFIG_LOCATION}').strip()
+            else:
+                config_file_location = home + "/dev/DKCloudCommand/DKCloudCommand/DKCloudCommandConfig.json"
+        else:
+            config_file_location = config_path_param
+        return os.path.abspath(os.path.expanduser(config_file_location))
 
     @staticmethod
     def get_kitchen_name_soft(given_kitchen=None):
@@ -221,16 +251,34 @@ class AliasedGroup(click.Group):
 
 @click.group(cls=AliasedGroup)
 @click.option('--config', '-c', type=str, required=False, help='Path to config file')
+@click.option('--profile', is_flag=True, default=False, help='Print where the command spent its time')
+@click.option('--profile-trace', type=str, required=False, default=None,
+              help='Write a Chrome trace event file (flame graph) of the command to this path')
 @click.version_option(version=DK_VERSION)
 @click.pass_context
-def dk(ctx, config):
-    ctx.obj = Backend(config)
+def dk(ctx, config, profile, profile_trace):
+    if profile or profile_trace is not None:
+        DKProfiler().enable()
+        ctx.call_on_close(lambda: report_profile(profile, profile_trace))
+    if ctx.obj is None:
+        # in a dk daemon the logged in Backend is passed in
+        ctx.obj = Backend(config)
     ctx.obj.set_short_commands(ctx.command.commands)
     # token = ctx.obj.dki._auth_token
     # if token is None:
     #     exit(1)
 
 
+def report_profile(print_summary, trace_path):
+    profiler = DKProfiler()
+    if print_summary:
+        click.echo(profiler.summary(), err=True)
+    if trace_path is not None:
+        profiler.write_trace(trace_path)
+        click.secho('%s - Wrote profile trace to %s' % (get_datetime(), trace_path), fg='green', err=True)
+    profiler.disable()
+
+
 # Use this to override the automated help
 class DKClickCommand(click.Command):
     def __init__(self, name, context_settings=None, callback=None,
@@ -257,8 +305,10 @@ def config_list(backend):
 
 
 @dk.command(name='recipe-status')
+@click.option('--cached', is_flag=True, default=False,
+              help='Compare with the remote tree of the last recipe-status, without asking the server')
 @click.pass_obj
-def recipe_status(backend):
+def recipe_status(backend, cached):
     """
     Compare local recipe to remote recipe for the current recipe.
     """
@@ -271,7 +321,8 @@ def recipe_status(backend):
     recipe_name = DKRecipeDisk.find_recipe_name()
     click.secho("%s - Getting the status of Recipe '%s' in Kitchen '%s'\n\tversus directory '%s'" % (
         get_datetime(), recipe_name, kitchen, recipe_dir), fg='green')
-    check_and_print(DKCloudCommandRunner.recipe_status(backend.dki, kitchen, recipe_name, recipe_dir))
+    dk_api = backend.get_offline_dki() if cached else backend.dki
+    check_and_print(DKCloudCommandRunner.recipe_status(dk_api, kitchen, recipe_name, recipe_dir, cached))
 
 
 @dk.command(name='recipe-conflicts')
@@ -338,6 +389,45 @@ def kitchen_get(backend, kitchen_name, recipe):
     check_and_print(DKCloudCommandRunner.get_kitchen(backend.dki, kitchen_name, os.getcwd(), recipe))
 
 
+@dk.command(name='kitchen-status')
+@click.option('--cached', is_flag=True, default=False,
+              help='Compare with the remote trees of the last status, without asking the server')
+@click.pass_obj
+def kitchen_status(backend, cached):
+    """
+    Compare all local recipes of this Kitchen to the remote recipes
+    """
+    kitchen = DKCloudCommandRunner.which_kitchen_name()
+    if kitchen is None:
+        raise click.ClickException('You are not in a Kitchen')
+    kitchen_dir = DKKitchenDisk.find_kitchen_root_dir()
+    click.secho("%s - Getting the status of the Recipes in Kitchen '%s'\n\tversus directory '%s'" % (
+        get_datetime(), kitchen, kitchen_dir), fg='green')
+    dk_api = backend.get_offline_dki() if cached else backend.dki
+    check_and_print(DKCloudCommandRunner.kitchen_status(dk_api, kitchen, kitchen_dir, cached))
+
+
+@dk.command(name='kitchen-update')
+@click.option('--message', '-m', type=str, required=True, help='change message')
+@click.option('--dryrun', '-d', default=False, is_flag=True, required=False, help='just display changed files')
+@click.pass_obj
+def kitchen_update(backend, message, dryrun):
+    """
+    Update all of the changed files of all local recipes of this Kitchen
+    """
+    kitchen = DKCloudCommandRunner.which_kitchen_name()
+    if kitchen is None:
+        raise click.ClickException('You must be in a Kitchen')
+    kitchen_dir = DKKitchenDisk.find_kitchen_root_dir()
+    if dryrun:
+        click.secho('%s - Display all changed files in the Recipes of Kitchen(%s) with message (%s)' %
+                    (get_datetime(), kitchen, message), fg='green')
+    else:
+        click.secho('%s - Updating all changed files in the Recipes of Kitchen(%s) with message (%s)' %
+                    (get_datetime(), kitchen, message), fg='green')
+    check_and_print(DKCloudCommandRunner.kitchen_update(backend.dki, kitchen, message, kitchen_dir, dryrun))
+
+
 @dk.command(name='kitchen-which')
 @click.pass_obj
 def kitchen_which(backend):
@@ -386,25 +476,41 @@ def kitchen_delete(backend, kitchen):
 @click.option('--get', '-g', type=str, required=False, help='Get the value for an override variable.', multiple=True)
 @click.option('--unset', '-u', type=str, required=False, help='Delete an override variable.', multiple=True)
 @click.option('--listall', '-l', type=str, is_flag=True, required=False, help='List all variables and their values.')
+@click.option('--file', '-f', 'overrides_file', type=click.File('r'), required=False,
+              help="File of variable=value lines or a json object ('-' for stdin), applied in one update")
 @click.pass_obj
-def kitchen_config(backend, kitchen, add, get, unset, listall):
+def kitchen_config(backend, kitchen, add, get, unset, listall, overrides_file):
     """
     Get and Set Kitchen variable overrides
     """
     err_str, use_kitchen = Backend.get_kitchen_from_user(kitchen)
     if use_kitchen is None:
         raise click.ClickException(err_str)
+    if overrides_file is not None:
+        try:
+            file_add, file_unset = DKCloudCommandRunner.parse_override_entries(overrides_file)
+        except (ValueError, IOError) as e:
+            raise click.ClickException(str(e))
+        add = tuple(add) + tuple(file_add)
+        unset = tuple(unset) + tuple(file_unset)
     check_and_print(DKCloudCommandRunner.config_kitchen(backend.dki, use_kitchen, add, get, unset, listall))
 
 
 @dk.command(name='kitchen-merge')
 @click.option('--source_kitchen', '-s', type=str, required=True, help='source (from) kitchen name')
 @click.option('--target_kitchen', '-t', type=str, required=True, help='target (to) kitchen name')
+@click.option('--preview', '-p', is_flag=True, required=False,
+              help='Only compare the recipe trees of both kitchens and report the files that would merge')
 @click.pass_obj
-def kitchen_merge(backend, source_kitchen, target_kitchen):
+def kitchen_merge(backend, source_kitchen, target_kitchen, preview):
     """
     Merge two Kitchens
     """
+    if preview:
+        click.secho('%s - Previewing merge of Kitchen %s into Kitchen %s' % (get_datetime(), source_kitchen,
+                                                                            target_kitchen), fg='green')
+        check_and_print(DKCloudCommandRunner.preview_merge_kitchens(backend.dki, source_kitchen, target_kitchen))
+        return
     click.secho('%s - Merging Kitchen %s into Kitchen %s' % (get_datetime(), source_kitchen, target_kitchen), fg='green')
     check_and_print(DKCloudCommandRunner.merge_kitchens_improved(backend.dki, source_kitchen, target_kitchen))
 
@@ -494,8 +600,9 @@ def recipe_get(backend, recipe):
 @click.option('--variation', '-v', type=str, required=True, help='variation name')
 @click.option('--kitchen', '-k', type=str, help='kitchen name')
 @click.option('--recipe', '-r', type=str, help='recipe name')
+@click.option('--no-cache', is_flag=True, default=False, help='Compile on the server even if nothing changed')
 @click.pass_obj
-def recipe_compile(backend, kitchen, recipe, variation):
+def recipe_compile(backend, kitchen, recipe, variation, no_cache):
     """
     Apply variables to a Recipe
     """
@@ -510,7 +617,8 @@ def recipe_compile(backend, kitchen, recipe, variation):
 
     click.secho('%s - Get the Compiled OrderRun of Recipe %s.%s in Kitchen %s' % (get_datetime(), recipe, variation, use_kitchen),
                 fg='green')
-    check_and_print(DKCloudCommandRunner.get_compiled_serving(backend.dki, use_kitchen, recipe, variation))
+    check_and_print(DKCloudCommandRunner.get_compiled_serving(backend.dki, use_kitchen, recipe, variation,
+                                                              not no_cache))
 
 
 # --------------------------------------------------------------------------------------------------------------------
@@ -587,6 +695,31 @@ def file_update_all(backend, message, dryrun):
     check_and_print(DKCloudCommandRunner.update_all_files(backend.dki, kitchen, recipe, recipe_dir, message, dryrun))
 
 
+@dk.command(name='recipe-watch')
+@click.option('--message', '-m', type=str, required=True, help='change message')
+@click.option('--debounce', type=float, default=0.3, help='seconds of quiet before changes are sent')
+@click.option('--poll-interval', type=float, default=1.0, help='seconds between two checks for a stop')
+@click.option('--polling', default=False, is_flag=True, required=False,
+              help='poll the files instead of using inotify')
+@click.pass_obj
+def recipe_watch(backend, message, debounce, poll_interval, polling):
+    """
+    Update the changed files of this Recipe as they are saved, until Ctrl-C
+    """
+    kitchen = DKCloudCommandRunner.which_kitchen_name()
+    if kitchen is None:
+        raise click.ClickException('You must be in a Kitchen')
+    recipe_dir = DKRecipeDisk.find_recipe_root_dir()
+    if recipe_dir is None:
+        raise click.ClickException('You must be in a Recipe folder')
+    recipe = DKRecipeDisk.find_recipe_name()
+
+    click.secho('%s - Watching Recipe (%s) in Kitchen(%s) with message (%s), Ctrl-C to stop' %
+                (get_datetime(), recipe, kitchen, message), fg='green')
+    check_and_print(DKCloudCommandRunner.watch_recipe(backend.dki, kitchen, recipe, recipe_dir, message, debounce,
+                                                      poll_interval, not polling))
+
+
 @dk.command(name='file-delete')
 @click.option('--kitchen', '-k', type=str, help='kitchen name')
 @click.option('--recipe', '-r', type=str, help='recipe name')
@@ -861,23 +994,39 @@ def order_list(backend, kitchen):
 # --------------------------------------------------------------------------------------------------------------------
 @dk.command(name='secret-list')
 @click.argument('path', required=False)
+@click.option('--no-cache', is_flag=True, default=False, help='Ask the vault even if the list was cached recently')
 @click.pass_obj
-def secret_list(backend,path):
+def secret_list(backend,path,no_cache):
     """
     List all Secrets
     """
     click.echo(click.style('%s - Getting the list of secrets' % get_datetime(), fg='green'))
     check_and_print(
-        DKCloudCommandRunner.secret_list(backend.dki,path))
+        DKCloudCommandRunner.secret_list(backend.dki,path,not no_cache))
 
 @dk.command(name='secret-write')
-@click.argument('entry',required=True)
+@click.argument('entry',required=False)
+@click.option('--file', '-f', 'secrets_file', type=click.File('r'), required=False,
+              help="File of path=value lines ('-' for stdin), written concurrently")
 @click.pass_obj
-def secret_write(backend,entry):
+def secret_write(backend,entry,secrets_file):
     """
-    Write a secret
+    Write a secret, path=value, or many with --file
     """
-    path,value=entry.split('=')
+    if (entry is None) == (secrets_file is None):
+        raise click.ClickException('Provide either path=value or --file, not both.')
+
+    if secrets_file is not None:
+        try:
+            entries = DKCloudCommandRunner.parse_secret_entries(secrets_file)
+        except (ValueError, IOError) as e:
+            raise click.ClickException(str(e))
+        click.echo(click.style('%s - Writing %d secrets' % (get_datetime(), len(entries)), fg='green'))
+        check_and_print(
+            DKCloudCommandRunner.secret_write_many(backend.dki,entries))
+        return
+
+    path,value=entry.split('=',1)
 
     if value.startswith('@'):
         with open(value[1:]) as vfile:
@@ -888,26 +1037,227 @@ def secret_write(backend,entry):
         DKCloudCommandRunner.secret_write(backend.dki,path,value))
 
 @dk.command(name='secret-delete')
-@click.argument('path', required=True)
+@click.argument('path', required=False)
+@click.option('--file', '-f', 'secrets_file', type=click.File('r'), required=False,
+              help="File of secret paths, one per line ('-' for stdin), deleted concurrently")
 @click.pass_obj
-def secret_delete(backend,path):
+def secret_delete(backend,path,secrets_file):
     """
-    Delete a secret
+    Delete a secret, or many with --file
     """
+    if (path is None) == (secrets_file is None):
+        raise click.ClickException('Provide either a path or --file, not both.')
+
+    if secrets_file is not None:
+        paths = DKCloudCommandRunner.parse_secret_entries(secrets_file, with_values=False)
+        click.echo(click.style('%s - Deleting %d secrets' % (get_datetime(), len(paths)), fg='green'))
+        check_and_print(
+            DKCloudCommandRunner.secret_delete_many(backend.dki,paths))
+        return
+
     click.echo(click.style('%s - Deleting secret' % get_datetime(), fg='green'))
     check_and_print(
         DKCloudCommandRunner.secret_delete(backend.dki,path))
 
 @dk.command(name='secret-exists')
 @click.argument('path', required=True)
+@click.option('--no-cache', is_flag=True, default=False, help='Ask the vault even if the list was cached recently')
 @click.pass_obj
-def secret_delete(backend,path):
+def secret_exists(backend,path,no_cache):
     """
     Checks if a secret exists
     """
     click.echo(click.style('%s Checking secret' % get_datetime(), fg='green'))
     check_and_print(
-        DKCloudCommandRunner.secret_exists(backend.dki,path))
+        DKCloudCommandRunner.secret_exists(backend.dki,path,not no_cache))
+
+
+# --------------------------------------------------------------------------------------------------------------------
+#  daemon commands
+# --------------------------------------------------------------------------------------------------------------------
+# options of the dk group that take a value, to find the command in a command line
+DK_OPTIONS_WITH_VALUE = ['-c', '--config', '--profile-trace']
+# commands that stay in the terminal, never run by the daemon
+DAEMON_IN_PROCESS_COMMANDS = ['recipe-watch', 'active-serving-watcher', 'daemon-start', 'daemon-stop',
+                              'daemon-status']
+
+
+class DaemonSession(object):
+    """
+    What a dk daemon keeps from one command to the next: the logged in Backend, built again when its config file
+    changes.
+    """
+    LOGIN_CHECK_INTERVAL = 300  # seconds between two checks that the token is still valid
+    WORKERS_TIMEOUT = 30  # seconds to wait for the threads of the last command
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._config_mtime = self._get_config_mtime()
+        self._login_time = time.time()
+        self._environment = DKDaemon.get_environment()
+        self._daemon_threads = set(threading.enumerate())
+
+    def _get_config_mtime(self):
+        try:
+            return os.stat(self._backend.config_location).st_mtime_ns
+        except OSError:
+            return None
+
+    def get_backend(self):
+        config_mtime = self._get_config_mtime()
+        if config_mtime != self._config_mtime:
+            self._backend = Backend(self._backend.config_location)
+            self._config_mtime = config_mtime
+            self._login_time = time.time()
+        elif time.time() - self._login_time > DaemonSession.LOGIN_CHECK_INTERVAL:
+            self._backend.login()
+            self._login_time = time.time()
+        return self._backend
+
+    def handle(self, request):
+        """
+        Runs one forwarded dk command line in the folder it was typed in.
+        :rtype: dict -- {'exit_code', 'out', 'err'}, or {'fallback': True} for the client to run it
+        """
+        if request.get('config') != self._backend.config_location:
+            return {'fallback': True}
+        if request.get('env') != self._environment:
+            # the command would not run as in the terminal
+            return {'fallback': True}
+        args = request.get('args', [])
+        options, command_name = DKDaemon.find_command(args, DK_OPTIONS_WITH_VALUE)
+        if command_name is None:
+            return {'fallback': True}
+        try:
+            command = dk.get_command(click.Context(dk), command_name)
+        except click.UsageError:
+            command = None
+        if command is None or command.name in DAEMON_IN_PROCESS_COMMANDS:
+            return {'fallback': True}
+
+        # the current folder belongs to the whole process: no thread of the last command may still be using it
+        if len(self._get_workers()) > 0:
+            return {'fallback': True}
+        out = io.StringIO()
+        err = io.StringIO()
+        daemon_dir = os.getcwd()
+        try:
+            os.chdir(request['cwd'])
+            with redirect_stdout(out), redirect_stderr(err):
+                exit_code = self._run(args, request.get('color'))
+            self._join_workers()
+        finally:
+            os.chdir(daemon_dir)
+        return {'exit_code': exit_code, 'out': out.getvalue(), 'err': err.getvalue()}
+
+    def _get_workers(self):
+        """
+        :rtype: list -- the running threads started by commands, e.g. the pools of an AsyncDKCloudAPI not closed
+        """
+        return [thread for thread in threading.enumerate()
+                if thread not in self._daemon_threads and thread is not threading.current_thread()]
+
+    def _join_workers(self):
+        deadline = time.time() + DaemonSession.WORKERS_TIMEOUT
+        for thread in self._get_workers():
+            thread.join(max(0, deadline - time.time()))
+
+    def _run(self, args, color):
+        try:
+            backend = self.get_backend()
+            rv = dk.main(args=list(args), prog_name='dk', standalone_mode=False, obj=backend, color=color)
+        except click.ClickException as e:
+            e.show(file=sys.stderr)
+            return e.exit_code
+        except click.Abort:
+            click.echo('Aborted!', err=True)
+            return 1
+        except SystemExit as e:
+            if e.code is None:
+                return 0
+            return e.code if isinstance(e.code, int) else 1
+        return rv if isinstance(rv, int) else 0
+
+
+def forward_to_daemon(args):
+    """
+    Runs the command in the dk daemon, when one is running with the same config.
+    :rtype: int -- the exit code, or None to run the command in this process
+    """
+    if os.environ.get(DKDaemon.DISABLE_ENV) is not None:
+        return None
+    socket_path = DKDaemon.get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    options, command_name = DKDaemon.find_command(args, DK_OPTIONS_WITH_VALUE)
+    # '-' reads a file from stdin, which stays with this process
+    if command_name is None or '-' in args:
+        return None
+    config = options.get('--config', options.get('-c'))
+    request = {'op': DKDaemon.OP_RUN, 'args': list(args), 'cwd': os.getcwd(),
+               'config': Backend.get_config_location(config), 'color': sys.stdout.isatty(),
+               'env': DKDaemon.get_environment()}
+    response = DKDaemon.send(request, socket_path)
+    if response is None or response.get('fallback'):
+        return None
+    sys.stdout.write(response.get('out', ''))
+    sys.stdout.flush()
+    sys.stderr.write(response.get('err', ''))
+    sys.stderr.flush()
+    return response.get('exit_code', 1)
+
+
+@dk.command(name='daemon-start')
+@click.option('--foreground', is_flag=True, default=False, help='serve from this process, until daemon-stop')
+@click.pass_obj
+def daemon_start(backend, foreground):
+    """
+    Start a dk daemon that keeps the login and connections for the next dk commands
+    """
+    socket_path = DKDaemon.get_socket_path()
+    if not foreground:
+        if DKDaemon.get_status(socket_path) is not None:
+            raise click.ClickException('A dk daemon is already running on %s' % socket_path)
+        click.secho('%s - Starting a dk daemon on %s' % (get_datetime(), socket_path), fg='green')
+        check_and_print(DKDaemon.spawn(['-c', backend.config_location, 'daemon-start', '--foreground'], socket_path))
+        return
+
+    backend.login()
+    daemon = DKDaemon(socket_path, DaemonSession(backend).handle, backend.config_location)
+    rc = daemon.bind()
+    if not rc.ok():
+        raise click.ClickException(rc.get_message())
+    click.secho('%s - %s (pid %d)' % (get_datetime(), rc.get_message(), os.getpid()), fg='green')
+    sys.stdout.flush()
+    check_and_print(daemon.serve())
+
+
+@dk.command(name='daemon-stop')
+@click.pass_obj
+def daemon_stop(backend):
+    """
+    Stop the dk daemon
+    """
+    check_and_print(DKDaemon.stop_daemon(DKDaemon.get_socket_path()))
+
+
+@dk.command(name='daemon-status')
+@click.pass_obj
+def daemon_status(backend):
+    """
+    Tell whether a dk daemon is running, and for which config
+    """
+    socket_path = DKDaemon.get_socket_path()
+    status = DKDaemon.get_status(socket_path)
+    if status is None:
+        click.echo('No dk daemon is running on %s' % socket_path)
+    elif status.get('busy'):
+        click.echo('The dk daemon on %s is running a command' % socket_path)
+    else:
+        click.echo('dk daemon running on %s\n\tpid: %s\n\tconfig: %s\n\tstarted: %s\n\tcommands run: %d' % (
+            socket_path, status['pid'], status['config'],
+            datetime.fromtimestamp(status['started']).strftime('%Y-%m-%d %H:%M:%S'), status['served']))
+
 
 # http://stackoverflow.com/questions/18114560/python-catch-ctrl-c-command-prompt-really-want-to-quit-y-n-resume-executi
 def exit_gracefully(signum, frame):
@@ -938,6 +1288,10 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
 
+    exit_code = forward_to_daemon(args)
+    if exit_code is not None:
+        exit(exit_code)
+
     # store the original SIGINT handler
     original_sigint = getsignal(SIGINT)
     signal(SIGINT, exit_gracefully)
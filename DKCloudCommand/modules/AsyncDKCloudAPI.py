@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from .DKCloudAPI import DKCloudAPI
+from .DKCloudCommandConfig import DKCloudCommandConfig
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+AsyncDKCloudAPI exposes every public DKCloudAPI method as a coroutine, so fan-out operations
+(kitchen-get, recipe-update, bulk secrets, ...) can be gathered instead of called one after the other.
+
+Both classes share one transport: the calls run on a small worker pool over the DKCloudAPI's
+requests.Session, so N concurrent calls reuse at most dk-cloud-max-connections keep-alive connections.
+
+    async_api = AsyncDKCloudAPI(dk_api)
+    rcs = async_api.run_all([('recipe_tree', (kitchen, r)) for r in recipes])
+
+    # or from a coroutine
+    rc = await async_api.recipe_tree(kitchen, recipe)
+"""
+
+
+def _make_async_method(name):
+    async def async_method(self, *args, **kwargs):
+        return await self.run_in_pool(getattr(self._api, name), *args, **kwargs)
+
+    async_method.__name__ = name
+    async_method.__doc__ = getattr(DKCloudAPI, name).__doc__
+    return async_method
+
+
+class AsyncDKCloudAPI(object):
+
+    def __init__(self, dk_api, max_workers=None):
+        """
+        :param dk_api: DKCloudAPI (or a subclass, e.g. DKCloudAPIMock) or a DKCloudCommandConfig
+        :param max_workers: int -- defaults to the connection pool size of the config
+        """
+        if isinstance(dk_api, DKCloudCommandConfig):
+            dk_api = DKCloudAPI(dk_api)
+        self._api = dk_api
+        if max_workers is None:
+            config = getattr(dk_api, '_config', None)
+            if config is not None:
+                max_workers = config.get_max_connections()
+            else:
+                max_workers = DKCloudCommandConfig.DEFAULT_MAX_CONNECTIONS
+        self._max_workers = max_workers
+        self._executor = None
+        self._loop = None
+
+    def get_sync_api(self):
+        return self._api
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        return self._executor
+
+    def _get_loop(self):
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+
+    async def run_in_pool(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    async def gather(self, calls):
+        """
+        :param calls: list of (method_name, args) or (method_name, args, kwargs) tuples
+        :rtype: list of DKReturnCode, in the same order as calls
+        """
+        coroutines = list()
+        for call in calls:
+            name = call[0]
+            args = call[1] if len(call) > 1 else ()
+            kwargs = call[2] if len(call) > 2 else {}
+            coroutines.append(getattr(self, name)(*args, **kwargs))
+        return await asyncio.gather(*coroutines)
+
+    async def gather_in_pool(self, func, args_list):
+        return await asyncio.gather(*[self.run_in_pool(func, *args) for args in args_list])
+
+    def run(self, coroutine):
+        # All synchronous callers share the one event loop owned by this object.
+        return self._get_loop().run_until_complete(coroutine)
+
+    def run_all(self, calls):
+        return self.run(self.gather(calls))
+
+    def map_in_pool(self, func, args_list):
+        """
+        Runs func(*args) for every args in args_list on the shared worker pool.
+        :rtype: list of results, in the same order as args_list
+        """
+        return self.run(self.gather_in_pool(func, args_list))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.close()
+        self._loop = None
+
+
+for _name, _member in inspect.getmembers(DKCloudAPI, predicate=inspect.isfunction):
+    if not _name.startswith('_') and _name not in ('get_config', 'get_session', 'get_url_for_direct_rest_call') \
+            and not isinstance(inspect.getattr_static(DKCloudAPI, _name), staticmethod):
+        setattr(AsyncDKCloudAPI, _name, _make_async_method(_name))
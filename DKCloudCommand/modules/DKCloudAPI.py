@@ -1,10 +1,22 @@
 import requests
 import urllib.request, urllib.parse, urllib.error
+from urllib.parse import urlparse
 from distutils.util import strtobool
 
 import time
+import random
+from hashlib import sha1
 from requests import RequestException
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
 from .DKCloudCommandConfig import DKCloudCommandConfig
+from .DKRateLimiter import get_rate_limiter
+from .DKProfiler import DKProfiler
+from .DKDiskCache import DKDiskCache
+from .DKMemoryCache import DKMemoryCache
+from .githash import githash_path
+from .DKDelta import make_delta
 from .DKRecipeDisk import *
 from .DKReturnCode import *
 
@@ -58,6 +70,21 @@ e.g.
 class DKCloudAPI(object):
     _use_https = False
     _auth_token = None
+    _config = None
+    _secret_cache = None
+    _compiled_cache = None
+    _http_cache = None
+    _blob_cache = None
+    _held_blobs = None
+    _held_bytes = 0
+    RETRY_STATUS_CODES = (502, 503, 504)
+    TOO_MANY_REQUESTS = 429
+    PRECONDITION_FAILED = 412
+    NOT_MODIFIED = 304
+    UPLOAD_NOT_SUPPORTED = (404, 405, 501)  # answers to upload/start of a server without uploads in parts
+    BLOB_KEY_PREFIX = 'blob|'
+    ETAG_PREFIX = 'etag:'
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
     DKAPP_KITCHEN_FILE = 'kitchen.json'
     DKAPP_KITCHENS_DIR = 'kitchens'
     MESSAGE = 'message'
@@ -75,10 +102,264 @@ class DKCloudAPI(object):
         if isinstance(dk_cli_config, DKCloudCommandConfig) is True:
             self._config = dk_cli_config
             self._auth_token = None
+            self._session = DKCloudAPI._make_session(dk_cli_config.get_max_connections())
+        else:
+            self._session = DKCloudAPI._make_session(DKCloudCommandConfig.DEFAULT_MAX_CONNECTIONS)
 
     def get_config(self):
         return self._config
 
+    def get_session(self):
+        return self._session
+
+    @staticmethod
+    def _make_session(max_connections):
+        # One session per api object, so every call (and every thread of an AsyncDKCloudAPI)
+        # reuses the same keep-alive connections instead of opening a new one per request.
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _request(self, method, url, idempotent=None, **kwargs):
+        profiler = DKProfiler()
+        if not profiler.is_enabled():
+            return self._request_with_retries(method, url, idempotent, **kwargs)
+        start = time.time()
+        response = None
+        try:
+            response = self._request_with_retries(method, url, idempotent, **kwargs)
+            return response
+        finally:
+            profiler.record(DKCloudAPI._get_profile_name(method, url), 'api', start, time.time() - start,
+                            DKCloudAPI._get_body_size(kwargs.get('data')),
+                            len(response.content) if response is not None else 0)
+
+    @staticmethod
+    def _get_body_size(data):
+        # bytes on the wire for str and bytes bodies; a dict (the login form) is encoded by requests, not counted
+        if isinstance(data, bytes):
+            return len(data)
+        if isinstance(data, str):
+            return len(data.encode('utf-8'))
+        return 0
+
+    @staticmethod
+    def _get_profile_name(method, url):
+        # 'GET', '.../v2/recipe/tree/kitchen/recipe' -> 'GET recipe/tree', so calls group by route, not by kitchen
+        endpoint = DKCloudAPI._get_endpoint(url)
+        if endpoint is None:
+            return method
+        return '%s %s' % (method, '/'.join(endpoint.split('/')[:2]))
+
+    def _request_with_retries(self, method, url, idempotent=None, **kwargs):
+        """
+        Sends one request over the shared session with the configured (connect, read) timeout
+        for its endpoint, retrying transient failures with full jitter exponential backoff.
+
+        Idempotent calls (GET by default, or idempotent=True for read style POSTs) are retried on
+        connection errors, read timeouts and 502/503/504. Other calls are only retried when the
+        request never reached the server (connect timeout / refused connection / 429), so an order or
+        a file update is never sent twice.
+
+        Every attempt goes through the rate limiter of the host, see DKRateLimiter.
+        """
+        if idempotent is None:
+            idempotent = method in DKCloudAPI.IDEMPOTENT_METHODS
+        config = self._config
+        if config is None:
+            config = DKCloudCommandConfig()
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = config.get_timeout(DKCloudAPI._get_endpoint(url))
+        host = urlparse(url).netloc
+        limiter = get_rate_limiter(host, config.get_rate_limits(host))
+        retries = config.get_retries()
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except ConnectTimeout:
+                if attempt >= retries:
+                    raise
+                retry_after = None
+            except ReadTimeout:
+                if not idempotent or attempt >= retries:
+                    raise
+                retry_after = None
+            except ConnectionError as e:
+                if attempt >= retries or (not idempotent and not DKCloudAPI._never_sent(e)):
+                    raise
+                retry_after = None
+            else:
+                if response.status_code == DKCloudAPI.TOO_MANY_REQUESTS:
+                    # the server rejected the request without acting on it, slow every caller down
+                    retry_after = DKCloudAPI._get_retry_after(response)
+                    limiter.on_throttled(retry_after)
+                    if attempt >= retries:
+                        return response
+                else:
+                    limiter.on_success()
+                    if not idempotent or response.status_code not in DKCloudAPI.RETRY_STATUS_CODES \
+                            or attempt >= retries:
+                        return response
+                    retry_after = DKCloudAPI._get_retry_after(response)
+            finally:
+                limiter.release()
+            time.sleep(DKCloudAPI._get_backoff(config, attempt, retry_after))
+            attempt += 1
+
+    @staticmethod
+    def _get_endpoint(url):
+        # 'http://host:port/v2/recipe/tree/kitchen/recipe' -> 'recipe/tree/kitchen/recipe'
+        parts = url.split('/v2/', 1)
+        if len(parts) == 2:
+            return parts[1]
+        else:
+            return None
+
+    @staticmethod
+    def _never_sent(connection_error):
+        # urllib3 reports a refused / unresolvable connection as NewConnectionError,
+        # nothing was written to the socket, so any request is safe to send again
+        reason = connection_error.args[0] if len(connection_error.args) > 0 else None
+        reason = getattr(reason, 'reason', reason)
+        return 'NewConnectionError' in type(reason).__name__ or 'NameResolutionError' in type(reason).__name__
+
+    @staticmethod
+    def _get_retry_after(response):
+        retry_after = response.headers.get('Retry-After') if response.headers is not None else None
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _get_backoff(config, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, config.get_retry_backoff_max())
+        # full jitter, so concurrent callers that failed together do not retry together
+        return random.uniform(0, min(config.get_retry_backoff_max(), config.get_retry_backoff() * (2 ** attempt)))
+
+    def _get_http_cache(self):
+        if self._config is None or self._config.get_cache_dir() is None:
+            return None
+        if getattr(self, '_http_cache', None) is None:
+            self._http_cache = DKDiskCache(os.path.join(self._config.get_cache_dir(), 'http'), max_entries=None,
+                                           max_bytes=self._config.get_http_cache_max_bytes())
+        return self._http_cache
+
+    def _get_http_cache_key(self, url):
+        return 'http|%s|%s' % (self._config.get_username(), url)
+
+    def _get_blob_cache(self):
+        # the text of files as the server has them, by sha, the bases of delta updates
+        if self._config is None or self._config.get_cache_dir() is None or not self._config.get_delta_updates():
+            return None
+        if getattr(self, '_blob_cache', None) is None:
+            self._blob_cache = DKDiskCache(os.path.join(self._config.get_cache_dir(), 'blobs'), max_entries=None,
+                                           max_bytes=self._config.get_blob_cache_max_bytes())
+        return self._blob_cache
+
+    def _remember_blob(self, contents, sha=None):
+        """
+        Keeps the text of a file just sent to the server, when it is large enough for a delta update to pay off.
+        :param sha: str -- the sha of contents on the server, checked when the caller has it
+        """
+        cache = self._get_blob_cache()
+        if cache is None or not isinstance(contents, str):
+            return
+        if not self._config.get_delta_min_size() <= len(contents) <= self._config.get_delta_max_size():
+            return
+        contents_sha = githash_data(contents)
+        if sha is not None and sha != contents_sha:
+            # e.g. json the server sent back reformatted
+            return
+        held = self._held_blobs
+        if held is None:
+            cache.put(DKCloudAPI.BLOB_KEY_PREFIX + contents_sha, contents)
+            return
+        held[DKCloudAPI.BLOB_KEY_PREFIX + contents_sha] = contents
+        self._held_bytes += len(contents)
+        if self._held_bytes > self._config.get_delta_max_size():
+            # not more than one large file in memory
+            self.flush_blobs()
+            self.hold_blobs()
+
+    def hold_blobs(self):
+        """
+        Keeps the blobs of the next files sent in memory, for flush_blobs to write them to the blob cache at once.
+        """
+        self._held_blobs = dict()
+        self._held_bytes = 0
+
+    def flush_blobs(self):
+        held = self._held_blobs
+        self._held_blobs = None
+        cache = self._get_blob_cache()
+        if cache is not None and held is not None and len(held) > 0:
+            cache.put_many(held)
+
+    def _cached_get(self, url):
+        """
+        A GET through the on-disk http cache, for the reads that are repeated from one command to the next.
+
+        A response that came with an ETag or a Last-Modified is kept, and the next GET of the url sends it back
+        as If-None-Match / If-Modified-Since: when the server answers 304 Not Modified, nothing but the headers
+        was transferred and the cached body is used. A response without a validator is only kept for the
+        dk-cloud-http-cache-ttls of its endpoint, during which it is used without asking the server.
+        :rtype: requests.Response -- a 304 is turned into the cached 200
+        """
+        cache = self._get_http_cache()
+        if cache is None:
+            return self._request('GET', url, headers=self._get_common_headers())
+        key = self._get_http_cache_key(url)
+        entry = cache.get_entry(key)
+        headers = self._get_common_headers()
+        if entry is not None:
+            meta = entry['meta']
+            if meta.get('etag') is None and meta.get('last_modified') is None:
+                # still within its ttl, expired entries are not returned
+                return DKCloudAPI._make_cached_response(url, entry)
+            if meta.get('etag') is not None:
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified') is not None:
+                headers['If-Modified-Since'] = meta['last_modified']
+        response = self._request('GET', url, headers=headers)
+        if response.status_code == DKCloudAPI.NOT_MODIFIED and entry is not None:
+            return DKCloudAPI._make_cached_response(url, entry)
+        if response.status_code == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag is not None or last_modified is not None:
+                cache.put(key, response.text, meta={'etag': etag, 'last_modified': last_modified})
+            else:
+                ttl = self._config.get_http_cache_ttl(DKCloudAPI._get_endpoint(url))
+                if ttl > 0:
+                    cache.put(key, response.text, ttl=ttl)
+                elif entry is not None:
+                    cache.delete(key)
+        return response
+
+    @staticmethod
+    def _make_cached_response(url, entry):
+        response = requests.models.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = entry['value'].encode('utf-8')
+        response.headers = CaseInsensitiveDict()
+        if entry['meta'].get('etag') is not None:
+            response.headers['ETag'] = entry['meta']['etag']
+        if entry['meta'].get('last_modified') is not None:
+            response.headers['Last-Modified'] = entry['meta']['last_modified']
+        response.from_cache = True
+        return response
+
     @staticmethod
     def _get_json(response):
         if response is None or response.text is None:
@@ -143,7 +424,7 @@ class DKCloudAPI(object):
     def _is_token_valid(self, token):
         url = '%s/v2/validatetoken' % (self.get_url_for_direct_rest_call())
         try:
-            response = requests.get(url, headers=self._get_common_headers(token))
+            response = self._request('GET', url, headers=self._get_common_headers(token))
         except (RequestException, ValueError, TypeError) as c:
             print("validatetoken: exception: %s" % str(c))
             return False
@@ -169,7 +450,7 @@ class DKCloudAPI(object):
         credentials['password'] = self._config.get_password()
         url = '%s/v2/login' % (self.get_url_for_direct_rest_call())
         try:
-            response = requests.post(url, data=credentials)
+            response = self._request('POST', url, idempotent=True, data=credentials)
         except (RequestException, ValueError, TypeError) as c:
             print("login: exception: %s" % str(c))
             return None
@@ -239,7 +520,7 @@ class DKCloudAPI(object):
         rc = DKReturnCode()
         url = '%s/v2/kitchen/list' % (self.get_url_for_direct_rest_call())
         try:
-            response = requests.get(url, headers=self._get_common_headers())
+            response = self._cached_get(url)
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             rc.set(rc.DK_FAIL, 'list_kitchen: exception: %s' % str(c))
@@ -252,18 +533,60 @@ class DKCloudAPI(object):
             rc.set(rc.DK_FAIL, arc.get_message())
             return rc
 
-    def secret_list(self,path):
+    def _get_secret_cache(self):
+        # names only, never secret values; None when there is no config (mocks) or caching is off
+        if self._config is None or self._config.get_cache_dir() is None:
+            return None
+        if getattr(self, '_secret_cache', None) is None:
+            self._secret_cache = DKDiskCache(os.path.join(self._config.get_cache_dir(), 'secrets'),
+                                             max_entries=200, default_ttl=self._config.get_secret_list_ttl())
+        return self._secret_cache
+
+    def _get_secret_cache_key(self, path):
+        return 'secret_list|%s|%s|%s' % (self.get_url_for_direct_rest_call(), self._config.get_username(), path)
+
+    def _get_cached_parent_secret_list(self, path):
+        """
+        The cached listing of the folder holding path, e.g. 'a/b' for 'a/b/c'. Only that folder: a vault list is
+        one level deep, so the listing of 'a' says nothing about 'a/b/c'.
+        :rtype: list -- the names, or None
+        """
+        cache = self._get_secret_cache()
+        if cache is None:
+            return None
+        parent = '/'.join(path.strip('/').split('/')[:-1])
+        for candidate in [parent, parent + '/'] if len(parent) > 0 else ['', '/']:
+            names = cache.get(self._get_secret_cache_key(candidate))
+            if names is not None:
+                return names
+        return None
+
+    def _invalidate_secret_cache(self, path):
+        # a write or delete of a/b/c changes the listings of '', a, a/b and a/b/c
+        cache = self._get_secret_cache()
+        if cache is None:
+            return
+        prefix = self._get_secret_cache_key('')
+        cache.delete_matching(lambda key: key.startswith(prefix) and path.startswith(key[len(prefix):].rstrip('/')))
+
+    def secret_list(self, path, use_cache=True):
         rc = DKReturnCode()
         path = path or ''
+        cache = self._get_secret_cache() if use_cache else None
+        if cache is not None:
+            names = cache.get(self._get_secret_cache_key(path))
+            if names is not None:
+                rc.set(rc.DK_SUCCESS, None, names)
+                return rc
         url = '%s/v2/secret/%s' % (self.get_url_for_direct_rest_call(), path)
         try:
-            start_time = time.time()
-            response = requests.get(url, headers=self._get_common_headers())
-            elapsed_recipe_status = time.time() - start_time
-            print('secret_list - elapsed: %d' % elapsed_recipe_status)
+            response = self._request('GET', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
             if DKCloudAPI._valid_response(response):
                 rc.set(rc.DK_SUCCESS, None, rdict['value'])
+                cache = self._get_secret_cache()
+                if cache is not None and isinstance(rdict['value'], list):
+                    cache.put(self._get_secret_cache_key(path), rdict['value'])
             else:
                 arc = DKAPIReturnCode(rdict, response)
                 rc.set(rc.DK_FAIL, arc.get_message())
@@ -273,15 +596,19 @@ class DKCloudAPI(object):
             rc.set(rc.DK_FAIL, s)
             return rc
 
-    def secret_exists(self,path):
+    def secret_exists(self, path, use_cache=True):
         rc = DKReturnCode()
         path = path or ''
+        if use_cache:
+            # a fresh listing of its folder answers without asking the vault
+            names = self._get_cached_parent_secret_list(path)
+            if names is not None:
+                # the listing has the names in the folder, or full paths
+                rc.set(rc.DK_SUCCESS, None, path in names or path.strip('/').split('/')[-1] in names)
+                return rc
         url = '%s/v2/secret/check/%s' % (self.get_url_for_direct_rest_call(), path)
         try:
-            start_time = time.time()
-            response = requests.get(url, headers=self._get_common_headers())
-            elapsed_recipe_status = time.time() - start_time
-            print('secret_exists - elapsed: %d' % elapsed_recipe_status)
+            response = self._request('GET', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
             if DKCloudAPI._valid_response(response):
                 rc.set(rc.DK_SUCCESS, None, rdict['value'])
@@ -299,11 +626,9 @@ class DKCloudAPI(object):
         path = path or ''
         url = '%s/v2/secret/%s' % (self.get_url_for_direct_rest_call(), path)
         try:
-            start_time = time.time()
             pdict = {'value':value}
-            response = requests.post(url, data=json.dumps(pdict), headers=self._get_common_headers())
-            elapsed_recipe_status = time.time() - start_time
-            print('secret_write - elapsed: %d' % elapsed_recipe_status)
+            response = self._request('POST', url, idempotent=True, data=json.dumps(pdict), headers=self._get_common_headers())
+            self._invalidate_secret_cache(path)
             rdict = self._get_json(response)
             if DKCloudAPI._valid_response(response):
                 rc.set(rc.DK_SUCCESS, None, None)
@@ -321,10 +646,8 @@ class DKCloudAPI(object):
         path = path or ''
         url = '%s/v2/secret/%s' % (self.get_url_for_direct_rest_call(), path)
         try:
-            start_time = time.time()
-            response = requests.delete(url, headers=self._get_common_headers())
-            elapsed_recipe_status = time.time() - start_time
-            print('secret_write - elapsed: %d' % elapsed_recipe_status)
+            response = self._request('DELETE', url, headers=self._get_common_headers())
+            self._invalidate_secret_cache(path)
             rdict = self._get_json(response)
             if DKCloudAPI._valid_response(response):
                 rc.set(rc.DK_SUCCESS, None, None)
@@ -351,7 +674,7 @@ class DKCloudAPI(object):
         pdict[DKCloudAPI.MESSAGE] = message
         url = '%s/v2/kitchen/update/%s' % (self.get_url_for_direct_rest_call(), update_kitchen['name'])
         try:
-            response = requests.post(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('POST', url, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             print("update_kitchens: exception: %s" % str(c))
@@ -377,7 +700,7 @@ class DKCloudAPI(object):
         url = '%s/v2/kitchen/create/%s/%s' % (self.get_url_for_direct_rest_call(),
                                               existing_kitchen_name, new_kitchen_name)
         try:
-            response = requests.get(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('GET', url, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             rc.set(rc.DK_FAIL, 'create_kitchens: exception: %s' % str(c))
@@ -404,7 +727,7 @@ class DKCloudAPI(object):
         pdict[DKCloudAPI.MESSAGE] = message
         url = '%s/v2/kitchen/delete/%s' % (self.get_url_for_direct_rest_call(), existing_kitchen_name)
         try:
-            response = requests.delete(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('DELETE', url, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             rc.set(rc.DK_FAIL, 'delete_kitchens: exception: %s' % str(c))
@@ -416,104 +739,174 @@ class DKCloudAPI(object):
             rc.set(rc.DK_FAIL, arc.get_message())
         return rc
 
-    def modify_kitchen_settings(self, kitchen_name, add=(), unset=()):
-        rc = self.get_kitchen_settings(kitchen_name)
-        if not rc.ok():
-            return rc
+    def modify_kitchen_settings(self, kitchen_name, add=(), unset=(), max_attempts=10):
+        """
+        Applies all the adds and unsets to the kitchen recipeoverrides with one read and one write of kitchen.json.
+
+        The write is optimistic: it is sent with If-Match when the server gives an ETag, otherwise the sha of
+        kitchen.json is checked again just before the write. When someone else changed the settings in between,
+        the edits are applied again to their version (after a jittered backoff, like the retries of _request),
+        so concurrent jobs never lose each other's overrides.
+        :param add: list of (variable, value)
+        :param unset: list of variables, or one variable
+        :rtype: DKReturnCode -- the payload is the new list of overrides
+        """
+        if isinstance(unset, str):
+            unset = [unset]
+        for attempt in range(max_attempts):
+            if attempt > 0:
+                time.sleep(DKCloudAPI._get_backoff(self._config, attempt - 1))
+            rc, version = self._get_kitchen_settings_and_version(kitchen_name)
+            if not rc.ok():
+                return rc
 
-        kitchen_json = rc.get_payload()
-        overrides = kitchen_json['recipeoverrides']
+            kitchen_json = rc.get_payload()
+            overrides, msg, commit_message = DKCloudAPI._apply_override_changes(kitchen_json['recipeoverrides'],
+                                                                                add, unset)
+            kitchen_json['recipeoverrides'] = overrides
+            if len(commit_message) == 0:
+                # nothing to unset, nothing new to write
+                rc = DKReturnCode()
+                rc.set(rc.DK_SUCCESS, msg, overrides)
+                return rc
 
-        msg = ''
-        commit_message = ''
+            if not version.startswith(DKCloudAPI.ETAG_PREFIX):
+                # no ETag support, narrow the window instead: only write if nobody wrote since we read
+                check_rc, current_version = self._get_kitchen_settings_and_version(kitchen_name)
+                if not check_rc.ok():
+                    return check_rc
+                if current_version != version:
+                    continue
+                if_match = None
+            else:
+                if_match = version[len(DKCloudAPI.ETAG_PREFIX):]
 
-        if len(add) > 0:
-            for add_this in add:
-                matches = [existing_override for existing_override in overrides if existing_override['variable'] == add_this[0]]
-                if len(matches) == 0:
-                    overrides.append({'variable': add_this[0], 'value': add_this[1], 'category':'from_command_line'})
-                else:
-                    matches[0]['value'] = add_this[1]
+            rc, status_code = self._put_kitchen_settings(kitchen_name, kitchen_json, commit_message, if_match)
+            if status_code == DKCloudAPI.PRECONDITION_FAILED:
+                continue
+            if not rc.ok():
+                return rc
 
-                msg += "{} added with value '{}'\n".format(add_this[0], add_this[1])
-                if len(commit_message) != 0:
-                    commit_message += " ; {} added".format(add_this[0])
-                else:
-                    commit_message += "{} added".format(add_this[0])
-
-        # tom_index = next(index for (index, d) in enumerate(lst) if d["name"] == "Tom")
-        # might be a string?
-        if len(unset) > 0:
-            if isinstance(unset, list) or isinstance(unset, tuple):
-                for unset_this in unset:
-                    match_index = next((index for (index, d) in enumerate(overrides) if d["variable"] == unset_this), None)
-                    if match_index is not None:
-                        del overrides[match_index]
-                        msg += "{} unset".format(unset_this)
-                        if len(commit_message) != 0:
-                            commit_message += " ; {} unset".format(unset_this)
-                        else:
-                            commit_message += "{} unset".format(unset_this)
-            else:
-                match_index = next((index for (index, d) in enumerate(overrides) if d["variable"] == unset), None)
-                if match_index is not None:
-                    del overrides[match_index]
-                    msg += "{} unset".format(unset)
-                    if len(commit_message) != 0:
-                        commit_message += " ; {} unset".format(unset)
-                    else:
-                        commit_message += "{} unset".format(unset)
-
-        rc = self.put_kitchen_settings(kitchen_name, kitchen_json, commit_message)
-        if not rc.ok():
+            rc = DKReturnCode()
+            rc.set(rc.DK_SUCCESS, msg, overrides)
             return rc
 
         rc = DKReturnCode()
-        rc.set(rc.DK_SUCCESS, msg, overrides)
+        rc.set(rc.DK_FAIL, 'kitchen settings of %s kept changing, gave up after %d attempts' % (kitchen_name,
+                                                                                             max_attempts))
         return rc
 
+    @staticmethod
+    def get_overrides_by_variable(overrides):
+        """
+        :rtype: dict -- {variable: override}, the first override of a variable that is there more than once
+        """
+        by_variable = dict()
+        for override in overrides:
+            by_variable.setdefault(override['variable'], override)
+        return by_variable
+
+    @staticmethod
+    def _apply_override_changes(overrides, add=(), unset=()):
+        """
+        One pass over the overrides, whatever the number of variables added or unset. A variable that is there
+        more than once is set and unset in its first override, the one get_overrides_by_variable returns.
+        :rtype: (list, str, str) -- the new overrides, the message for the user, the commit message
+        """
+        by_variable = DKCloudAPI.get_overrides_by_variable(overrides)
+
+        msg = ''
+        commit_messages = list()
+        for add_this in add:
+            existing_override = by_variable.get(add_this[0])
+            if existing_override is None:
+                new_override = {'variable': add_this[0], 'value': add_this[1], 'category': 'from_command_line'}
+                overrides.append(new_override)
+                by_variable[add_this[0]] = new_override
+                commit_messages.append("{} added".format(add_this[0]))
+            elif existing_override['value'] != add_this[1]:
+                existing_override['value'] = add_this[1]
+                commit_messages.append("{} added".format(add_this[0]))
+            msg += "{} added with value '{}'\n".format(add_this[0], add_this[1])
+
+        removed = set()
+        for unset_this in unset:
+            if unset_this in by_variable and id(by_variable[unset_this]) not in removed:
+                removed.add(id(by_variable[unset_this]))
+                msg += "{} unset".format(unset_this)
+                commit_messages.append("{} unset".format(unset_this))
+        if len(removed) > 0:
+            overrides = [override for override in overrides if id(override) not in removed]
+        return overrides, msg, " ; ".join(commit_messages)
+
     def get_kitchen_settings(self, kitchen_name):
+        rc, version = self._get_kitchen_settings_and_version(kitchen_name)
+        return rc
+
+    def _get_kitchen_settings_and_version(self, kitchen_name):
+        """
+        :rtype: (DKReturnCode, str) -- the version is 'etag:<ETag>' when the server sends one, otherwise
+            'sha:<sha of kitchen.json>'
+        """
         rc = DKReturnCode()
         url = '%s/v2/kitchen/settings/%s' % (self.get_url_for_direct_rest_call(), kitchen_name)
         try:
-            response = requests.get(url, headers=self._get_common_headers())
+            # not through the http cache: the settings and overrides may hold credentials, never written to disk
+            response = self._request('GET', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             rc.set(rc.DK_FAIL, 'settings_kitchen: exception: %s' % str(c))
-            return rc
+            return rc, None
         if DKCloudAPI._valid_response(response):
             rc.set(rc.DK_SUCCESS, None, rdict)
+            etag = response.headers.get('ETag') if response.headers is not None else None
+            if etag is not None:
+                version = DKCloudAPI.ETAG_PREFIX + etag
+            else:
+                version = 'sha:' + sha1(json.dumps(rdict, sort_keys=True).encode('utf-8')).hexdigest()
+            return rc, version
         else:
             arc = DKAPIReturnCode(rdict, response)
             rc.set(rc.DK_FAIL, arc.get_message())
-        return rc
+            return rc, None
 
     def put_kitchen_settings(self, kitchen_name, kitchen_dict, msg):
+        rc, status_code = self._put_kitchen_settings(kitchen_name, kitchen_dict, msg)
+        return rc
+
+    def _put_kitchen_settings(self, kitchen_name, kitchen_dict, msg, if_match=None):
+        """
+        :param if_match: str -- the ETag the write depends on, the server answers 412 if it is out of date
+        :rtype: (DKReturnCode, int) -- and the http status code, None if there was no response
+        """
         rc = DKReturnCode()
 
         try:
             kitchen_json = json.dumps(kitchen_dict)
         except ValueError as ve:
             # Make sure this is valid json
-            rc.set(rc.DK_FAIL, ve.message)
-            return rc
+            rc.set(rc.DK_FAIL, str(ve))
+            return rc, None
 
         d1 = dict()
         d1['kitchen.json'] = kitchen_dict
         d1['message'] = msg
         url = '%s/v2/kitchen/settings/%s' % (self.get_url_for_direct_rest_call(), kitchen_name)
+        headers = self._get_common_headers()
+        if if_match is not None:
+            headers['If-Match'] = if_match
         try:
-            response = requests.put(url, headers=self._get_common_headers(), data=json.dumps(d1))
+            response = self._request('PUT', url, idempotent=True, headers=headers, data=json.dumps(d1))
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             rc.set(rc.DK_FAIL, 'settings_kitchen: exception: %s' % str(c))
-            return rc
+            return rc, None
         if DKCloudAPI._valid_response(response):
             rc.set(rc.DK_SUCCESS, None, rdict)
         else:
             arc = DKAPIReturnCode(rdict, response)
             rc.set(rc.DK_FAIL, arc.get_message())
-        return rc
+        return rc, response.status_code
 
     # returns a list of recipes
     def list_recipe(self, kitchen):
@@ -523,11 +916,7 @@ class DKCloudAPI(object):
             return rc
         url = '%s/v2/kitchen/recipenames/%s' % (self.get_url_for_direct_rest_call(), kitchen)
         try:
-            start_time = time.time()
-            response = requests.get(url, headers=self._get_common_headers())
-            elapsed_recipe_status = time.time() - start_time
-            print('list_recipe - elapsed: %d' % elapsed_recipe_status)
-
+            response = self._cached_get(url)
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -550,7 +939,7 @@ class DKCloudAPI(object):
         url = '%s/v2/recipe/create/%s/%s' % (self.get_url_for_direct_rest_call(), kitchen,name)
         try:
             start_time = time.time()
-            response = requests.post(url, headers=self._get_common_headers())
+            response = self._request('POST', url, headers=self._get_common_headers())
             elapsed_recipe_status = time.time() - start_time
             print('list_recipe - elapsed: %d' % elapsed_recipe_status)
 
@@ -586,9 +975,9 @@ class DKCloudAPI(object):
             if list_of_files is not None:
                 params = dict()
                 params['recipe-files'] = list_of_files
-                response = requests.post(url, data=json.dumps(params), headers=self._get_common_headers())
+                response = self._request('POST', url, idempotent=True, data=json.dumps(params), headers=self._get_common_headers())
             else:
-                response = requests.post(url, headers=self._get_common_headers())
+                response = self._request('POST', url, idempotent=True, headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -639,7 +1028,7 @@ class DKCloudAPI(object):
         url = '%s/v2/recipe/update/%s/%s' % (self.get_url_for_direct_rest_call(),
                                              kitchen, recipe)
         try:
-            response = requests.post(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('POST', url, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -686,7 +1075,7 @@ class DKCloudAPI(object):
         pdict[self.FILE] = file_contents
         url = '%s/v2/recipe/create/%s/%s' % (self.get_url_for_direct_rest_call(), kitchen, recipe)
         try:
-            response = requests.put(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('PUT', url, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -700,6 +1089,204 @@ class DKCloudAPI(object):
             rc.set(rc.DK_FAIL, arc.get_message())
         return rc
 
+    def upload_file(self, kitchen, recipe, message, api_file_key, local_path, add=False, base_sha=None):
+        """
+        Sends a recipe file from disk, as an update or as a new file. A text file under dk-cloud-upload-threshold
+        goes in one json body like update_file and add_file do. A larger or binary file is streamed in parts of
+        dk-cloud-upload-part-size, see _upload_in_parts, or in one json body when the server does not take parts.
+        :param api_file_key: -- the path of the file relative to the recipe root
+        :param local_path: -- where the file is on disk
+        :param add: bool -- a new file rather than an update
+        :param base_sha: str -- the sha of the file on the server, when known an update is first tried as a delta
+            against it, see update_file_delta
+        :rtype: DKReturnCode
+        """
+        if base_sha is not None and not add:
+            rc = self.update_file_delta(kitchen, recipe, message, api_file_key, local_path, base_sha)
+            if rc is not None:
+                return rc
+        rc = DKReturnCode()
+        config = self._config if self._config is not None else DKCloudCommandConfig()
+        try:
+            size = os.path.getsize(local_path)
+        except OSError as e:
+            rc.set(rc.DK_FAIL, str(e))
+            return rc
+        if size < config.get_upload_threshold():
+            rc = self._send_text_file(kitchen, recipe, message, api_file_key, local_path, add)
+            if rc is not None:
+                return rc
+        rc = self._upload_in_parts(kitchen, recipe, message, api_file_key, local_path, add,
+                                   config.get_upload_part_size())
+        if rc is not None:
+            if rc.ok() and self._get_blob_cache() is not None and size <= config.get_delta_max_size():
+                self._remember_blob(DKCloudAPI._read_text(local_path))
+            return rc
+        rc = self._send_text_file(kitchen, recipe, message, api_file_key, local_path, add)
+        if rc is None:
+            rc = DKReturnCode()
+            rc.set(rc.DK_FAIL, 'upload_file: %s is not a text file and the server does not take uploads in parts' %
+                   api_file_key)
+        return rc
+
+    def _send_text_file(self, kitchen, recipe, message, api_file_key, local_path, add):
+        """
+        :rtype: DKReturnCode -- or None when the file is not text
+        """
+        try:
+            file_contents = DKCloudAPI._read_text(local_path)
+        except (IOError, OSError) as e:
+            rc = DKReturnCode()
+            rc.set(rc.DK_FAIL, str(e))
+            return rc
+        if file_contents is None:
+            return None
+        if add:
+            rc = self.add_file(kitchen, recipe, message, api_file_key, file_contents)
+        else:
+            rc = self.update_file(kitchen, recipe, message, api_file_key, file_contents)
+        if rc.ok():
+            self._remember_blob(file_contents)
+        return rc
+
+    @staticmethod
+    def _read_text(local_path):
+        """
+        :rtype: str -- the file as update_file sends it, or None when it is not utf-8 text
+        """
+        try:
+            with open(local_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except UnicodeDecodeError:
+            return None
+
+    def update_file_delta(self, kitchen, recipe, message, api_file_key, local_path, base_sha):
+        """
+        '/v2/recipe/update-delta/<string:kitchenname>/<string:recipename>', methods=['POST']
+            {message, filepath, base-sha, sha, delta}
+
+        Sends the changes of a text file against the version of it the server has (base_sha), when that version is
+        in the blob cache, see DKDelta. The server applies the delta only when its file still has base_sha, and
+        keeps the result only when it has sha.
+        :rtype: DKReturnCode -- or None when the file has to be sent whole: no known base, a delta that would not be
+            much smaller, a server without deltas or with another base
+        """
+        cache = self._get_blob_cache()
+        if cache is None:
+            return None
+        base = cache.get(DKCloudAPI.BLOB_KEY_PREFIX + base_sha)
+        if base is None:
+            return None
+        try:
+            if os.path.getsize(local_path) > self._config.get_delta_max_size():
+                return None
+            contents = DKCloudAPI._read_text(local_path)
+        except (IOError, OSError):
+            return None
+        if contents is None:
+            return None
+        delta = make_delta(base, contents)
+        sha = githash_data(contents)
+        pdict = dict()
+        pdict[self.MESSAGE] = message
+        pdict[self.FILEPATH] = api_file_key
+        pdict['base-sha'] = base_sha
+        pdict[self.SHA] = sha
+        pdict['delta'] = delta
+        data = json.dumps(pdict)
+        if len(data) > len(contents) // 2:
+            return None
+        url = '%s/v2/recipe/update-delta/%s/%s' % (self.get_url_for_direct_rest_call(), kitchen, recipe)
+        try:
+            response = self._request('POST', url, data=data, headers=self._get_common_headers())
+        except (RequestException, ValueError, TypeError):
+            return None
+        if not DKCloudAPI._valid_response(response):
+            # the full update tells what is wrong, if anything is
+            return None
+        self._remember_blob(contents, sha)
+        rc = DKReturnCode()
+        rc.set(rc.DK_SUCCESS, None)
+        return rc
+
+    def _upload_in_parts(self, kitchen, recipe, message, api_file_key, local_path, add, part_size):
+        """
+        '/v2/recipe/upload/start/<string:kitchenname>/<string:recipename>', methods=['POST']
+            {message, filepath, sha, size, part-size, operation} -> {upload-id, received: [part numbers]}
+        '/v2/recipe/upload/part/<string:uploadid>/<int:part>', methods=['PUT'], the raw bytes of the part
+        '/v2/recipe/upload/finish/<string:uploadid>', methods=['POST']
+
+        Only one part is in memory at a time. The server keeps the parts it got for the same file, sha and part size,
+        so running the command again after a failure only sends the missing parts. On finish the server checks the
+        assembled file against the git blob sha.
+        :rtype: DKReturnCode -- or None when the server does not take uploads in parts
+        """
+        rc = DKReturnCode()
+        try:
+            sha = githash_path(local_path)
+            size = os.path.getsize(local_path)
+        except (IOError, OSError) as e:
+            rc.set(rc.DK_FAIL, str(e))
+            return rc
+        pdict = dict()
+        pdict[self.MESSAGE] = message
+        pdict[self.FILEPATH] = api_file_key
+        pdict[self.SHA] = sha
+        pdict['size'] = size
+        pdict['part-size'] = part_size
+        pdict['operation'] = 'add' if add else 'update'
+        url = '%s/v2/recipe/upload/start/%s/%s' % (self.get_url_for_direct_rest_call(), kitchen, recipe)
+        try:
+            # starting again the same upload only tells which parts the server has
+            response = self._request('POST', url, idempotent=True, data=json.dumps(pdict),
+                                     headers=self._get_common_headers())
+            rdict = self._get_json(response)
+        except (RequestException, ValueError, TypeError) as c:
+            rc.set(rc.DK_FAIL, "upload_file: exception: %s" % str(c))
+            return rc
+        if response.status_code in DKCloudAPI.UPLOAD_NOT_SUPPORTED:
+            return None
+        if not DKCloudAPI._valid_response(response) or not isinstance(rdict, dict) or 'upload-id' not in rdict:
+            arc = DKAPIReturnCode(rdict, response)
+            rc.set(rc.DK_FAIL, arc.get_message())
+            return rc
+        upload_id = rdict['upload-id']
+        received = set(rdict.get('received', []))
+
+        part_count = max(1, (size + part_size - 1) // part_size)
+        try:
+            with open(local_path, 'rb') as f:
+                for part in range(part_count):
+                    if part in received:
+                        continue
+                    f.seek(part * part_size)
+                    data = f.read(part_size)
+                    headers = self._get_common_headers()
+                    headers['Content-Type'] = 'application/octet-stream'
+                    headers['X-DK-Part-Sha'] = sha1(data).hexdigest()
+                    url = '%s/v2/recipe/upload/part/%s/%d' % (self.get_url_for_direct_rest_call(), upload_id, part)
+                    # a part is the same bytes each time, safe to send again
+                    response = self._request('PUT', url, idempotent=True, data=data, headers=headers)
+                    if not DKCloudAPI._valid_response(response):
+                        arc = DKAPIReturnCode(self._get_json(response), response)
+                        rc.set(rc.DK_FAIL, 'upload_file: part %d of %d of %s failed, running the command again sends '
+                                           'the missing parts\nmessage: %s' % (part + 1, part_count, api_file_key,
+                                                                               arc.get_message()))
+                        return rc
+            url = '%s/v2/recipe/upload/finish/%s' % (self.get_url_for_direct_rest_call(), upload_id)
+            response = self._request('POST', url, headers=self._get_common_headers())
+            rdict = self._get_json(response)
+        except (RequestException, ValueError, TypeError, IOError, OSError) as c:
+            rc.set(rc.DK_FAIL, 'upload_file: exception, running the command again sends the missing parts: %s' %
+                   str(c))
+            return rc
+        if DKCloudAPI._valid_response(response):
+            rc.set(rc.DK_SUCCESS, None)
+        else:
+            arc = DKAPIReturnCode(rdict, response)
+            rc.set(rc.DK_FAIL, arc.get_message())
+        return rc
+
     # api.add_resource(DeleteRecipeFileV2, '/v2/recipe/delete/<string:kitchenname>/<string:recipename>',
     #              methods=['DELETE'])
     def delete_file(self, kitchen, recipe, message, recipe_file_key, recipe_file):
@@ -723,7 +1310,7 @@ class DKCloudAPI(object):
         url = '%s/v2/recipe/delete/%s/%s' % (self.get_url_for_direct_rest_call(),
                                              kitchen, recipe)
         try:
-            response = requests.delete(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('DELETE', url, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -737,15 +1324,20 @@ class DKCloudAPI(object):
             rc.set(rc.DK_FAIL, arc.get_message())
         return rc
 
-    def get_compiled_serving(self, kitchen, recipe_name, variation_name):
+    def get_compiled_serving(self, kitchen, recipe_name, variation_name, use_cache=True):
         """
         get the compiled version of arecipe with variables applied for a specific variation in a kitchen
         returns a dictionary
         '/v2/servings/compiled/get/<string:kitchenname>/<string:recipename>/<string:variationname>', methods=['GET']
+
+        The compiled serving only depends on the recipe files and the kitchen settings (recipeoverrides), so it is
+        cached in memory under the sha of both, when dk-cloud-compiled-cache-max-bytes is set, and compiling again
+        is only asked for when one of them changed.
         :param self: DKCloudAPI
         :param kitchen: basestring
         :param recipe_name: basestring  -- kitchen name, basestring
         :param variation_name: basestring message -- name of variation, basestring
+        :param use_cache: boolean -- False always asks the server to compile
         :rtype: dict
         """
         rc = DKReturnCode()
@@ -758,10 +1350,20 @@ class DKCloudAPI(object):
         if variation_name is None or isinstance(variation_name, str) is False:
             rc.set(rc.DK_FAIL, 'issue with variation_name')
             return rc
+        cache = self._get_compiled_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = self._get_compiled_cache_key(kitchen, recipe_name, variation_name)
+            if cache_key is not None:
+                compiled = cache.get(cache_key)
+                if compiled is not None:
+                    rc.set(rc.DK_SUCCESS, None, compiled)
+                    return rc
         url = '%s/v2/servings/compiled/get/%s/%s/%s' % (self.get_url_for_direct_rest_call(),
                                                         kitchen, recipe_name, variation_name)
         try:
-            response = requests.get(url, headers=self._get_common_headers())
+            # not through the http cache: the kitchen overrides are applied, and may hold credentials
+            response = self._request('GET', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -769,12 +1371,51 @@ class DKCloudAPI(object):
             return rc
         if DKCloudAPI._valid_response(response):
             rc.set(rc.DK_SUCCESS, None, rdict[list(rdict.keys())[0]])
+            if cache_key is not None:
+                cache.put(cache_key, rc.get_payload())
             return rc
         else:
             arc = DKAPIReturnCode(rdict, response)
             rc.set(rc.DK_FAIL, arc.get_message())
             return rc
 
+    def _get_compiled_cache(self):
+        # in memory only, never on disk: a compiled serving has the kitchen overrides applied. Off unless
+        # dk-cloud-compiled-cache-max-bytes is set, the key costs a recipe tree and a kitchen settings read.
+        if self._config is None or self._config.get_compiled_cache_max_bytes() <= 0:
+            return None
+        if getattr(self, '_compiled_cache', None) is None:
+            self._compiled_cache = DKMemoryCache(self._config.get_compiled_cache_max_bytes())
+        return self._compiled_cache
+
+    def _get_compiled_cache_key(self, kitchen, recipe_name, variation_name):
+        """
+        :rtype: str -- the key of the current recipe files and kitchen settings, None if they can't be read
+        """
+        tree_rc = self.recipe_tree(kitchen, recipe_name)
+        if not tree_rc.ok():
+            return None
+        settings_rc = self.get_kitchen_settings(kitchen)
+        if not settings_rc.ok():
+            return None
+        settings_sha = sha1(json.dumps(settings_rc.get_payload(), sort_keys=True).encode('utf-8')).hexdigest()
+        return 'compiled|%s|%s|%s|%s|%s|%s|%s' % (self.get_url_for_direct_rest_call(), self._config.get_username(),
+                                                  kitchen, recipe_name, variation_name,
+                                                  DKCloudAPI.get_recipe_tree_sha(tree_rc.get_payload()), settings_sha)
+
+    @staticmethod
+    def get_recipe_tree_sha(recipe_tree):
+        """
+        One sha for a whole recipe tree, from the folder names, file names and file shas.
+        :param recipe_tree: dict -- {folder: [{'filename': , 'sha': }, ...]}, as returned by recipe_tree()
+        """
+        h = sha1()
+        for folder in sorted(recipe_tree):
+            h.update(('%s\n' % folder).encode('utf-8'))
+            for file_info in sorted(recipe_tree[folder], key=lambda f: f['filename']):
+                h.update(('%s %s\n' % (file_info['filename'], file_info['sha'])).encode('utf-8'))
+        return h.hexdigest()
+
     def merge_kitchens_improved(self, from_kitchen, to_kitchen, resolved_conflicts=None):
         """
         merges kitchens
@@ -797,9 +1438,9 @@ class DKCloudAPI(object):
             if resolved_conflicts is not None and len(resolved_conflicts) > 0:
                 data = dict()
                 data['resolved_conflicts'] = resolved_conflicts
-                response = requests.post(url, data=json.dumps(data), headers=self._get_common_headers())
+                response = self._request('POST', url, data=json.dumps(data), headers=self._get_common_headers())
             else:
-                response = requests.post(url, headers=self._get_common_headers())
+                response = self._request('POST', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             rc.set("merge_kitchens: exception: %s" % str(c))
@@ -842,7 +1483,7 @@ class DKCloudAPI(object):
         adjusted_file_path = file_path
         url = '%s/v2/file/merge/%s/%s/%s' % (self.get_url_for_direct_rest_call(), kitchen, recipe, adjusted_file_path)
         try:
-            response = requests.post(url, data=json.dumps(params), headers=self._get_common_headers())
+            response = self._request('POST', url, idempotent=True, data=json.dumps(params), headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError, TypeError) as c:
             print("merge_file: exception: %s" % str(c))
@@ -855,15 +1496,40 @@ class DKCloudAPI(object):
             return rc
 
     # returns a recipe
-    def recipe_status(self, kitchen, recipe, local_dir=None):
+    def recipe_status(self, kitchen, recipe, local_dir=None, cached=False):
         """
         gets the status of a recipe
         :param self: DKCloudAPI
         :param kitchen: string
         :param recipe: string
         :param local_dir: string --
+        :param cached: bool -- compare with the remote tree kept by the last status, without asking the server
         :rtype: dict
         """
+        if local_dir is not None and os.path.isdir(local_dir) is False:
+            print('Local path %s does not exist' % local_dir)
+            return None
+        rc = self.get_remote_tree(kitchen, recipe, local_dir, cached)
+        if not rc.ok():
+            return rc
+        remote_sha = rc.get_payload()
+        # Now get the local sha.
+        check_path = local_dir if local_dir is not None else os.getcwd()
+        local_sha = get_directory_sha(check_path, self._config is not None and self._config.get_use_git_index())
+        rv = compare_sha(remote_sha, local_sha)
+        rc.set(rc.DK_SUCCESS, None, rv)
+        return rc
+
+    def get_remote_tree(self, kitchen, recipe, local_dir=None, cached=False):
+        """
+        '/v2/recipe/tree/<string:kitchenname>/<string:recipename>', methods=['GET']
+
+        The tree is kept in the recipe's meta dir (REMOTE_TREE) with its ETag, so the next call only asks the
+        server whether it changed: a 304 answers without sending the tree again.
+        :param local_dir: string -- the recipe folder, whose meta dir keeps the tree
+        :param cached: bool -- answer with the kept tree, without asking the server
+        :rtype: DKReturnCode -- the payload is the tree, {folder: [{'filename', 'sha'}]}
+        """
         rc = DKReturnCode()
         if kitchen is None or isinstance(kitchen, str) is False:
             rc.set(rc.DK_FAIL, 'issue with kitchen parameter')
@@ -871,30 +1537,39 @@ class DKCloudAPI(object):
         if recipe is None or isinstance(recipe, str) is False:
             rc.set(rc.DK_FAIL, 'issue with recipe parameter')
             return rc
+        recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir(recipe, local_dir if local_dir is not None else os.getcwd())
+        snapshot = DKRecipeDisk.read_remote_tree(recipe_meta_dir, kitchen, recipe)
+        if cached:
+            if snapshot is None:
+                rc.set(rc.DK_FAIL, 'No remote tree of recipe %s is kept yet, get the status without --cached first'
+                       % recipe)
+            else:
+                rc.set(rc.DK_SUCCESS, None, snapshot['tree'])
+            return rc
+
         url = '%s/v2/recipe/tree/%s/%s' % (self.get_url_for_direct_rest_call(),
                                            kitchen, recipe)
         try:
-            response = requests.get(url, headers=self._get_common_headers())
+            if snapshot is not None and snapshot.get('etag') is not None:
+                headers = self._get_common_headers()
+                headers['If-None-Match'] = snapshot['etag']
+                response = self._request('GET', url, headers=headers)
+                if response.status_code == DKCloudAPI.NOT_MODIFIED:
+                    rc.set(rc.DK_SUCCESS, None, snapshot['tree'])
+                    return rc
+            else:
+                response = self._cached_get(url)
             rdict = self._get_json(response)
-            pass
         except (RequestException, ValueError, TypeError) as c:
             s = "get_recipe: exception: %s" % str(c)
             rc.set(rc.DK_FAIL, s)
             return rc
         if DKCloudAPI._valid_response(response):
-            # Now get the local sha.
-            if local_dir is None:
-                check_path = os.getcwd()
-            else:
-                if os.path.isdir(local_dir) is False:
-                    print('Local path %s does not exist' % local_dir)
-                    return None
-                else:
-                    check_path = local_dir
-            local_sha = get_directory_sha(check_path)
             remote_sha = rdict['recipes'][recipe]
-            rv = compare_sha(remote_sha, local_sha)
-            rc.set(rc.DK_SUCCESS, None, rv)
+            if recipe_meta_dir is not None:
+                DKRecipeDisk.write_remote_tree(recipe_meta_dir, kitchen, recipe, remote_sha,
+                                               response.headers.get('ETag'), rdict.get('ORIG_HEAD'))
+            rc.set(rc.DK_SUCCESS, None, remote_sha)
         else:
             arc = DKAPIReturnCode(rdict, response)
             rc.set(rc.DK_FAIL, arc.get_message())
@@ -919,7 +1594,7 @@ class DKCloudAPI(object):
         url = '%s/v2/recipe/tree/%s/%s' % (self.get_url_for_direct_rest_call(),
                                            kitchen, recipe)
         try:
-            response = requests.get(url, headers=self._get_common_headers())
+            response = self._cached_get(url)
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -968,7 +1643,7 @@ class DKCloudAPI(object):
                                                               kitchen, recipe_name, variation_name, node_name)
 
         try:
-            response = requests.put(url, headers=self._get_common_headers())
+            response = self._request('PUT', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError) as c:
@@ -1003,7 +1678,7 @@ class DKCloudAPI(object):
 
         url = '%s/v2/order/resume/%s' % (self.get_url_for_direct_rest_call(), orderrun_id2)
         try:
-            response = requests.put(url, headers=self._get_common_headers())
+            response = self._request('PUT', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError) as c:
             s = "orderrun_delete: exception: %s" % str(c)
@@ -1034,7 +1709,7 @@ class DKCloudAPI(object):
         url = '%s/v2/order/details/%s' % (self.get_url_for_direct_rest_call(),
                                           kitchen)
         try:
-            response = requests.post(url, data=json.dumps(pdict), headers=self._get_common_headers())
+            response = self._request('POST', url, idempotent=True, data=json.dumps(pdict), headers=self._get_common_headers())
             rdict = self._get_json(response)
             if False:
                 import pickle
@@ -1067,7 +1742,7 @@ class DKCloudAPI(object):
 
         url = '%s/v2/order/status/%s' % (self.get_url_for_direct_rest_call(), kitchen)
         try:
-            response = requests.get(url, headers=self._get_common_headers())
+            response = self._request('GET', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
             pass
         except (RequestException, ValueError, TypeError) as c:
@@ -1099,7 +1774,7 @@ class DKCloudAPI(object):
         url = '%s/v2/order/deleteall/%s' % (self.get_url_for_direct_rest_call(),
                                             kitchen)
         try:
-            response = requests.delete(url, headers=self._get_common_headers())
+            response = self._request('DELETE', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError) as c:
             s = "order_delete_all: exception: %s" % str(c)
@@ -1128,7 +1803,7 @@ class DKCloudAPI(object):
         url = '%s/v2/order/delete/%s' % (self.get_url_for_direct_rest_call(),
                                          order_id2)
         try:
-            response = requests.delete(url, headers=self._get_common_headers())
+            response = self._request('DELETE', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError) as c:
             s = "order_delete_one: exception: %s" % str(c)
@@ -1157,7 +1832,7 @@ class DKCloudAPI(object):
         orderrun_id2 = urllib.parse.quote(orderrun_id)
         url = '%s/v2/serving/delete/%s' % (self.get_url_for_direct_rest_call(), orderrun_id2)
         try:
-            response = requests.delete(url, headers=self._get_common_headers())
+            response = self._request('DELETE', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
             if DKCloudAPI._valid_response(response):
                 rc.set(rc.DK_SUCCESS, None, None)
@@ -1187,7 +1862,7 @@ class DKCloudAPI(object):
         url = '%s/v2/order/stop/%s' % (self.get_url_for_direct_rest_call(),
                                        order_id2)
         try:
-            response = requests.put(url, headers=self._get_common_headers())
+            response = self._request('PUT', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError) as c:
             s = "order_stop: exception: %s" % str(c)
@@ -1217,7 +1892,7 @@ class DKCloudAPI(object):
         url = '%s/v2/serving/stop/%s' % (self.get_url_for_direct_rest_call(),
                                          orderrun_id2)
         try:
-            response = requests.put(url, headers=self._get_common_headers())
+            response = self._request('PUT', url, headers=self._get_common_headers())
             rdict = self._get_json(response)
         except (RequestException, ValueError) as c:
             s = "order_stop: exception: %s" % str(c)
@@ -0,0 +1,659 @@
+import base64
+import copy
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote
+
+from .DKCloudCommandConfig import DKCloudCommandConfig
+from .githash import githash_data
+from .DKDelta import apply_delta
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+An in-process stand-in for the DataKitchen server, for benchmarks and load tests that must not need
+server.dkapp, Mesos or Chronos.
+
+It implements the /v2/... endpoints DKCloudAPI uses (login, validatetoken, kitchen list / recipenames /
+settings / create / delete, recipe tree / get / update / create / delete / upload, compiled servings,
+order create / details / status, secrets), holds all state in memory and answers with the same double encoded json as the real server.
+
+    server = DKCloudAPIFakeServer(latency=0.02, error_rate=0.01, seed=1)
+    server.generate_kitchen('big-kitchen', recipes=20, files_per_recipe=500)
+    server.start()
+    api = DKCloudAPI(server.make_config())
+    api.login()
+    ...
+    server.stop()
+
+latency is seconds per request (a number, or a (min, max) range), error_rate is the fraction of requests
+answered with error_status before doing anything, so retries and backoff can be exercised too.
+With etags (the default) every GET answers with an ETag and a matching If-None-Match gets a 304.
+With uploads (the default) large files can be uploaded in parts (recipe/upload/...), without it the server answers
+404 to them like a server that predates them. With deltas (the default) a text file can be updated with a delta
+against the version the server has (recipe/update-delta/...), see DKDelta.
+"""
+
+
+class DKCloudAPIFakeServer(object):
+    USERNAME = 'fake@datakitchen.io'
+    PASSWORD = 'fake-password'
+    MASTER = 'master'
+
+    def __init__(self, latency=0, error_rate=0.0, error_status=503, seed=None,
+                 username=USERNAME, password=PASSWORD, etags=True, uploads=True, deltas=True):
+        self.latency = latency
+        self.deltas = deltas
+        self.etags = etags
+        self.uploads = uploads
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._username = username
+        self._password = password
+        self._lock = threading.RLock()
+        self._cache_dir = None  # the dk-cloud-cache-dir of make_config, removed by stop()
+        self._tokens = set()
+        self._kitchens = dict()
+        self._secrets = dict()
+        self._orders = dict()
+        self._request_counts = dict()
+        self._not_modified_counts = dict()
+        self._uploads = dict()
+        self._httpd = None
+        self._thread = None
+        self.add_kitchen(DKCloudAPIFakeServer.MASTER, None)
+
+    # server ---------------------------------
+
+    def start(self):
+        """
+        Serves on 127.0.0.1 on a free port, from a daemon thread.
+        :rtype: str -- the base url, e.g. http://127.0.0.1:54321
+        """
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _FakeRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake_server = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), name='DKCloudAPIFakeServer')
+        self._thread.daemon = True
+        self._thread.start()
+        return 'http://127.0.0.1:%d' % self.get_port()
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+        self._httpd = None
+        self._thread = None
+        if self._cache_dir is not None:
+            shutil.rmtree(self._cache_dir, ignore_errors=True)
+            self._cache_dir = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_port(self):
+        return self._httpd.server_address[1]
+
+    def make_config(self, extra=None):
+        """
+        :param extra: dict -- more config settings, e.g. DKCloudCommandConfig.DK_CLOUD_MAX_CONNECTIONS
+        :rtype: DKCloudCommandConfig -- pointing at this server, with its credentials, and local caches in a temp
+            folder of this server, never under the home folder
+        """
+        if self._cache_dir is None:
+            self._cache_dir = tempfile.mkdtemp(prefix='dk-fake-server-cache')
+        config_dict = {DKCloudCommandConfig.DK_CLOUD_IP: 'http://127.0.0.1',
+                       DKCloudCommandConfig.DK_CLOUD_PORT: str(self.get_port()),
+                       DKCloudCommandConfig.DK_CLOUD_USERNAME: self._username,
+                       DKCloudCommandConfig.DK_CLOUD_PASSWORD: self._password,
+                       DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: self._cache_dir}
+        if extra is not None:
+            config_dict.update(extra)
+        cfg = DKCloudCommandConfig()
+        cfg.init_from_dict(config_dict)
+        return cfg
+
+    def get_request_counts(self):
+        """
+        :rtype: dict -- {'GET recipe/tree': n, ...}
+        """
+        with self._lock:
+            return dict(self._request_counts)
+
+    def get_not_modified_counts(self):
+        """
+        :rtype: dict -- {'GET recipe/tree': n, ...}, the requests among get_request_counts answered 304
+        """
+        with self._lock:
+            return dict(self._not_modified_counts)
+
+    def reset_request_counts(self):
+        with self._lock:
+            self._request_counts = dict()
+            self._not_modified_counts = dict()
+
+    # state ---------------------------------
+
+    def add_kitchen(self, name, parent=MASTER):
+        with self._lock:
+            if parent is not None and parent in self._kitchens:
+                recipes = copy.deepcopy(self._kitchens[parent]['recipes'])
+            else:
+                recipes = dict()
+            self._kitchens[name] = {'settings': {'name': name,
+                                                 'parent-kitchen': parent if parent is not None else name,
+                                                 'description': 'fake kitchen %s' % name,
+                                                 'kitchen-staff': [self._username],
+                                                 'recipeoverrides': []},
+                                    'recipes': recipes,
+                                    'head': None}
+            self._commit(name)
+
+    def add_recipe(self, kitchen, recipe, files=None):
+        """
+        :param files: dict -- {'path/in/recipe.json': 'contents', ...}, relative to the recipe root
+        """
+        with self._lock:
+            if files is None:
+                files = {'description.json': json.dumps({'recipe': recipe}, indent=4)}
+            self._kitchens[kitchen]['recipes'][recipe] = dict(files)
+            self._commit(kitchen)
+
+    def get_recipe_files(self, kitchen, recipe):
+        with self._lock:
+            return dict(self._kitchens[kitchen]['recipes'][recipe])
+
+    def generate_kitchen(self, name, recipes=10, files_per_recipe=100, file_size=1024, depth=3, parent=MASTER):
+        """
+        Adds a kitchen full of synthetic recipes, the same for the same seed.
+        """
+        self.add_kitchen(name, parent)
+        for r in range(recipes):
+            recipe = 'recipe%03d' % r
+            files = {'description.json': json.dumps({'recipe': recipe}, indent=4),
+                     'variations.json': json.dumps({'variation-list': {'variation1': {}}}, indent=4)}
+            for f in range(files_per_recipe):
+                folder = '/'.join('node%d' % self._random.randrange(4) for level in range(self._random.randrange(depth + 1)))
+                extension = 'json' if f % 2 == 0 else 'sql'
+                path = '%s/file%04d.%s' % (folder, f, extension) if folder else 'file%04d.%s' % (f, extension)
+                files[path] = self._make_contents(file_size)
+            self.add_recipe(name, recipe, files)
+
+    def _make_contents(self, size):
+        words = ['select', 'from', 'where', 'kitchen', 'recipe', 'order', 'node', 'join', 'sum', '1']
+        contents = list()
+        length = 0
+        while length < size:
+            word = words[self._random.randrange(len(words))]
+            contents.append(word)
+            length += len(word) + 1
+        return ' '.join(contents)[:size] + '\n'
+
+    def _commit(self, kitchen):
+        self._kitchens[kitchen]['head'] = sha1(uuid.uuid4().bytes).hexdigest()
+
+    # endpoints ---------------------------------
+
+    def _check_token(self, handler):
+        authorization = handler.headers.get('Authorization', '')
+        return authorization.startswith('Bearer ') and authorization[len('Bearer '):] in self._tokens
+
+    def login(self, handler, body):
+        credentials = parse_qs(body.decode('utf-8'))
+        if credentials.get('username', [None])[0] != self._username or \
+                credentials.get('password', [None])[0] != self._password:
+            return 403, {'message': 'bad credentials'}
+        token = 'fake-jwt-%s' % uuid.uuid4().hex
+        with self._lock:
+            self._tokens.add(token)
+        return 200, token
+
+    def validatetoken(self, handler, body):
+        return 200, self._check_token(handler)
+
+    def kitchen_list(self, handler, body):
+        with self._lock:
+            kitchens = list()
+            for kitchen in self._kitchens.values():
+                settings = copy.deepcopy(kitchen['settings'])
+                settings['recipes'] = sorted(kitchen['recipes'].keys())
+                kitchens.append(settings)
+        return 200, {'kitchens': kitchens}
+
+    def kitchen_recipenames(self, handler, body, kitchen):
+        with self._lock:
+            return 200, {'recipes': sorted(self._get_kitchen(kitchen)['recipes'].keys())}
+
+    def kitchen_settings_get(self, handler, body, kitchen):
+        with self._lock:
+            settings = self._get_kitchen(kitchen)['settings']
+            if not self.etags:
+                return 200, copy.deepcopy(settings)
+            return 200, copy.deepcopy(settings), {'ETag': self._get_settings_etag(settings)}
+
+    def kitchen_settings_put(self, handler, body, kitchen):
+        pdict = json.loads(body.decode('utf-8'))
+        if_match = handler.headers.get('If-Match')
+        with self._lock:
+            if self.etags and if_match is not None and \
+                    if_match != self._get_settings_etag(self._get_kitchen(kitchen)['settings']):
+                return 412, {'message': {'status': 'failed', 'error': 'kitchen settings changed since read'}}
+            self._get_kitchen(kitchen)['settings'] = pdict['kitchen.json']
+            self._commit(kitchen)
+            return 200, copy.deepcopy(pdict['kitchen.json'])
+
+    @staticmethod
+    def _get_settings_etag(settings):
+        return '"%s"' % sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def kitchen_create(self, handler, body, existing_kitchen, new_kitchen):
+        with self._lock:
+            self._get_kitchen(existing_kitchen)
+            if new_kitchen in self._kitchens:
+                return 400, {'message': {'status': 'failed', 'error': 'kitchen %s already exists' % new_kitchen}}
+            self.add_kitchen(new_kitchen, existing_kitchen)
+        return 200, {'status': 'success'}
+
+    def kitchen_delete(self, handler, body, kitchen):
+        with self._lock:
+            self._get_kitchen(kitchen)
+            del self._kitchens[kitchen]
+        return 200, {'status': 'success'}
+
+    def recipe_tree(self, handler, body, kitchen, recipe):
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            tree = {recipe: []}
+            for path in sorted(files):
+                folder = '/'.join([recipe] + path.split('/')[:-1])
+                self._add_folders(tree, folder)
+                tree[folder].append({'filename': path.split('/')[-1], 'sha': githash_data(files[path])})
+            head = self._kitchens[kitchen]['head']
+        return 200, {'recipes': {recipe: tree}, 'ORIG_HEAD': head}
+
+    @staticmethod
+    def _add_folders(tree, folder):
+        parts = folder.split('/')
+        for i in range(1, len(parts) + 1):
+            sub_folder = '/'.join(parts[:i])
+            if sub_folder not in tree:
+                tree[sub_folder] = []
+
+    def recipe_get(self, handler, body, kitchen, recipe):
+        wanted = None
+        if len(body) > 0:
+            wanted = json.loads(body.decode('utf-8')).get('recipe-files')
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            tree = dict()
+            for path in sorted(files):
+                if wanted is not None and not DKCloudAPIFakeServer._is_wanted(path, wanted):
+                    continue
+                folder = '/'.join([recipe] + path.split('/')[:-1])
+                if folder not in tree:
+                    tree[folder] = []
+                filename = path.split('/')[-1]
+                if isinstance(files[path], bytes):
+                    # uploaded in parts and not text
+                    tree[folder].append({'filename': filename, 'sha': githash_data(files[path]), 'type': 'binary',
+                                         'base64': base64.b64encode(files[path]).decode('ascii')})
+                    continue
+                file_type = 'json' if filename.endswith('.json') else 'text'
+                tree[folder].append({'filename': filename, 'sha': githash_data(files[path]),
+                                     'type': file_type, file_type: files[path]})
+            head = self._kitchens[kitchen]['head']
+        return 200, {'recipes': {recipe: tree}, 'ORIG_HEAD': head}
+
+    @staticmethod
+    def _is_wanted(path, wanted):
+        # 'resources/*' is everything below resources, 'resources/x.sql' is one file
+        for pattern in wanted:
+            if pattern == '*' or pattern == path:
+                return True
+            if pattern.endswith('/*') and path.startswith(pattern[:-1]):
+                return True
+        return False
+
+    def recipe_create(self, handler, body, kitchen, recipe):
+        with self._lock:
+            self._get_kitchen(kitchen)
+            if recipe in self._kitchens[kitchen]['recipes']:
+                return 400, {'message': {'status': 'failed', 'error': 'recipe %s already exists' % recipe}}
+            self.add_recipe(kitchen, recipe)
+        return 200, {'status': 'success'}
+
+    def recipe_file_add(self, handler, body, kitchen, recipe):
+        pdict = json.loads(body.decode('utf-8'))
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            if pdict['filepath'] in files:
+                return 400, {'message': {'status': 'failed', 'error': '%s already exists' % pdict['filepath']}}
+            files[pdict['filepath']] = pdict['file']
+            self._commit(kitchen)
+        return 200, {'status': 'success'}
+
+    def recipe_file_update(self, handler, body, kitchen, recipe):
+        pdict = json.loads(body.decode('utf-8'))
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            if pdict['filepath'] not in files:
+                return 404, {'message': {'status': 'failed', 'error': '%s not found' % pdict['filepath']}}
+            files[pdict['filepath']] = pdict['file']
+            self._commit(kitchen)
+        return 200, {'status': 'success'}
+
+    def recipe_file_update_delta(self, handler, body, kitchen, recipe):
+        pdict = json.loads(body.decode('utf-8'))
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            if pdict['filepath'] not in files:
+                return 404, {'message': {'status': 'failed', 'error': '%s not found' % pdict['filepath']}}
+            base = files[pdict['filepath']]
+            if not isinstance(base, str) or githash_data(base) != pdict['base-sha']:
+                return 409, {'message': {'status': 'failed', 'error': '%s has changed' % pdict['filepath']}}
+            try:
+                contents = apply_delta(base, pdict['delta'])
+            except ValueError as e:
+                return 400, {'message': {'status': 'failed', 'error': str(e)}}
+            if githash_data(contents) != pdict['sha']:
+                return 400, {'message': {'status': 'failed', 'error': 'the delta does not give %s' % pdict['sha']}}
+            files[pdict['filepath']] = contents
+            self._commit(kitchen)
+        return 200, {'status': 'success'}
+
+    def upload_start(self, handler, body, kitchen, recipe):
+        pdict = json.loads(body.decode('utf-8'))
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            if pdict['operation'] == 'add' and pdict['filepath'] in files:
+                return 400, {'message': {'status': 'failed', 'error': '%s already exists' % pdict['filepath']}}
+            if pdict['operation'] == 'update' and pdict['filepath'] not in files:
+                return 404, {'message': {'status': 'failed', 'error': '%s not found' % pdict['filepath']}}
+            key = (kitchen, recipe, pdict['filepath'], pdict['sha'], pdict['size'], pdict['part-size'])
+            for upload_id, upload in self._uploads.items():
+                if upload['key'] == key:
+                    # the same file again, e.g. after an interrupted upload
+                    return 200, {'upload-id': upload_id, 'received': sorted(upload['parts'])}
+            upload_id = uuid.uuid4().hex
+            self._uploads[upload_id] = {'key': key, 'parts': dict()}
+        return 200, {'upload-id': upload_id, 'received': []}
+
+    def upload_part(self, handler, body, upload_id, part):
+        if handler.headers.get('X-DK-Part-Sha') != sha1(body).hexdigest():
+            return 400, {'message': {'status': 'failed', 'error': 'part %s does not match its sha' % part}}
+        with self._lock:
+            if upload_id not in self._uploads:
+                return 404, {'message': {'status': 'failed', 'error': 'upload %s not found' % upload_id}}
+            self._uploads[upload_id]['parts'][int(part)] = body
+        return 200, {'status': 'success'}
+
+    def upload_finish(self, handler, body, upload_id):
+        with self._lock:
+            if upload_id not in self._uploads:
+                return 404, {'message': {'status': 'failed', 'error': 'upload %s not found' % upload_id}}
+            upload = self._uploads[upload_id]
+            kitchen, recipe, filepath, sha, size, part_size = upload['key']
+            part_count = max(1, (size + part_size - 1) // part_size)
+            if any(part not in upload['parts'] for part in range(part_count)):
+                return 400, {'message': {'status': 'failed', 'error': 'upload %s is missing parts' % upload_id}}
+            data = b''.join(upload['parts'][part] for part in range(part_count))
+            del self._uploads[upload_id]
+            if len(data) != size or githash_data(data) != sha:
+                return 400, {'message': {'status': 'failed', 'error': '%s does not match sha %s' % (filepath, sha)}}
+            try:
+                contents = data.decode('utf-8')
+            except UnicodeDecodeError:
+                contents = data
+            self._get_recipe(kitchen, recipe)[filepath] = contents
+            self._commit(kitchen)
+        return 200, {'status': 'success'}
+
+    def recipe_file_delete(self, handler, body, kitchen, recipe):
+        pdict = json.loads(body.decode('utf-8'))
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            if pdict['filepath'] not in files:
+                return 404, {'message': {'status': 'failed', 'error': '%s not found' % pdict['filepath']}}
+            del files[pdict['filepath']]
+            self._commit(kitchen)
+        return 200, {'status': 'success'}
+
+    def compiled_serving(self, handler, body, kitchen, recipe, variation):
+        # 'compiling' applies the kitchen recipeoverrides to every {{variable}} of the recipe files
+        with self._lock:
+            files = self._get_recipe(kitchen, recipe)
+            overrides = self._kitchens[kitchen]['settings'].get('recipeoverrides', [])
+            compiled = dict()
+            for path, contents in files.items():
+                for override in overrides:
+                    contents = contents.replace('{{%s}}' % override['variable'], str(override['value']))
+                compiled[path] = contents
+        return 200, {variation: compiled}
+
+    def order_create(self, handler, body, kitchen, recipe, variation, node=None):
+        with self._lock:
+            self._get_recipe(kitchen, recipe)
+            job = uuid.uuid4().hex
+            order_id = 'ct#%d#%s#%s#%s#%s' % (int(time.time()), recipe, variation, kitchen, job)
+            orderrun_id = '%s#%d#%s#%s#%s#%s' % (uuid.uuid4().hex, int(time.time()), recipe, variation, kitchen, job)
+            serving = {'serving_chronos_id': order_id, 'serving_mesos_id': orderrun_id,
+                       'status': 'COMPLETED_SERVING', 'orderrun_status': 'COMPLETED_SERVING',
+                       'summary': {'name': recipe, 'start-time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                   'total-recipe-time': '0:00:01'}}
+            self._orders[order_id] = {'kitchen': kitchen,
+                                      'order': {'serving_chronos_id': order_id, 'chronos-status': 'success',
+                                                'schedule': 'now'},
+                                      'servings': [serving]}
+        return 200, {'serving_chronos_id': order_id}
+
+    def order_details(self, handler, body, kitchen):
+        with self._lock:
+            self._get_kitchen(kitchen)
+            servings = list()
+            for order in self._orders.values():
+                if order['kitchen'] == kitchen:
+                    servings.extend(copy.deepcopy(order['servings']))
+        return 200, {'servings': servings}
+
+    def order_status(self, handler, body, kitchen):
+        with self._lock:
+            self._get_kitchen(kitchen)
+            orders = list()
+            servings = list()
+            for order in self._orders.values():
+                if order['kitchen'] == kitchen:
+                    orders.append(copy.deepcopy(order['order']))
+                    servings.extend(copy.deepcopy(order['servings']))
+        return 200, {'orders': orders, 'servings': servings}
+
+    def secret_check(self, handler, body, path):
+        with self._lock:
+            return 200, {'value': path in self._secrets}
+
+    def secret_list(self, handler, body, path):
+        with self._lock:
+            return 200, {'value': sorted(name for name in self._secrets if name.startswith(path))}
+
+    def secret_write(self, handler, body, path):
+        pdict = json.loads(body.decode('utf-8'))
+        with self._lock:
+            self._secrets[path] = pdict['value']
+        return 200, {'status': 'success'}
+
+    def secret_delete(self, handler, body, path):
+        with self._lock:
+            if path not in self._secrets:
+                return 404, {'message': {'status': 'failed', 'error': 'secret %s not found' % path}}
+            del self._secrets[path]
+        return 200, {'status': 'success'}
+
+    def _get_kitchen(self, kitchen):
+        if kitchen not in self._kitchens:
+            raise _FakeNotFound('kitchen %s not found' % kitchen)
+        return self._kitchens[kitchen]
+
+    def _get_recipe(self, kitchen, recipe):
+        recipes = self._get_kitchen(kitchen)['recipes']
+        if recipe not in recipes:
+            raise _FakeNotFound('recipe %s not found in kitchen %s' % (recipe, kitchen))
+        return recipes[recipe]
+
+    # (method, route pattern, endpoint, needs a token), the first match wins
+    ROUTES = [
+        ('POST', r'login', 'login', False),
+        ('GET', r'validatetoken', 'validatetoken', False),
+        ('GET', r'kitchen/list', 'kitchen_list', True),
+        ('GET', r'kitchen/recipenames/([^/]+)', 'kitchen_recipenames', True),
+        ('GET', r'kitchen/settings/([^/]+)', 'kitchen_settings_get', True),
+        ('PUT', r'kitchen/settings/([^/]+)', 'kitchen_settings_put', True),
+        ('GET', r'kitchen/create/([^/]+)/([^/]+)', 'kitchen_create', True),
+        ('DELETE', r'kitchen/delete/([^/]+)', 'kitchen_delete', True),
+        ('GET', r'recipe/tree/([^/]+)/([^/]+)', 'recipe_tree', True),
+        ('POST', r'recipe/get/([^/]+)/([^/]+)', 'recipe_get', True),
+        ('POST', r'recipe/create/([^/]+)/([^/]+)', 'recipe_create', True),
+        ('PUT', r'recipe/create/([^/]+)/([^/]+)', 'recipe_file_add', True),
+        ('POST', r'recipe/update/([^/]+)/([^/]+)', 'recipe_file_update', True),
+        ('POST', r'recipe/update-delta/([^/]+)/([^/]+)', 'recipe_file_update_delta', True),
+        ('DELETE', r'recipe/delete/([^/]+)/([^/]+)', 'recipe_file_delete', True),
+        ('POST', r'recipe/upload/start/([^/]+)/([^/]+)', 'upload_start', True),
+        ('PUT', r'recipe/upload/part/([^/]+)/([0-9]+)', 'upload_part', True),
+        ('POST', r'recipe/upload/finish/([^/]+)', 'upload_finish', True),
+        ('GET', r'servings/compiled/get/([^/]+)/([^/]+)/([^/]+)', 'compiled_serving', True),
+        ('PUT', r'order/create/onenode/([^/]+)/([^/]+)/([^/]+)/([^/]+)', 'order_create', True),
+        ('PUT', r'order/create/([^/]+)/([^/]+)/([^/]+)', 'order_create', True),
+        ('POST', r'order/details/([^/]+)', 'order_details', True),
+        ('GET', r'order/status/([^/]+)', 'order_status', True),
+        ('GET', r'secret/check/(.*)', 'secret_check', True),
+        ('GET', r'secret/(.*)', 'secret_list', True),
+        ('POST', r'secret/(.*)', 'secret_write', True),
+        ('DELETE', r'secret/(.*)', 'secret_delete', True),
+    ]
+
+    def handle(self, handler, method):
+        """
+        :rtype: (int, object) or (int, object, dict) -- the http status, the object to send back as json,
+            and optionally extra response headers
+        """
+        path = handler.path.split('?', 1)[0]
+        if not path.startswith('/v2/'):
+            return 404, {'message': 'not found'}
+        route = path[len('/v2/'):]
+        length = int(handler.headers.get('Content-Length', 0))
+        body = handler.rfile.read(length) if length > 0 else b''
+
+        for route_method, pattern, endpoint, needs_token in DKCloudAPIFakeServer.ROUTES:
+            if route_method != method or (endpoint.startswith('upload_') and not self.uploads) or \
+                    (endpoint == 'recipe_file_update_delta' and not self.deltas):
+                continue
+            match = re.match(pattern + '$', route)
+            if match is None:
+                continue
+            with self._lock:
+                key = '%s %s' % (method, '/'.join(route.split('/')[:2]))
+                self._request_counts[key] = self._request_counts.get(key, 0) + 1
+                delay = self._random.uniform(*self.latency) if isinstance(self.latency, (list, tuple)) else self.latency
+                fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            if delay > 0:
+                time.sleep(delay)
+            if fail:
+                return self.error_status, {'message': 'injected error'}
+            if needs_token and not self._check_token(handler):
+                return 401, {'message': 'invalid token'}
+            try:
+                response = getattr(self, endpoint)(handler, body, *[unquote(group) for group in match.groups()])
+            except _FakeNotFound as e:
+                return 404, {'message': {'status': 'failed', 'error': str(e)}}
+            if method == 'GET' and self.etags and response[0] == 200:
+                response = self._make_conditional(handler, key, response)
+            return response
+        return 404, {'message': 'no route for %s /v2/%s' % (method, route)}
+
+    def _make_conditional(self, handler, key, response):
+        # every GET gets an ETag, a matching If-None-Match is answered 304 without a body
+        headers = dict(response[2]) if len(response) > 2 else dict()
+        if 'ETag' not in headers:
+            headers['ETag'] = '"%s"' % sha1(json.dumps(response[1], sort_keys=True).encode('utf-8')).hexdigest()
+        if handler.headers.get('If-None-Match') == headers['ETag']:
+            with self._lock:
+                self._not_modified_counts[key] = self._not_modified_counts.get(key, 0) + 1
+            return 304, None, {'ETag': headers['ETag']}
+        return response[0], response[1], headers
+
+
+class _FakeNotFound(Exception):
+    pass
+
+
+class _FakeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real server behind its load balancer
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def _respond(self, method):
+        response = self.server.fake_server.handle(self, method)
+        status, rv = response[0], response[1]
+        headers = response[2] if len(response) > 2 else {}
+        if status == 304:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        if isinstance(rv, bool):
+            body = str(rv).lower()
+        elif isinstance(rv, str):
+            body = json.dumps(rv)
+        else:
+            # the real server double encodes its json, see DKCloudAPI._get_json
+            body = json.dumps(json.dumps(rv))
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def do_PUT(self):
+        self._respond('PUT')
+
+    def do_DELETE(self):
+        self._respond('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    # python -m DKCloudCommand.modules.DKCloudAPIFakeServer, then point a dk config at the printed port
+    fake_server = DKCloudAPIFakeServer(seed=0)
+    fake_server.generate_kitchen('fake-kitchen')
+    fake_server.start()
+    print('DKCloudAPIFakeServer on port %d, user %s, password %s' % (fake_server.get_port(),
+                                                                    DKCloudAPIFakeServer.USERNAME,
+                                                                    DKCloudAPIFakeServer.PASSWORD))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake_server.stop()
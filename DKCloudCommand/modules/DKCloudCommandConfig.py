@@ -13,6 +13,46 @@ class DKCloudCommandConfig(object):
     DK_CLOUD_PASSWORD = 'dk-cloud-password'
     DK_CLOUD_JWT = 'dk-cloud-jwt'
     DK_CLOUD_FILE_LOCATION = 'dk-cloud-file-location'
+    DK_CLOUD_MAX_CONNECTIONS = 'dk-cloud-max-connections'
+    DK_CLOUD_CONNECT_TIMEOUT = 'dk-cloud-connect-timeout'
+    DK_CLOUD_READ_TIMEOUT = 'dk-cloud-read-timeout'
+    DK_CLOUD_TIMEOUTS = 'dk-cloud-timeouts'  # {"recipe/tree": [connect, read], ...}
+    DK_CLOUD_RETRIES = 'dk-cloud-retries'
+    DK_CLOUD_RETRY_BACKOFF = 'dk-cloud-retry-backoff'
+    DK_CLOUD_RETRY_BACKOFF_MAX = 'dk-cloud-retry-backoff-max'
+    DK_CLOUD_CACHE_DIR = 'dk-cloud-cache-dir'  # e.g. "~/.dk/cache", the local caches are off without it
+    DK_CLOUD_SECRET_LIST_TTL = 'dk-cloud-secret-list-ttl'
+    DK_CLOUD_COMPILED_CACHE_MAX_BYTES = 'dk-cloud-compiled-cache-max-bytes'  # in memory, 0 turns it off
+    DK_CLOUD_RATE_LIMITS = 'dk-cloud-rate-limits'  # {"host": {"rate": , "burst": , "max-in-flight": }, "*": {...}}
+    DK_CLOUD_HTTP_CACHE_MAX_BYTES = 'dk-cloud-http-cache-max-bytes'
+    DK_CLOUD_HTTP_CACHE_TTLS = 'dk-cloud-http-cache-ttls'  # {"kitchen/list": seconds, ...}, without ETag/Last-Modified
+    DK_CLOUD_USE_GIT_INDEX = 'dk-cloud-use-git-index'
+    DK_CLOUD_UPLOAD_THRESHOLD = 'dk-cloud-upload-threshold'  # bytes, larger files are uploaded in parts
+    DK_CLOUD_UPLOAD_PART_SIZE = 'dk-cloud-upload-part-size'
+    DK_CLOUD_DELTA_UPDATES = 'dk-cloud-delta-updates'
+    DK_CLOUD_DELTA_MIN_SIZE = 'dk-cloud-delta-min-size'  # bytes, smaller files are always sent whole
+    DK_CLOUD_DELTA_MAX_SIZE = 'dk-cloud-delta-max-size'
+    DK_CLOUD_BLOB_CACHE_MAX_BYTES = 'dk-cloud-blob-cache-max-bytes'
+
+    DEFAULT_MAX_CONNECTIONS = 10
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_READ_TIMEOUT = 120
+    # endpoints (the part of the url after /v2/) known to be slow on the server side
+    DEFAULT_ENDPOINT_TIMEOUTS = {'kitchen/merge': [10, 600]}
+    DEFAULT_RETRIES = 3
+    DEFAULT_RETRY_BACKOFF = 0.5
+    DEFAULT_RETRY_BACKOFF_MAX = 30
+    DEFAULT_CACHE_DIR = None  # opt in
+    DEFAULT_SECRET_LIST_TTL = 30
+    DEFAULT_COMPILED_CACHE_MAX_BYTES = 0  # off, a long lived process (the dk daemon) may turn it on
+    DEFAULT_HTTP_CACHE_MAX_BYTES = 100 * 1024 * 1024
+    DEFAULT_USE_GIT_INDEX = False  # opt in
+    DEFAULT_UPLOAD_THRESHOLD = 1024 * 1024
+    DEFAULT_UPLOAD_PART_SIZE = 4 * 1024 * 1024
+    DEFAULT_DELTA_UPDATES = False  # opt in, the files sent are then kept under dk-cloud-cache-dir
+    DEFAULT_DELTA_MIN_SIZE = 4 * 1024
+    DEFAULT_DELTA_MAX_SIZE = 16 * 1024 * 1024
+    DEFAULT_BLOB_CACHE_MAX_BYTES = 100 * 1024 * 1024
 
     def __init__(self):
         if self._config_dict is None:
@@ -79,6 +119,163 @@ class DKCloudCommandConfig(object):
         else:
             return False
 
+    def get_max_connections(self):
+        if DKCloudCommandConfig.DK_CLOUD_MAX_CONNECTIONS in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_MAX_CONNECTIONS])
+        else:
+            return DKCloudCommandConfig.DEFAULT_MAX_CONNECTIONS
+
+    def get_connect_timeout(self):
+        if DKCloudCommandConfig.DK_CLOUD_CONNECT_TIMEOUT in self._config_dict:
+            return float(self._config_dict[DKCloudCommandConfig.DK_CLOUD_CONNECT_TIMEOUT])
+        else:
+            return DKCloudCommandConfig.DEFAULT_CONNECT_TIMEOUT
+
+    def get_read_timeout(self):
+        if DKCloudCommandConfig.DK_CLOUD_READ_TIMEOUT in self._config_dict:
+            return float(self._config_dict[DKCloudCommandConfig.DK_CLOUD_READ_TIMEOUT])
+        else:
+            return DKCloudCommandConfig.DEFAULT_READ_TIMEOUT
+
+    def get_timeout(self, endpoint=None):
+        """
+        The (connect, read) timeout for an endpoint, e.g. 'recipe/tree/kitchen/recipe'.
+        The longest matching prefix in dk-cloud-timeouts wins, then the built in defaults.
+        """
+        timeout = (self.get_connect_timeout(), self.get_read_timeout())
+        if endpoint is None:
+            return timeout
+        for endpoint_timeouts in [DKCloudCommandConfig.DEFAULT_ENDPOINT_TIMEOUTS,
+                                  self._config_dict.get(DKCloudCommandConfig.DK_CLOUD_TIMEOUTS, {})]:
+            matches = [prefix for prefix in endpoint_timeouts if endpoint.startswith(prefix)]
+            if len(matches) > 0:
+                found = endpoint_timeouts[max(matches, key=len)]
+                if isinstance(found, (list, tuple)):
+                    timeout = (float(found[0]), float(found[1]))
+                else:
+                    timeout = (timeout[0], float(found))
+        return timeout
+
+    def get_retries(self):
+        if DKCloudCommandConfig.DK_CLOUD_RETRIES in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_RETRIES])
+        else:
+            return DKCloudCommandConfig.DEFAULT_RETRIES
+
+    def get_retry_backoff(self):
+        if DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF in self._config_dict:
+            return float(self._config_dict[DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF])
+        else:
+            return DKCloudCommandConfig.DEFAULT_RETRY_BACKOFF
+
+    def get_retry_backoff_max(self):
+        if DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF_MAX in self._config_dict:
+            return float(self._config_dict[DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF_MAX])
+        else:
+            return DKCloudCommandConfig.DEFAULT_RETRY_BACKOFF_MAX
+
+    def get_cache_dir(self):
+        """
+        :rtype: str -- the folder of the local caches, None when they are off
+        """
+        if DKCloudCommandConfig.DK_CLOUD_CACHE_DIR in self._config_dict:
+            cache_dir = self._config_dict[DKCloudCommandConfig.DK_CLOUD_CACHE_DIR]
+        else:
+            cache_dir = DKCloudCommandConfig.DEFAULT_CACHE_DIR
+        if cache_dir is None or len(cache_dir) == 0:
+            return None
+        return os.path.expanduser(cache_dir)
+
+    def get_secret_list_ttl(self):
+        if DKCloudCommandConfig.DK_CLOUD_SECRET_LIST_TTL in self._config_dict:
+            return float(self._config_dict[DKCloudCommandConfig.DK_CLOUD_SECRET_LIST_TTL])
+        else:
+            return DKCloudCommandConfig.DEFAULT_SECRET_LIST_TTL
+
+    def get_compiled_cache_max_bytes(self):
+        if DKCloudCommandConfig.DK_CLOUD_COMPILED_CACHE_MAX_BYTES in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_COMPILED_CACHE_MAX_BYTES])
+        else:
+            return DKCloudCommandConfig.DEFAULT_COMPILED_CACHE_MAX_BYTES
+
+    def get_http_cache_max_bytes(self):
+        if DKCloudCommandConfig.DK_CLOUD_HTTP_CACHE_MAX_BYTES in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_HTTP_CACHE_MAX_BYTES])
+        else:
+            return DKCloudCommandConfig.DEFAULT_HTTP_CACHE_MAX_BYTES
+
+    def get_http_cache_ttl(self, endpoint):
+        """
+        How long a response of endpoint, e.g. 'kitchen/list', is used without asking the server when it came
+        without a validator (ETag or Last-Modified). The longest matching prefix in dk-cloud-http-cache-ttls wins.
+        :rtype: float -- seconds, 0 when such responses are not cached
+        """
+        ttls = self._config_dict.get(DKCloudCommandConfig.DK_CLOUD_HTTP_CACHE_TTLS, {})
+        matches = [prefix for prefix in ttls if endpoint is not None and endpoint.startswith(prefix)]
+        if len(matches) == 0:
+            return 0
+        return float(ttls[max(matches, key=len)])
+
+    def get_use_git_index(self):
+        """
+        :rtype: bool -- whether the shas of a kitchen in a git working tree come from the git index when they can
+        """
+        if DKCloudCommandConfig.DK_CLOUD_USE_GIT_INDEX in self._config_dict:
+            return bool(self._config_dict[DKCloudCommandConfig.DK_CLOUD_USE_GIT_INDEX])
+        else:
+            return DKCloudCommandConfig.DEFAULT_USE_GIT_INDEX
+
+    def get_upload_threshold(self):
+        if DKCloudCommandConfig.DK_CLOUD_UPLOAD_THRESHOLD in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_UPLOAD_THRESHOLD])
+        else:
+            return DKCloudCommandConfig.DEFAULT_UPLOAD_THRESHOLD
+
+    def get_upload_part_size(self):
+        if DKCloudCommandConfig.DK_CLOUD_UPLOAD_PART_SIZE in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_UPLOAD_PART_SIZE])
+        else:
+            return DKCloudCommandConfig.DEFAULT_UPLOAD_PART_SIZE
+
+    def get_delta_updates(self):
+        """
+        :rtype: bool -- whether a text file the server has an older version of is updated with a line delta. The
+            text of the files sent is kept in the blob cache, as the base of their next update
+        """
+        if DKCloudCommandConfig.DK_CLOUD_DELTA_UPDATES in self._config_dict:
+            return bool(self._config_dict[DKCloudCommandConfig.DK_CLOUD_DELTA_UPDATES])
+        else:
+            return DKCloudCommandConfig.DEFAULT_DELTA_UPDATES
+
+    def get_delta_min_size(self):
+        if DKCloudCommandConfig.DK_CLOUD_DELTA_MIN_SIZE in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_DELTA_MIN_SIZE])
+        else:
+            return DKCloudCommandConfig.DEFAULT_DELTA_MIN_SIZE
+
+    def get_delta_max_size(self):
+        if DKCloudCommandConfig.DK_CLOUD_DELTA_MAX_SIZE in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_DELTA_MAX_SIZE])
+        else:
+            return DKCloudCommandConfig.DEFAULT_DELTA_MAX_SIZE
+
+    def get_blob_cache_max_bytes(self):
+        if DKCloudCommandConfig.DK_CLOUD_BLOB_CACHE_MAX_BYTES in self._config_dict:
+            return int(self._config_dict[DKCloudCommandConfig.DK_CLOUD_BLOB_CACHE_MAX_BYTES])
+        else:
+            return DKCloudCommandConfig.DEFAULT_BLOB_CACHE_MAX_BYTES
+
+    def get_rate_limits(self, host):
+        """
+        :param host: str -- 'hostname:port' or 'hostname'
+        :rtype: dict -- the limits for the host, or for '*', by default only max-in-flight = dk-cloud-max-connections
+        """
+        rate_limits = self._config_dict.get(DKCloudCommandConfig.DK_CLOUD_RATE_LIMITS, {})
+        for key in [host, host.split(':')[0], '*']:
+            if key in rate_limits:
+                return rate_limits[key]
+        return {'max-in-flight': self.get_max_connections()}
+
     # def get(self, attribute):
     #     if attribute is None:
     #         return None
@@ -2,11 +2,18 @@ import os
 import json
 import base64
 import zlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from .DKCloudAPI import DKCloudAPI
-from .DKRecipeDisk import DKRecipeDisk
+from .AsyncDKCloudAPI import AsyncDKCloudAPI
+from .DKRecipeDisk import DKRecipeDisk, get_directory_sha, compare_sha
+from .DKRecipeTree import RecipeTree
+from .DKRecipeGetPipeline import DKRecipeGetPipeline
 from .DKKitchenDisk import DKKitchenDisk
 from .DKReturnCode import *
 from .DKIgnore import DKIgnore
+from .DKUpdateJournal import DKUpdateJournal
+from .DKRecipeWatcher import DKRecipeWatcher
 from .DKActiveServingWatcher import DKActiveServingWatcherSingleton
 from .DKActiveServingWatcher import DKActiveServingWatcher
 import jwt
@@ -40,6 +47,8 @@ class DKCloudCommandRunner(object):
     def __init__(self):
         pass
 
+    MAX_DISK_WORKERS = 8  # threads decoding and writing files
+
     TESTRESULTS = 'testresults'
     TIMINGRESULTS = 'timingresults'
     STATUSES = 'statuses'
@@ -86,8 +95,8 @@ class DKCloudCommandRunner(object):
 
     @staticmethod
     @check_api_param_decorator
-    def secret_list(dk_api,path):
-        rc = dk_api.secret_list(path)
+    def secret_list(dk_api,path,use_cache=True):
+        rc = dk_api.secret_list(path, use_cache)
         if rc.ok():
             sl = rc.get_payload()
             if sl:
@@ -104,8 +113,8 @@ class DKCloudCommandRunner(object):
 
     @staticmethod
     @check_api_param_decorator
-    def secret_exists(dk_api,path):
-        rc = dk_api.secret_exists(path)
+    def secret_exists(dk_api,path,use_cache=True):
+        rc = dk_api.secret_exists(path, use_cache)
         if rc.ok():
             sl = rc.get_payload()
             rc.set_message(sl)
@@ -133,6 +142,68 @@ class DKCloudCommandRunner(object):
             rc.set_message('Unable deleted secret\nmessage: %s' % rc.get_message())
         return rc
 
+    @staticmethod
+    def parse_secret_entries(lines, with_values=True):
+        """
+        Parses a secrets file: one 'path=value' (or just 'path' when with_values is False) per line,
+        a value of '@file' is read from file. Blank lines and lines starting with # are skipped.
+        :rtype: list of (path, value) or list of path
+        """
+        entries = list()
+        for line in lines:
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            if not with_values:
+                entries.append(line)
+                continue
+            if '=' not in line:
+                raise ValueError("'%s' is not path=value" % line)
+            path, value = line.split('=', 1)
+            if value.startswith('@'):
+                with open(value[1:]) as vfile:
+                    value = vfile.read()
+            entries.append((path.strip(), value))
+        return entries
+
+    @staticmethod
+    @check_api_param_decorator
+    def secret_write_many(dk_api, entries):
+        """
+        Writes many secrets concurrently over the one session of dk_api.
+        :param entries: list of (path, value)
+        :rtype: DKReturnCode
+        """
+        return DKCloudCommandRunner._run_secret_calls(dk_api, [('secret_write', entry) for entry in entries],
+                                                      'written')
+
+    @staticmethod
+    @check_api_param_decorator
+    def secret_delete_many(dk_api, paths):
+        """
+        :param paths: list of secret paths
+        :rtype: DKReturnCode
+        """
+        return DKCloudCommandRunner._run_secret_calls(dk_api, [('secret_delete', (path,)) for path in paths],
+                                                      'deleted')
+
+    @staticmethod
+    def _run_secret_calls(dk_api, calls, verb):
+        # there is no batch secret endpoint, so the calls share the session's pooled connections instead
+        async_api = AsyncDKCloudAPI(dk_api)
+        try:
+            rcs = async_api.run_all(calls)
+        finally:
+            async_api.close()
+        failed = ['\t%s: %s' % (call[1][0], rc.get_message()) for call, rc in zip(calls, rcs) if not rc.ok()]
+        rc = DKReturnCode()
+        msg = '%d secrets %s.' % (len(calls) - len(failed), verb)
+        if len(failed) > 0:
+            rc.set(rc.DK_FAIL, msg + '\n%d failed:\n%s' % (len(failed), '\n'.join(failed)))
+        else:
+            rc.set(rc.DK_SUCCESS, msg)
+        return rc
+
     @staticmethod
     @check_api_param_decorator
     def user_info(dk_api):
@@ -184,24 +255,32 @@ class DKCloudCommandRunner(object):
                 return rc
 
         if get_all_recipes:
-            recipe_list = dk_api.list_recipe(kitchen_name)
-            if recipe_list is None:
+            recipe_list_rc = dk_api.list_recipe(kitchen_name)
+            if not recipe_list_rc.ok():
                 rc.set(rc.DK_FAIL, 'ERROR:  DKCloudCommand.list_recipe failed')
                 return rc
             else:
-                recipes_to_get = recipe_list
+                recipes_to_get = recipe_list_rc.get_payload()
         elif recipes is not None and len(recipes) > 0:
             recipes_to_get = recipes
         else:
             recipes_to_get = None
 
         if recipes_to_get is not None:
-            for recipe in recipes_to_get:
-                rc = DKCloudCommandRunner.get_recipe(dk_api, kitchen_name, recipe, os.path.join(root_dir, kitchen_name))
-                rv = rc.get_message()
-                if not rc.ok():
-                    rc.set(rc.DK_FAIL, rv)
-                    return rc
+            # Each recipe lands in its own folder, so they can be fetched side by side.
+            kitchen_dir = os.path.join(root_dir, kitchen_name)
+            async_api = AsyncDKCloudAPI(dk_api)
+            try:
+                recipe_rcs = async_api.map_in_pool(DKCloudCommandRunner.get_recipe,
+                                                   [(dk_api, kitchen_name, recipe, kitchen_dir)
+                                                    for recipe in recipes_to_get])
+            finally:
+                async_api.close()
+            for recipe_rc in recipe_rcs:
+                rv = recipe_rc.get_message()
+                if not recipe_rc.ok():
+                    recipe_rc.set(recipe_rc.DK_FAIL, rv)
+                    return recipe_rc
                 else:
                     msg_with_status += "\n" + rv
         rc.set(rc.DK_SUCCESS, msg_with_status)
@@ -275,20 +354,12 @@ class DKCloudCommandRunner(object):
             rv = dk_api.get_kitchen_settings(kitchen)
             if rv.ok():
                 kitchen_json = rv.get_payload()
-                overrides = kitchen_json['recipeoverrides']
-                if isinstance(get, tuple) or isinstance(get, list):
-                    for get_this in get:
-                        matches = [override for override in overrides if override['variable'] == get_this]
-                        if len(matches) == 0:
-                            output_message += "none\n"
-                        else:
-                            output_message += "{}\n".format(matches[0]['value'])
-                else:
-                    matches = [override for override in overrides if override['variable'] == get]
-                    if len(matches) == 0:
-                        output_message += "none\n"
-                    else:
-                        output_message += "{}\n".format(matches[0]['value'])
+                by_variable = DKCloudAPI.get_overrides_by_variable(kitchen_json['recipeoverrides'])
+                if not isinstance(get, tuple) and not isinstance(get, list):
+                    get = [get]
+                for get_this in get:
+                    override = by_variable.get(get_this)
+                    output_message += "{}\n".format(override['value'] if override is not None else 'none')
             else:
                 msg = 'Unable to get {}\n'.format(get)
                 rc.set(rc.DK_FAIL, msg)
@@ -296,6 +367,37 @@ class DKCloudCommandRunner(object):
         rc.set(rc.DK_SUCCESS, output_message, overrides)
         return rc
 
+    @staticmethod
+    def parse_override_entries(override_file):
+        """
+        Parses a file of kitchen overrides, either a json object {"variable": value, ...} where a null value
+        unsets the variable, or one 'variable=value' per line, where 'variable=' alone unsets it.
+        Blank lines and lines starting with # are skipped.
+        :rtype: (list of (variable, value), list of variable) -- the adds and the unsets
+        """
+        content = override_file.read()
+        add = list()
+        unset = list()
+        if content.lstrip().startswith('{'):
+            for variable, value in json.loads(content).items():
+                if value is None:
+                    unset.append(variable)
+                else:
+                    add.append((variable, value))
+            return add, unset
+        for line in content.splitlines():
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            if '=' not in line:
+                raise ValueError("'%s' is not variable=value" % line)
+            variable, value = line.split('=', 1)
+            if len(value) == 0:
+                unset.append(variable.strip())
+            else:
+                add.append((variable.strip(), value))
+        return add, unset
+
     @staticmethod
     def which_kitchen(dk_api, path=None):
         kitchen_name = DKKitchenDisk.find_kitchen_name(path)
@@ -387,15 +489,32 @@ class DKCloudCommandRunner(object):
         if os.path.exists(os.path.join(rp, recipe_name_param)):
             # The recipe folder already exists. Compare the files, and see if there will be any conflicts.
             recipe_path = os.path.join(rp, recipe_name_param)
-            rc = dk_api.recipe_status(kitchen, recipe_name_param, recipe_path)
+            # We are trying to get the local up to date with the remote.
+            # Different diff results are different actions:
+            # local_only - Do nothing
+            # same - Do nothing
+            # remote_only - Write new, as the pipeline finds them
+            # different (merged_different_files) - overwrite
+            config = dk_api.get_config()
+            pipeline = DKRecipeGetPipeline(dk_api, kitchen, recipe_name_param, rp,
+                                           config is not None and config.get_use_git_index(),
+                                           DKCloudCommandRunner.MAX_DISK_WORKERS)
+            rc = pipeline.run()
             if not rc.ok():
-                rs = 'DKCloudCommand.recipe_status failed\nmessage: %s' % rc.get_message()
+                rs = 'DKCloudCommand.get_recipe failed\nmessage: %s' % rc.get_message()
                 rc.set_message(rs)
                 return rc
-
             rl = rc.get_payload()
 
-            if 'different' in rl and len(rl['different']) > 0:
+            # Start building the return message
+            msg = ''
+
+            remote_only_msg = ''
+            if len(rl['only_remote']) > 0:
+                remote_only_msg += '%d new or missing files from remote:\n' % len(rl['only_remote'])
+                remote_only_msg += '\n'.join('\t%s' % path for path in rl['only_remote'])
+
+            if len(rl['different']) > 0:
                 status, merged_different_files = DKCloudCommandRunner._merge_files(dk_api, kitchen, recipe_name_param,
                                                                                    recipe_path, rl['different'])
                 if not status:
@@ -405,68 +524,14 @@ class DKCloudCommandRunner(object):
                     s = """ERROR: DKCloudCommandRunner.get_recipe: There was trouble merging the differences between local and remote files.
                         %s
                         Use file-diff and file-merge to resolve issues.
-                        No files written locally.""" % "\n".join(diffs_no_recipe)
+                        No merged files written locally.""" % "\n".join(diffs_no_recipe)
+                    if len(remote_only_msg) > 0:
+                        s += '\n' + remote_only_msg
                     rc.set(rc.DK_FAIL, s)
                     return rc
             else:
                 merged_different_files = None
 
-            if 'only_remote' in rl and len(rl['only_remote']) > 0:
-                folders_stripped = list()
-                files_stripped = list()
-                for remote_path, remote_files in rl['only_remote'].items():
-                    parts = remote_path.partition(os.sep)
-                    if len(remote_files) == 0:
-                        folders_stripped.append(parts[2])
-                    else:
-                        for remote_file in remote_files:
-                            files_stripped.append(os.path.join(parts[2], remote_file['filename']))
-
-                minimal_paths = DKCloudCommandRunner.find_minimal_paths_to_get(folders_stripped)
-                paths_to_get = []
-                for path, is_path in minimal_paths.items():
-                    paths_to_get.append(os.path.join(path, '*'))
-                paths_to_get.extend(files_stripped)
-                only_remote_files_rc = dk_api.get_recipe(kitchen, recipe_name_param, paths_to_get)
-
-                if only_remote_files_rc is not None:
-                    remote_only_recipe_tree = only_remote_files_rc.get_payload()
-                else:
-                    remote_only_recipe_tree = None
-
-            else:
-                remote_only_recipe_tree = None
-
-            # Start building the return message
-            msg = ''
-
-            # We are trying to get the local up to date with the remote.
-            # Different diff results are different actions:
-            # local_only - Do nothing
-            # same - Do nothing
-            # remote_only - Write new
-            # different (merged_different_files) - overwrite
-            remote_only_msg = ''
-            if remote_only_recipe_tree is not None:
-                r = DKRecipeDisk(recipe=remote_only_recipe_tree['recipes'][recipe_name_param], path=rp)
-                if not r.save_recipe_to_disk(update_meta=False):
-                    rc.set(rc.DK_FAIL, 'Problems saving differences and remote only files to disk. %s' % str(
-                        remote_only_recipe_tree))
-                    return rc
-
-                remote_only_file_count = 0
-                remote_only_files = list()
-                for recipe_folder_name, recipe_folder_contents in remote_only_recipe_tree['recipes'][
-                        recipe_name_param].items():
-                    for remote_only_file in recipe_folder_contents:
-                        remote_only_file_count += 1
-                        remote_only_files.append(
-                            "\t%s" % os.path.join(os.sep.join(recipe_folder_name.split(os.sep)[1:]),
-                                                  remote_only_file['filename']))
-                remote_only_msg += '%d new or missing files from remote:\n' % remote_only_file_count
-                remote_only_files.sort()
-                remote_only_msg += '\n'.join(remote_only_files)
-
             merged_files_msg = ''
 
             if merged_different_files is not None:
@@ -478,6 +543,7 @@ class DKCloudCommandRunner(object):
 
                 merged_file_count = 0
                 conflicted_file_count = 0
+                conflict_store = DKRecipeDisk.get_conflict_store(recipe_name_param, rp)
                 for merged_folder, folder_contents in merged_different_files.items():
                     for merged_file in folder_contents:
                         # conflict_key = '%s|%s|%s|%s|%s' % (
@@ -495,7 +561,7 @@ class DKCloudCommandRunner(object):
                         elif 'content' in merged_file:
                             conflict_info['conflict_tags'] = merged_file['content']
 
-                        merged_file_path = os.path.join(os.sep.join(merged_folder.split(os.sep)[1:]), merged_file['filename'])
+                        merged_file_path = RecipeTree.get_path_in_recipe(merged_folder, merged_file['filename'])
                         merged_files_msg += "Auto-merging '%s'\n" % merged_file_path
                         merged_file_count += 1
                         if '<<<<<<<' in conflict_info['conflict_tags'] and '=======' in conflict_info['conflict_tags'] \
@@ -505,9 +571,11 @@ class DKCloudCommandRunner(object):
                             conflict_info['from_kitchen'] = kitchen
                             conflict_info['sha'] = 'none'
                             conflict_info['to_kitchen'] = kitchen
-                            DKRecipeDisk.add_conflict_to_conflicts_meta(conflict_info, merged_folder, recipe_name_param,
-                                                                        rp)
+                            conflict_store.add_conflict(conflict_info, merged_folder, recipe_name_param)
                             merged_files_msg += "CONFLICT (content): Merge conflict in %s\n" % merged_file_path
+                if not conflict_store.save():
+                    rc.set(rc.DK_FAIL, 'Unable to save the conflicts of recipe %s' % recipe_name_param)
+                    return rc
 
             if len(remote_only_msg) > 0:
                 msg += remote_only_msg + '\n'
@@ -524,23 +592,28 @@ class DKCloudCommandRunner(object):
 
     @staticmethod
     def find_minimal_paths_to_get(paths_to_check):
+        """
+        Collapses the folders nested in another folder of the list.
+        :param paths_to_check: list -- folders relative to the recipe root
+        :rtype: dict -- {folder: True when it has nested folders in the list} for the folders not nested in another
+        """
+        # Sorted by their parts, the folders nested in a folder come right after it: one sweep, O(n log n). Each
+        # path is normalized once.
+        parts_and_paths = list()
+        for path in paths_to_check:
+            normalized = os.path.normpath(path)
+            parts = [] if normalized == os.curdir else normalized.split(os.sep)
+            parts_and_paths.append((parts, path))
+        parts_and_paths.sort()
+
         minimum_paths = {}
-        skip_paths = {}
-        paths_to_check.sort()
-        for outer in range(0, len(paths_to_check)):
-            this_path = paths_to_check[outer]
-            if this_path not in skip_paths:
-                if outer == len(paths_to_check) - 1 and this_path not in skip_paths and this_path not in minimum_paths:
-                    minimum_paths[this_path] = False
-                    continue
-                for inner in range(outer + 1, len(paths_to_check)):
-                    next_path = paths_to_check[inner]
-                    if next_path not in skip_paths:
-                        if DKCloudCommandRunner.is_subdirectory(next_path, this_path):
-                            minimum_paths[this_path] = True
-                            skip_paths[next_path] = True
-            if this_path not in skip_paths and this_path not in minimum_paths:
-                minimum_paths[this_path] = False
+        current_parts, current_path = None, None
+        for parts, path in parts_and_paths:
+            if current_parts is not None and parts[:len(current_parts)] == current_parts:
+                minimum_paths[current_path] = True
+            else:
+                current_parts, current_path = parts, path
+                minimum_paths[path] = False
         return minimum_paths
 
     @staticmethod
@@ -624,7 +697,7 @@ class DKCloudCommandRunner(object):
             print("%s - %s - %s" % (e.filename, e.errno, e.message))
             return None
 
-        file_path_without_recipe = os.path.join(os.sep.join(folder_name.split(os.sep)[1:]), file_info['filename'])
+        file_path_without_recipe = RecipeTree.get_path_in_recipe(folder_name, file_info['filename'])
         rc = dk_api.merge_file(kitchen_name, recipe_name, file_path_without_recipe, base64.b64encode(local_contents),
                                orig_head, last_file_sha)
         return rc
@@ -655,109 +728,250 @@ class DKCloudCommandRunner(object):
                 rc.set(rc.DK_FAIL, rc.get_payload())
         return rc
 
+    @staticmethod
+    def _get_recipe_status_message(rl):
+        """
+        :param rl: dict -- the compare_sha result of a recipe, see DKCloudAPI.recipe_status
+        """
+        same_file_count = 0
+        if len(rl['same']) > 0:
+            for folder_name, folder_contents in rl['same'].items():
+                same_file_count += len(folder_contents)
+
+        modified_file_names = list()
+        modified_file_count = 0
+        if len(rl['different']) > 0:
+            for folder_name, folder_contents in rl['different'].items():
+                for this_file in folder_contents:
+                    modified_file_names.append(
+                        '\t' + RecipeTree.get_path_in_recipe(folder_name, this_file['filename']))
+                    modified_file_count += 1
+
+        local_file_names = list()
+        local_file_count = 0
+        local_folder_names = list()
+        local_folder_count = 0
+        if len(rl['only_local']) > 0:
+            for folder_name, folder_contents in rl['only_local'].items():
+                if len(folder_contents) > 0:
+                    for this_file in folder_contents:
+                        local_file_names.append(
+                            '\t' + RecipeTree.get_path_in_recipe(folder_name, this_file['filename']))
+                        local_file_count += 1
+                else:
+                    local_folder_count += 1
+                    local_folder_names.append(
+                        '\t' + RecipeTree.get_path_in_recipe(folder_name))
+
+        remote_file_names = list()
+        remote_file_count = 0
+        remote_folder_count = 0
+        remote_folder_names = list()
+        if len(rl['only_remote']) > 0:
+            for folder_name, folder_contents in rl['only_remote'].items():
+                if len(folder_contents) > 0:
+                    for this_file in folder_contents:
+                        remote_file_names.append(
+                            '\t' + RecipeTree.get_path_in_recipe(folder_name, this_file['filename']))
+                        remote_file_count += 1
+                else:
+                    remote_folder_count += 1
+                    remote_folder_names.append(
+                        '\t' + RecipeTree.get_path_in_recipe(folder_name))
+        msg = ''
+        if modified_file_count > 0:
+            modified_file_names.sort()
+            if len(msg) > 0:
+                msg += '\n'
+            msg += '%d files are modified:' % modified_file_count + '\n' + '\n'.join(modified_file_names) + '\n'
+        if local_file_count > 0:
+            local_file_names.sort()
+            if len(msg) > 0:
+                msg += '\n'
+            msg += '%d files are local only:' % local_file_count + '\n' + '\n'.join(local_file_names) + '\n'
+        if local_folder_count > 0:
+            local_folder_names.sort()
+            if len(msg) > 0:
+                msg += '\n'
+            msg += '%d directories are local only:' % local_folder_count + '\n' + '\n'.join(local_folder_names) + '\n'
+        if remote_file_count > 0:
+            remote_file_names.sort()
+            if len(msg) > 0:
+                msg += '\n'
+            msg += '%d files are remote only:' % remote_file_count + '\n' + '\n'.join(remote_file_names) + '\n'
+        if remote_folder_count > 0:
+            remote_folder_names.sort()
+            if len(msg) > 0:
+                msg += '\n'
+            msg += '%d directories are remote only:' % remote_folder_count + '\n' + '\n'.join(remote_folder_names) + '\n'
+        if same_file_count > 0:
+            if len(msg) > 0:
+                msg += '\n'
+            msg += '%d files are unchanged' % same_file_count + '\n'
+        return msg
+
     @staticmethod
     @check_api_param_decorator
-    def recipe_status(dk_api, kitchen, recipe, recipe_path_param=None):
+    def recipe_status(dk_api, kitchen, recipe, recipe_path_param=None, cached=False):
+        """
+        :param cached: bool -- compare with the remote tree kept by the last status, without asking the server
+        """
         if recipe_path_param is None:
             recipe_path_to_use = os.getcwd()
         else:
             if os.path.isdir(recipe_path_param) is False:
                 return 'ERROR: DKCloudCommandRunner path (%s) does not exist' % recipe_path_param
             recipe_path_to_use = recipe_path_param
-        rc = dk_api.recipe_status(kitchen, recipe, recipe_path_to_use)
+        rc = dk_api.recipe_status(kitchen, recipe, recipe_path_to_use, cached=cached)
         if not rc.ok():
             rc.set_message('DKCloudCommand.recipe_status failed\nmessage: %s' % rc.get_message())
             return rc
         else:
-            rl = rc.get_payload()
-            same_file_count = 0
-            if len(rl['same']) > 0:
-                for folder_name, folder_contents in rl['same'].items():
-                    same_file_count += len(folder_contents)
-
-            modified_file_names = list()
-            modified_file_count = 0
-            if len(rl['different']) > 0:
-                for folder_name, folder_contents in rl['different'].items():
-                    for this_file in folder_contents:
-                        modified_file_names.append(
-                            '\t' + os.path.join(os.sep.join(folder_name.split(os.sep)[1:]), this_file['filename']))
-                        modified_file_count += 1
-
-            local_file_names = list()
-            local_file_count = 0
-            local_folder_names = list()
-            local_folder_count = 0
-            if len(rl['only_local']) > 0:
-                for folder_name, folder_contents in rl['only_local'].items():
-                    if len(folder_contents) > 0:
-                        for this_file in folder_contents:
-                            local_file_names.append(
-                                '\t' + os.path.join(os.sep.join(folder_name.split(os.sep)[1:]), this_file['filename']))
-                            local_file_count += 1
-                    else:
-                        local_folder_count += 1
-                        local_folder_names.append(
-                            '\t' + os.sep.join(folder_name.split(os.sep)[1:]))
-
-            remote_file_names = list()
-            remote_file_count = 0
-            remote_folder_count = 0
-            remote_folder_names = list()
-            if len(rl['only_remote']) > 0:
-                for folder_name, folder_contents in rl['only_remote'].items():
-                    if len(folder_contents) > 0:
-                        for this_file in folder_contents:
-                            remote_file_names.append(
-                                '\t' + os.path.join(os.sep.join(folder_name.split(os.sep)[1:]), this_file['filename']))
-                            remote_file_count += 1
-                    else:
-                        remote_folder_count += 1
-                        remote_folder_names.append(
-                            '\t' + os.sep.join(folder_name.split(os.sep)[1:]))
-            msg = ''
-            if modified_file_count > 0:
-                modified_file_names.sort()
-                if len(msg) > 0:
-                    msg += '\n'
-                msg += '%d files are modified:' % modified_file_count + '\n' + '\n'.join(modified_file_names) + '\n'
-            if local_file_count > 0:
-                local_file_names.sort()
-                if len(msg) > 0:
-                    msg += '\n'
-                msg += '%d files are local only:' % local_file_count + '\n' + '\n'.join(local_file_names) + '\n'
-            if local_folder_count > 0:
-                local_folder_names.sort()
-                if len(msg) > 0:
-                    msg += '\n'
-                msg += '%d directories are local only:' % local_folder_count + '\n' + '\n'.join(local_folder_names) + '\n'
-            if remote_file_count > 0:
-                remote_file_names.sort()
-                if len(msg) > 0:
-                    msg += '\n'
-                msg += '%d files are remote only:' % remote_file_count + '\n' + '\n'.join(remote_file_names) + '\n'
-            if remote_folder_count > 0:
-                remote_folder_names.sort()
-                if len(msg) > 0:
-                    msg += '\n'
-                msg += '%d directories are remote only:' % remote_folder_count + '\n' + '\n'.join(remote_folder_names) + '\n'
-            if same_file_count > 0:
-                if len(msg) > 0:
-                    msg += '\n'
-                msg += '%d files are unchanged' % same_file_count + '\n'
+            msg = DKCloudCommandRunner._get_recipe_status_message(rc.get_payload())
+            if cached:
+                snapshot = DKRecipeDisk.read_remote_tree(
+                    DKKitchenDisk.get_recipe_meta_dir(recipe, recipe_path_to_use), kitchen, recipe)
+                if snapshot is not None:
+                    msg = 'Versus the remote tree as of %s, the server was not asked.\n\n' % datetime.fromtimestamp(
+                        snapshot['time']).strftime('%Y-%m-%d %H:%M:%S') + msg
             rc.set_message(msg)
             return rc
 
     @staticmethod
     @check_api_param_decorator
-    def update_all_files(dk_api, kitchen, recipe_name, recipe_dir, message, dryrun=False):
+    def kitchen_status(dk_api, kitchen, kitchen_dir=None, cached=False):
+        """
+        The status of every recipe folder of the kitchen on disk, in one go.
+        :param kitchen_dir: string -- the root of the kitchen folder, the current one when None
+        :param cached: bool -- compare with the remote trees kept by the last status, without asking the server
+        :rtype: DKReturnCode -- the payload is {recipe: status}, see DKCloudAPI.recipe_status
+        """
+        rc, statuses, failed = DKCloudCommandRunner._get_kitchen_statuses(dk_api, kitchen, kitchen_dir, cached)
+        if statuses is None:
+            return rc
+        msg = ''
+        changed_count = 0
+        for recipe, rl in sorted(statuses.items()):
+            if DKCloudCommandRunner._has_changes(rl):
+                changed_count += 1
+            msg += "Recipe '%s':\n%s\n" % (recipe, DKCloudCommandRunner._get_recipe_status_message(rl))
+        msg += '%d of %d recipes have changes\n' % (changed_count, len(statuses) + len(failed))
+        if len(failed) > 0:
+            rc.set(rc.DK_FAIL, msg + '%d recipes failed:\n%s\n' % (len(failed), '\n'.join(failed)), statuses)
+        else:
+            rc.set(rc.DK_SUCCESS, msg, statuses)
+        return rc
+
+    @staticmethod
+    @check_api_param_decorator
+    def kitchen_update(dk_api, kitchen, message, kitchen_dir=None, dryrun=False):
+        """
+        Sends the changed files of every recipe folder of the kitchen on disk, see update_all_files. The statuses of
+        all recipes are computed together, see kitchen_status, then the recipes with changes are updated one after
+        the other.
+        :rtype: DKReturnCode
+        """
+        rc, statuses, failed = DKCloudCommandRunner._get_kitchen_statuses(dk_api, kitchen, kitchen_dir)
+        if statuses is None:
+            return rc
+        if kitchen_dir is None:
+            kitchen_dir = DKKitchenDisk.find_kitchen_root_dir()
+        msg = ''
+        updated_count = 0
+        cwd = os.getcwd()
+        try:
+            for recipe, rl in sorted(statuses.items()):
+                if not DKCloudCommandRunner._has_changes(rl):
+                    continue
+                recipe_dir = os.path.join(kitchen_dir, recipe)
+                # the files to send are paths relative to the recipe folder
+                os.chdir(recipe_dir)
+                recipe_rc = DKCloudCommandRunner.update_all_files(dk_api, kitchen, recipe, recipe_dir, message, dryrun,
+                                                                  status=rl)
+                if recipe_rc.ok():
+                    updated_count += 1
+                    msg += "Recipe '%s':\n%s\n" % (recipe, recipe_rc.get_message())
+                else:
+                    failed.append('\t%s: %s' % (recipe, recipe_rc.get_message().strip()))
+        finally:
+            os.chdir(cwd)
+        if dryrun:
+            msg += '%d of %d recipes would be updated\n' % (updated_count, len(statuses) + len(failed))
+        else:
+            msg += '%d of %d recipes updated\n' % (updated_count, len(statuses) + len(failed))
+        if len(failed) > 0:
+            rc.set(rc.DK_FAIL, msg + '%d recipes failed:\n%s\n' % (len(failed), '\n'.join(failed)))
+        else:
+            rc.set(rc.DK_SUCCESS, msg)
+        return rc
+
+    @staticmethod
+    def _has_changes(rl):
+        return len(rl['different']) + len(rl['only_local']) + len(rl['only_remote']) > 0
+
+    @staticmethod
+    def _get_kitchen_statuses(dk_api, kitchen, kitchen_dir=None, cached=False):
+        """
+        The remote trees of all the recipe folders are fetched concurrently over the session's connections, while
+        the recipes are hashed on one pool of disk workers, then compared.
+        :rtype: (DKReturnCode, dict, list) -- the statuses, {recipe: status}, None when there is no kitchen folder,
+            and the messages of the recipes that failed
+        """
+        rc = DKReturnCode()
+        if kitchen is None or len(kitchen) == 0:
+            rc.set(rc.DK_FAIL, 'DKCloudCommandRunner bad parameters - kitchen')
+            return rc, None, None
+        if kitchen_dir is None:
+            kitchen_dir = DKKitchenDisk.find_kitchen_root_dir()
+        recipes = DKKitchenDisk.find_available_recipes(kitchen_dir) if kitchen_dir is not None else None
+        if recipes is None:
+            rc.set(rc.DK_FAIL, 'This operation is only available under a kitchen')
+            return rc, None, None
+        recipes = sorted(recipe for recipe in recipes if os.path.isdir(os.path.join(kitchen_dir, recipe)))
+        if len(recipes) == 0:
+            rc.set(rc.DK_SUCCESS, 'No recipe folder found in disk.\n', dict())
+            return rc, None, None
+
+        config = dk_api.get_config()
+        use_git_index = config is not None and config.get_use_git_index()
+        async_api = AsyncDKCloudAPI(dk_api)
+        executor = ThreadPoolExecutor(max_workers=DKCloudCommandRunner.MAX_DISK_WORKERS)
+        try:
+            local_futures = [executor.submit(get_directory_sha, os.path.join(kitchen_dir, recipe), use_git_index)
+                             for recipe in recipes]
+            tree_rcs = async_api.run_all([('get_remote_tree', (kitchen, recipe, os.path.join(kitchen_dir, recipe),
+                                                               cached)) for recipe in recipes])
+            statuses = dict()
+            failed = list()
+            for recipe, tree_rc, local_future in zip(recipes, tree_rcs, local_futures):
+                try:
+                    local_sha = local_future.result()
+                except (IOError, OSError) as e:
+                    failed.append('\t%s: %s' % (recipe, str(e)))
+                    continue
+                if not tree_rc.ok():
+                    failed.append('\t%s: %s' % (recipe, tree_rc.get_message()))
+                    continue
+                statuses[recipe] = compare_sha(tree_rc.get_payload(), local_sha)
+        finally:
+            async_api.close()
+            executor.shutdown()
+        return rc, statuses, failed
+
+    @staticmethod
+    @check_api_param_decorator
+    def update_all_files(dk_api, kitchen, recipe_name, recipe_dir, message, dryrun=False, status=None):
         """
         reutrns a string.
+
+        The changes are journaled in the recipe meta dir as the server confirms them, so when an update is
+        interrupted, running it again sends only what is left, see DKUpdateJournal.
         :param dk_api: -- api object
         :param kitchen: string
         :param recipe_name: string  -- kitchen name, string
         :param recipe_dir: string - path to the root of the directory
         :param message: string message -- commit message, string
+        :param status: dict -- the recipe status already computed, see DKCloudAPI.recipe_status
         :rtype: DKReturnCode
         """
         rc = DKReturnCode()
@@ -766,35 +980,82 @@ class DKCloudCommandRunner(object):
             rc.set(rc.DK_FAIL, s)
             return rc
 
-        rc = dk_api.recipe_status(kitchen, recipe_name, recipe_dir)
-        if not rc.ok():
-            rs = 'DKCloudCommand.update_all_files failed\nmessage: %s' % rc.get_message()
-            rc.set_message(rs)
-            return rc
+        journal = None
+        plan = None
+        done = set()
+        base_shas = None
+        resume_msg = ''
+        if not dryrun:
+            check_dir = recipe_dir if recipe_dir is not None else os.getcwd()
+            recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir(recipe_name, check_dir)
+            if recipe_meta_dir is not None and os.path.isdir(recipe_meta_dir):
+                journal = DKUpdateJournal(recipe_meta_dir)
+                snapshot = DKUpdateJournal.take_snapshot(check_dir)
+                plan, done = journal.resume(kitchen, recipe_name, snapshot)
+                if plan is not None:
+                    planned_count = sum(len(plan[op]) for op in DKUpdateJournal.OPS)
+                    resume_msg = 'Resuming an interrupted update, %d of %d changes were already sent.\n' % (
+                        len(done), planned_count)
+                else:
+                    done = set()
 
-        rl = rc.get_payload()
-        if (len(rl['different']) + len(rl['only_local']) + len(rl['only_remote'])) == 0:
-            rs = 'DKCloudCommand.update_all_files no files changed.'
-            rc.set_message(rs)
-            return rc
+        if plan is None:
+            if status is None:
+                rc = dk_api.recipe_status(kitchen, recipe_name, recipe_dir)
+                if not rc.ok():
+                    rs = 'DKCloudCommand.update_all_files failed\nmessage: %s' % rc.get_message()
+                    rc.set_message(rs)
+                    return rc
+                rl = rc.get_payload()
+            else:
+                rl = status
+            if (len(rl['different']) + len(rl['only_local']) + len(rl['only_remote'])) == 0:
+                rs = 'DKCloudCommand.update_all_files no files changed.'
+                rc.set_message(rs)
+                return rc
 
-        rc = DKCloudCommandRunner._update_changed_files(dk_api, rl['different'], kitchen, recipe_name, message, dryrun)
-        if not rc.ok():
-            return rc
-        msg_differences = rc.get_message()
+            files_to_delete, msg_delete_folders = DKCloudCommandRunner._get_files_to_delete(dk_api, rl['only_remote'],
+                                                                                            kitchen, recipe_name)
+            # the server's shas of the changed files, so they can be sent as deltas, see DKCloudAPI.upload_file
+            base_shas = dict((RecipeTree.get_path_in_recipe(folder, remote_file['filename']), remote_file['sha'])
+                             for folder, remote_files in rl['different'].items() for remote_file in remote_files)
+            plan = {DKUpdateJournal.UPDATE: DKCloudCommandRunner._get_files_to_update(rl['different']),
+                    DKUpdateJournal.ADD: DKCloudCommandRunner._get_files_to_add(rl['only_local']),
+                    DKUpdateJournal.DELETE: files_to_delete}
+            if journal is not None:
+                journal.start(kitchen, recipe_name, plan, snapshot)
+        else:
+            msg_delete_folders = ''
 
-        rc = DKCloudCommandRunner._add_new_files(dk_api, rl['only_local'], kitchen, recipe_name, message, dryrun)
-        if not rc.ok():
-            return rc
-        msg_additions = rc.get_message()
+        try:
+            rc = DKCloudCommandRunner._apply_file_changes(dk_api, DKUpdateJournal.UPDATE, plan[DKUpdateJournal.UPDATE],
+                                                          kitchen, recipe_name, message, dryrun, journal, done,
+                                                          base_shas=base_shas)
+            if not rc.ok():
+                return rc
+            msg_differences = rc.get_message()
 
-        rc = DKCloudCommandRunner._remove_deleted_files(dk_api, rl['only_remote'], kitchen, recipe_name, message,
-                                                        dryrun)
-        if not rc.ok():
-            return rc
-        msg_deletions = rc.get_message()
+            rc = DKCloudCommandRunner._apply_file_changes(dk_api, DKUpdateJournal.ADD, plan[DKUpdateJournal.ADD],
+                                                          kitchen, recipe_name, message, dryrun, journal, done)
+            if not rc.ok():
+                return rc
+            msg_additions = rc.get_message()
 
-        msg = ''
+            rc = DKCloudCommandRunner._apply_file_changes(dk_api, DKUpdateJournal.DELETE, plan[DKUpdateJournal.DELETE],
+                                                          kitchen, recipe_name, message, dryrun, journal, done)
+            if not rc.ok():
+                rc.set_message(msg_delete_folders + rc.get_message())
+                return rc
+            msg_deletions = rc.get_message()
+            if len(msg_deletions) == 0:
+                msg_deletions = msg_delete_folders
+        finally:
+            if journal is not None:
+                journal.close()
+        if journal is not None:
+            journal.clear()
+
+        msg = resume_msg
         if len(msg_differences) > 0:
             if len(msg) > 0:
                 msg += '\n'
@@ -810,8 +1071,70 @@ class DKCloudCommandRunner(object):
         rc.set_message(msg)
         return rc
 
+    @staticmethod
+    def _apply_file_changes(dk_api, op, files, kitchen, recipe_name, message, dryrun=False, journal=None, done=(),
+                            base_shas=None):
+        """
+        Sends the updates, additions or deletions of files, skipping the ones already in done.
+        :param op: 'update', 'add' or 'delete'
+        :param done: set of (op, path) already confirmed by the server
+        :param base_shas: dict -- {path: sha on the server} of the files to update, see update_file
+        :rtype: DKReturnCode
+        """
+        send = {DKUpdateJournal.UPDATE: DKCloudCommandRunner.update_file,
+                DKUpdateJournal.ADD: DKCloudCommandRunner.add_file,
+                DKUpdateJournal.DELETE: DKCloudCommandRunner.delete_file}[op]
+        tabbed_file_names = list()
+        # the bases of the next delta updates go to the blob cache in one write
+        dk_api.hold_blobs()
+        try:
+            for the_file in files:
+                tabbed_file_names.append('\t' + the_file)
+                if dryrun or (op, the_file) in done:
+                    continue
+                if op == DKUpdateJournal.UPDATE:
+                    rc = send(dk_api, kitchen, recipe_name, message, the_file, base_shas=base_shas)
+                else:
+                    rc = send(dk_api, kitchen, recipe_name, message, the_file)
+                if not rc.ok():
+                    rc.set_message('\n' + rc.get_message())
+                    return rc
+                if journal is not None:
+                    journal.record(op, the_file)
+        finally:
+            dk_api.flush_blobs()
+
+        msg = ''
+        if len(files) > 0:
+            past = {DKUpdateJournal.UPDATE: 'updated', DKUpdateJournal.ADD: 'added',
+                    DKUpdateJournal.DELETE: 'deleted'}[op]
+            if dryrun:
+                msg_header = '%d files will be %s:\n' % (len(files), past)
+            else:
+                msg_header = '%d files %s:\n' % (len(files), past)
+            tabbed_file_names.sort()
+            msg = msg_header + '\n'.join(tabbed_file_names)
+
+        rc = DKReturnCode()
+        rc.set(DKReturnCode.DK_SUCCESS, msg)
+        return rc
+
     @staticmethod
     def _remove_deleted_files(dk_api, deleted_files, kitchen, recipe_name, message, dryrun=False):
+        files_to_delete, msg = DKCloudCommandRunner._get_files_to_delete(dk_api, deleted_files, kitchen, recipe_name)
+        rc = DKCloudCommandRunner._apply_file_changes(dk_api, DKUpdateJournal.DELETE, files_to_delete, kitchen,
+                                                      recipe_name, message, dryrun)
+        if not rc.ok():
+            rc.set_message(msg + rc.get_message())
+        elif len(rc.get_message()) == 0:
+            rc.set_message(msg)
+        return rc
+
+    @staticmethod
+    def _get_files_to_delete(dk_api, deleted_files, kitchen, recipe_name):
+        """
+        :rtype: (list, str) -- the paths to delete, and a message about the folders that could not be expanded
+        """
         msg = ''
         ig = DKIgnore()
         files_to_delete = list()
@@ -823,43 +1146,19 @@ class DKCloudCommandRunner(object):
                 folders_to_delete.append(folder_path)
             else:
                 for file_to_delete in folder_contents:
-                    file_path = os.path.join(os.sep.join(folder_path.split(os.sep)[1:]), file_to_delete['filename'])
+                    file_path = RecipeTree.get_path_in_recipe(folder_path, file_to_delete['filename'])
                     files_to_delete.append(file_path)
 
+        if len(folders_to_delete) == 0:
+            return files_to_delete, msg
         tree_rc = dk_api.recipe_tree(kitchen, recipe_name)
         if tree_rc.ok():
-            recipe_tree = tree_rc.get_payload()
+            recipe_tree = RecipeTree.from_tree(tree_rc.get_payload(), recipe_name)
             for folder_to_delete in folders_to_delete:
-                if folder_to_delete in recipe_tree:
-                    files_in_folder = recipe_tree[folder_to_delete]
-                    for file_to_delete in files_in_folder:
-                        file_path = os.path.join(os.sep.join(folder_to_delete.split(os.sep)[1:]),
-                                                 file_to_delete['filename'])
-                        files_to_delete.append(file_path)
+                files_to_delete.extend(recipe_tree.get_files_in_folder(RecipeTree.get_path_in_recipe(folder_to_delete)))
         else:
             msg += 'Unable to delete files in some folders %s' % "".join([str(x) for x in folders_to_delete])
-
-        if len(files_to_delete) > 0:
-            tabbed_file_names = list()
-            for file_to_delete in files_to_delete:
-                tabbed_file_names.append('\t' + file_to_delete)
-                if not dryrun:
-                    rc = DKCloudCommandRunner.delete_file(dk_api, kitchen, recipe_name, message, file_to_delete)
-                    if not rc.ok():
-                        rc.set_message(msg + '\n' + rc.get_message())
-                        return rc
-
-            if dryrun:
-                header_msg = '%d files will be deleted:\n' % len(files_to_delete)
-            else:
-                header_msg = '%d files deleted:\n' % len(files_to_delete)
-
-            tabbed_file_names.sort()
-            msg = header_msg + '\n'.join(tabbed_file_names)
-
-        rc = DKReturnCode()
-        rc.set(DKReturnCode.DK_SUCCESS, msg)
-        return rc
+        return files_to_delete, msg
 
     @staticmethod
     def _add_files_in_folder(dk_api, start_folder, kitchen, recipe_name, message, dryrun=False):
@@ -881,12 +1180,17 @@ class DKCloudCommandRunner(object):
 
     @staticmethod
     def _add_new_files(dk_api, new_files, kitchen, recipe_name, message, dryrun=False):
-        msg = ''
+        files_to_add = DKCloudCommandRunner._get_files_to_add(new_files)
+        return DKCloudCommandRunner._apply_file_changes(dk_api, DKUpdateJournal.ADD, files_to_add, kitchen,
+                                                        recipe_name, message, dryrun)
+
+    @staticmethod
+    def _get_files_to_add(new_files):
         ig = DKIgnore()
 
         files_to_add = list()
         for folder_path, folder_contents in new_files.items():
-            folder_path_wo_recipe = os.sep.join(folder_path.split(os.sep)[1:])
+            folder_path_wo_recipe = RecipeTree.get_path_in_recipe(folder_path)
             if ig.ignore(folder_path):
                 continue
 
@@ -902,35 +1206,18 @@ class DKCloudCommandRunner(object):
                     if ig.ignore(local_file_path):
                         continue
                     files_to_add.append(local_file_path)
-
-        tabbed_file_names = list()
-        for file_to_add in files_to_add:
-            tabbed_file_names.append('\t' + file_to_add)
-            if not dryrun:
-                rc = DKCloudCommandRunner.add_file(dk_api, kitchen, recipe_name, message, file_to_add)
-                if not rc.ok():
-                    rc.set_message(msg + '\n' + rc.get_message())
-                    return rc
-
-        if len(files_to_add) > 0:
-            if dryrun:
-                header_msg = '%d files will be added:\n' % len(files_to_add)
-            else:
-                header_msg = '%d files added:\n' % len(files_to_add)
-
-            tabbed_file_names.sort()
-            msg = header_msg + '\n'.join(tabbed_file_names)
-
-        rc = DKReturnCode()
-        rc.set(DKReturnCode.DK_SUCCESS, msg)
-        return rc
+        return files_to_add
 
     @staticmethod
     def _update_changed_files(dk_api, changed_files, kitchen, recipe_name, message, dryrun=False):
-        msg = ''
+        files_to_update = DKCloudCommandRunner._get_files_to_update(changed_files)
+        return DKCloudCommandRunner._apply_file_changes(dk_api, DKUpdateJournal.UPDATE, files_to_update, kitchen,
+                                                        recipe_name, message, dryrun)
+
+    @staticmethod
+    def _get_files_to_update(changed_files):
         ig = DKIgnore()
-        updated_file_count = 0
-        tabbed_file_names = list()
+        files_to_update = list()
         for folder_path, folder_contents in changed_files.items():
             if ig.ignore(folder_path):
                 continue
@@ -939,33 +1226,15 @@ class DKCloudCommandRunner(object):
                 raise
             else:
                 for changed_file in folder_contents:
-                    local_file = os.path.join(os.sep.join(folder_path.split(os.sep)[1:]), changed_file['filename'])
+                    local_file = RecipeTree.get_path_in_recipe(folder_path, changed_file['filename'])
                     if ig.ignore(local_file):
                         continue
-                    updated_file_count += 1
-                    tabbed_file_names.append('\t' + local_file)
-                    if not dryrun:
-                        rc = DKCloudCommandRunner.update_file(dk_api, kitchen, recipe_name, message, local_file)
-                        if not rc.ok():
-                            rc.set_message(msg + '\n' + rc.get_message())
-                            return rc
-
-        if updated_file_count > 0:
-            if dryrun:
-                msg_header = '%d files will be updated:\n' % updated_file_count
-            else:
-                msg_header = '%d files updated:\n' % updated_file_count
-
-            tabbed_file_names.sort()
-            msg = msg_header + '\n'.join(tabbed_file_names)
-
-        rc = DKReturnCode()
-        rc.set(DKReturnCode.DK_SUCCESS, msg)
-        return rc
+                    files_to_update.append(local_file)
+        return files_to_update
 
     @staticmethod
     @check_api_param_decorator
-    def update_file(dk_api, kitchen, recipe_name, message, files_to_update_param):
+    def update_file(dk_api, kitchen, recipe_name, message, files_to_update_param, base_shas=None):
         """
         reutrns a string.
         :param dk_api: -- api object
@@ -973,6 +1242,7 @@ class DKCloudCommandRunner(object):
         :param recipe_name: string  -- kitchen name, string
         :param message: string message -- commit message, string
         :param files_to_update_param: string  -- file system directory where the recipe file lives
+        :param base_shas: dict -- {file: its sha on the server}, when known a file is sent as a delta if it can be
         :rtype: string
         """
         rc = DKReturnCode()
@@ -989,22 +1259,15 @@ class DKCloudCommandRunner(object):
 
         msg = ''
         for file_to_update in files_to_update:
-            try:
-                with open(file_to_update, 'r') as f:
-                    file_contents = f.read()
-            except IOError as e:
-                if len(msg) != 0:
-                    msg += '\n'
-                msg += '%s' % (str(e))
-                rc.set(rc.DK_FAIL, msg)
-                return rc
-            except ValueError as e:
+            if not os.path.isfile(file_to_update):
                 if len(msg) != 0:
                     msg += '\n'
-                msg += 'ERROR: %s' % e.message
+                msg += "'%s' does not exist" % file_to_update
                 rc.set(rc.DK_FAIL, msg)
                 return rc
-            rc = dk_api.update_file(kitchen, recipe_name, message, file_to_update, file_contents)
+            # streamed from disk, in parts when it is large or binary
+            base_sha = base_shas.get(file_to_update) if base_shas is not None else None
+            rc = dk_api.upload_file(kitchen, recipe_name, message, file_to_update, file_to_update, base_sha=base_sha)
             if not rc.ok():
                 if len(msg) != 0:
                     msg += '\n'
@@ -1048,14 +1311,7 @@ class DKCloudCommandRunner(object):
             rc.set(rc.DK_FAIL, s)
             return rc
 
-        try:
-            with open(api_file_key, 'r') as f:
-                file_contents = f.read()
-        except ValueError as e:
-            s = 'ERROR: %s' % e.message
-            rc.set(rc.DK_FAIL, s)
-            return rc
-        rc = dk_api.add_file(kitchen, recipe_name, message, api_file_key, file_contents)
+        rc = dk_api.upload_file(kitchen, recipe_name, message, api_file_key, api_file_key, add=True)
         if rc.ok():
             rs = 'DKCloudCommand.add_file for %s succeed' % api_file_key
         else:
@@ -1099,6 +1355,32 @@ class DKCloudCommandRunner(object):
         rc.set_message(msg)
         return rc
 
+    @staticmethod
+    def watch_recipe(dk_api, kitchen, recipe_name, recipe_dir, message, debounce=DKRecipeWatcher.DEFAULT_DEBOUNCE,
+                     poll_interval=DKRecipeWatcher.DEFAULT_POLL_INTERVAL, use_inotify=True):
+        """
+        Pushes the files of the recipe as they change, until Ctrl-C. See DKRecipeWatcher.
+        :param dk_api: -- api object
+        :param kitchen: string
+        :param recipe_name: string
+        :param recipe_dir: string - path to the root of the recipe
+        :param message: string -- change message of every update
+        :rtype: DKReturnCode
+        """
+        rc = DKReturnCode()
+        if kitchen is None or recipe_name is None or recipe_dir is None or message is None:
+            rc.set(rc.DK_FAIL, 'ERROR: DKCloudCommandRunner bad input parameters')
+            return rc
+        watcher = DKRecipeWatcher(dk_api, kitchen, recipe_name, recipe_dir, message, debounce, poll_interval,
+                                  use_inotify)
+        rc = watcher.start()
+        if not rc.ok():
+            return rc
+        print(rc.get_message())
+        watcher.run()
+        rc.set(rc.DK_SUCCESS, 'Stopped watching recipe %s' % recipe_name)
+        return rc
+
     @staticmethod
     @check_api_param_decorator
     def watch_active_servings(dk_api, kitchen, period):
@@ -1144,16 +1426,17 @@ class DKCloudCommandRunner(object):
 
     @staticmethod
     @check_api_param_decorator
-    def get_compiled_serving(dk_api, kitchen, recipe_name, variation_name):
+    def get_compiled_serving(dk_api, kitchen, recipe_name, variation_name, use_cache=True):
         """
         returns a string.
         :param dk_api: -- api object
         :param kitchen: string
         :param recipe_name: string  -- kitchen name, string
         :param variation_name: string -- name of the recipe variation_name to be used
+        :param use_cache: boolean -- False to bypass the local compiled serving cache
         :rtype: DKReturnCode
         """
-        rc = dk_api.get_compiled_serving(kitchen, recipe_name, variation_name)
+        rc = dk_api.get_compiled_serving(kitchen, recipe_name, variation_name, use_cache)
         if rc.ok():
             rs = 'DKCloudCommand.get_compiled_serving succeeded %s\n' % json.dumps(rc.get_payload(), indent=4)
         else:
@@ -1257,29 +1540,121 @@ class DKCloudCommandRunner(object):
         return md
 
     @staticmethod
-    def write_recipe_merge_conflicts(merge_info, recipe_name_param, kitchen_dir):
+    @check_api_param_decorator
+    def preview_merge_kitchens(dk_api, from_kitchen, to_kitchen):
+        """
+        Reports what a merge of from_kitchen into to_kitchen would touch, from the recipe trees of both kitchens,
+        without running the merge on the server. Files whose shas differ are where conflicts can happen.
+        :rtype: DKReturnCode -- the payload is {recipe: {'different': [paths], 'only_source': [paths],
+            'only_target': [paths]}}, only for the recipes with differences
+        """
+        rc = DKReturnCode()
+        async_api = AsyncDKCloudAPI(dk_api)
+        try:
+            list_rcs = async_api.run_all([('list_recipe', (from_kitchen,)), ('list_recipe', (to_kitchen,))])
+            for kitchen, list_rc in zip([from_kitchen, to_kitchen], list_rcs):
+                if not list_rc.ok():
+                    rc.set(rc.DK_FAIL, 'preview_merge_kitchens: unable to list the recipes of %s\nmessage: %s' %
+                           (kitchen, list_rc.get_message()))
+                    return rc
+            source_recipes = set(list_rcs[0].get_payload())
+            target_recipes = set(list_rcs[1].get_payload())
+            common_recipes = sorted(source_recipes & target_recipes)
+
+            calls = list()
+            for recipe in common_recipes:
+                calls.append(('recipe_tree', (from_kitchen, recipe)))
+                calls.append(('recipe_tree', (to_kitchen, recipe)))
+            tree_rcs = async_api.run_all(calls)
+        finally:
+            async_api.close()
+
+        preview = dict()
+        for i, recipe in enumerate(common_recipes):
+            source_rc, target_rc = tree_rcs[2 * i], tree_rcs[2 * i + 1]
+            if not source_rc.ok() or not target_rc.ok():
+                failed_rc = source_rc if not source_rc.ok() else target_rc
+                rc.set(rc.DK_FAIL, 'preview_merge_kitchens: unable to get the tree of recipe %s\nmessage: %s' %
+                       (recipe, failed_rc.get_message()))
+                return rc
+            # the target plays the remote, the source the local side
+            compared = RecipeTree.from_tree(target_rc.get_payload(), recipe).compare(
+                RecipeTree.from_tree(source_rc.get_payload(), recipe))
+            recipe_preview = {'different': compared['different'], 'only_source': compared['only_local'],
+                              'only_target': compared['only_remote']}
+            if any(len(paths) > 0 for paths in recipe_preview.values()):
+                preview[recipe] = recipe_preview
+
+        msg = "Merge preview of kitchen '%s' into kitchen '%s', from the recipe trees (nothing was merged)\n" % (
+            from_kitchen, to_kitchen)
+        if len(source_recipes - target_recipes) > 0:
+            msg += "Recipes only in '%s', merged as new: %s\n" % (from_kitchen,
+                                                                 ', '.join(sorted(source_recipes - target_recipes)))
+        if len(target_recipes - source_recipes) > 0:
+            msg += "Recipes only in '%s': %s\n" % (to_kitchen, ', '.join(sorted(target_recipes - source_recipes)))
+        different_count = 0
+        for recipe, recipe_preview in sorted(preview.items()):
+            msg += "Recipe '%s'\n" % recipe
+            for key, title in [('different', 'differ, conflicts are possible'),
+                               ('only_source', "only in '%s'" % from_kitchen),
+                               ('only_target', "only in '%s'" % to_kitchen)]:
+                if len(recipe_preview[key]) > 0:
+                    msg += '\t%d files %s:\n' % (len(recipe_preview[key]), title)
+                    msg += ''.join('\t\t%s\n' % path for path in recipe_preview[key])
+            different_count += len(recipe_preview['different'])
+        msg += '%d files differ in %d of %d common recipes\n' % (different_count, len(preview), len(common_recipes))
+        rc.set(rc.DK_SUCCESS, msg, preview)
+        return rc
+
+    @staticmethod
+    def write_recipe_merge_conflicts(merge_info, recipe_name_param, kitchen_dir, executor=None):
+        """
+        Writes the conflicted files of one recipe, decoding and writing them concurrently on executor
+        (a pool of its own when None), and records them all in the recipe conflicts with one write.
+        """
         rc = DKReturnCode()
         if recipe_name_param not in merge_info['conflicts']:
             rc.set(rc.DK_FAIL,
                    "DKCloudCommandRunner.write_recipe_merge_conflicts: Can't find conflicts for recipe %s." % recipe_name_param)
             return rc
         recipe_conflicts = merge_info['conflicts'][recipe_name_param]
+        to_write = list()
         for folder_name, folder_contents in recipe_conflicts.items():
             folder_fullpath = os.path.join(kitchen_dir, folder_name)
             for conflict in folder_contents:
                 file_fullpath = os.path.join(folder_fullpath, conflict['filename'])
-                if 'conflict_tags' in conflict:
-                    with open(file_fullpath, 'w') as conflict_file:
-                        conflict_file.write(base64.b64decode(conflict['conflict_tags']))
-                    if not DKRecipeDisk.add_conflict_to_conflicts_meta(conflict, folder_name, recipe_name_param,
-                                                                       kitchen_dir):
-                        rc.set(rc.DK_FAIL,
-                               "DKCloudCommandRunner.write_recipe_merge_conflicts: Unable to write out conflict meta for %s" % file_fullpath)
-                        return rc
-                else:
+                if 'conflict_tags' not in conflict:
                     rc.set(rc.DK_FAIL,
                            "DKCloudCommandRunner.write_recipe_merge_conflicts: Can't find conflict tags for %s" % file_fullpath)
                     return rc
+                to_write.append((folder_name, conflict, file_fullpath))
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=DKCloudCommandRunner.MAX_DISK_WORKERS)
+        conflict_store = DKRecipeDisk.get_conflict_store(recipe_name_param, kitchen_dir)
+        failed = list()
+        try:
+            futures = [executor.submit(DKRecipeDisk.write_base64_file, file_fullpath, conflict['conflict_tags'])
+                       for folder_name, conflict, file_fullpath in to_write]
+            for (folder_name, conflict, file_fullpath), future in zip(to_write, futures):
+                try:
+                    future.result()
+                except (IOError, OSError, ValueError) as e:
+                    failed.append('%s: %s' % (file_fullpath, str(e)))
+                    continue
+                conflict_store.add_conflict(conflict, folder_name, recipe_name_param)
+        finally:
+            if own_executor:
+                executor.shutdown()
+        if not conflict_store.save():
+            rc.set(rc.DK_FAIL,
+                   "DKCloudCommandRunner.write_recipe_merge_conflicts: Unable to write out conflict meta for recipe %s" % recipe_name_param)
+            return rc
+        if len(failed) > 0:
+            rc.set(rc.DK_FAIL, "DKCloudCommandRunner.write_recipe_merge_conflicts: Unable to write\n\t%s" %
+                   '\n\t'.join(failed))
+            return rc
 
         rc.set(rc.DK_SUCCESS, "Conflicts for recipe %s written to %s\n" % (
             recipe_name_param, os.path.join(kitchen_dir, recipe_name_param)))
@@ -1315,10 +1690,13 @@ class DKCloudCommandRunner(object):
             rc.set(rc.DK_FAIL, msg % (recipes_not_local, kitchen_dir))
             return rc
 
-        for recipe in local_recipes:
-            recipe_rc = DKCloudCommandRunner.write_recipe_merge_conflicts(merge_info, recipe, kitchen_dir)
-            if not recipe_rc.ok():
-                return recipe_rc
+        # one pool for the files of every recipe, so a merge touching many recipes keeps the disk busy
+        with ThreadPoolExecutor(max_workers=DKCloudCommandRunner.MAX_DISK_WORKERS) as executor:
+            for recipe in sorted(merge_info['conflicts'].keys()):
+                recipe_rc = DKCloudCommandRunner.write_recipe_merge_conflicts(merge_info, recipe, kitchen_dir,
+                                                                              executor)
+                if not recipe_rc.ok():
+                    return recipe_rc
 
         msg = DKCloudCommandRunner.print_merge_conflicts(payload)
         rc.set(rc.DK_SUCCESS, msg + "Conflicts written to disk\n")
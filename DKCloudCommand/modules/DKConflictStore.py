@@ -0,0 +1,191 @@
+import os
+import json
+import re
+import tempfile
+from .DKKitchenDisk import DKKitchenDisk, DK_RECIPES_META_DIR
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+The merge conflicts of one recipe, kept in .dk/recipes/<recipe>/conflicts.json as
+
+    {folder_in_recipe: {'from|to|recipe|folder|filename': {conflict info, 'status': 'unresolved'|'resolved'}}}
+
+The file is read once when the store is opened and written once when it is saved, so a merge touching
+hundreds of files costs one read and one write instead of one of each per conflict. Lookups by status
+and by (from_kitchen, to_kitchen) go through in-memory indexes.
+
+Every save also refreshes the counts of the recipe in the kitchen conflicts index (.dk/conflicts_index.json),
+so kitchen wide checks only open the conflicts.json of recipes that have conflicts.
+
+    with DKConflictStore(recipe_meta_dir) as store:
+        for ...:
+            store.add_conflict(conflict_info, folder_in_recipe, recipe_name)
+    # saved here, only if something changed
+"""
+
+
+class DKConflictStore(object):
+    CONFLICTS_META = 'conflicts.json'
+    UNRESOLVED = 'unresolved'
+    RESOLVED = 'resolved'
+
+    def __init__(self, recipe_meta_dir):
+        self._recipe_meta_dir = recipe_meta_dir
+        self._conflicts = None
+        self._dirty = False
+        self._location = dict()  # conflict key -> folder_in_recipe
+        self._by_status = dict()  # status -> set of conflict keys
+        self._by_kitchens = dict()  # (from_kitchen, to_kitchen) -> set of conflict keys
+
+    def __enter__(self):
+        self.load()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.save()
+        return False
+
+    def get_path(self):
+        return os.path.join(self._recipe_meta_dir, DKConflictStore.CONFLICTS_META)
+
+    def is_dirty(self):
+        return self._dirty
+
+    def load(self):
+        if self._conflicts is not None:
+            return self._conflicts
+        try:
+            with open(self.get_path(), 'r') as conflicts_file:
+                self._conflicts = json.load(conflicts_file)
+        except (IOError, OSError):
+            self._conflicts = dict()
+        self._location = dict()
+        self._by_status = dict()
+        self._by_kitchens = dict()
+        for folder_in_recipe, folder_conflicts in self._conflicts.items():
+            for conflict_key, conflict_info in folder_conflicts.items():
+                self._index(folder_in_recipe, conflict_key, conflict_info)
+        return self._conflicts
+
+    def _index(self, folder_in_recipe, conflict_key, conflict_info):
+        self._location[conflict_key] = folder_in_recipe
+        self._by_status.setdefault(conflict_info.get('status'), set()).add(conflict_key)
+        kitchens = (conflict_info.get('from_kitchen'), conflict_info.get('to_kitchen'))
+        self._by_kitchens.setdefault(kitchens, set()).add(conflict_key)
+
+    def _unindex(self, conflict_key):
+        folder_in_recipe = self._location.pop(conflict_key, None)
+        if folder_in_recipe is None:
+            return
+        conflict_info = self._conflicts[folder_in_recipe][conflict_key]
+        self._by_status.get(conflict_info.get('status'), set()).discard(conflict_key)
+        kitchens = (conflict_info.get('from_kitchen'), conflict_info.get('to_kitchen'))
+        self._by_kitchens.get(kitchens, set()).discard(conflict_key)
+
+    @staticmethod
+    def get_conflict_key(conflict_info, folder_in_recipe, recipe_name):
+        return '%s|%s|%s|%s|%s' % (conflict_info['from_kitchen'], conflict_info['to_kitchen'], recipe_name,
+                                   folder_in_recipe, conflict_info['filename'])
+
+    def add_conflict(self, conflict_info, folder_in_recipe, recipe_name):
+        """
+        Records one unresolved conflict, replacing an earlier one for the same file and kitchens.
+        :rtype: str -- the conflict key
+        """
+        self.load()
+        conflict_key = DKConflictStore.get_conflict_key(conflict_info, folder_in_recipe, recipe_name)
+        conflict_for_save = conflict_info.copy()
+        conflict_for_save['folder_in_recipe'] = folder_in_recipe
+        conflict_for_save['status'] = DKConflictStore.UNRESOLVED
+        self._unindex(conflict_key)
+        self._conflicts.setdefault(folder_in_recipe, dict())[conflict_key] = conflict_for_save
+        self._index(folder_in_recipe, conflict_key, conflict_for_save)
+        self._dirty = True
+        return conflict_key
+
+    def get_conflicts(self, status=None, from_kitchen=None, to_kitchen=None):
+        """
+        :param status: 'unresolved', 'resolved' or None for both
+        :param from_kitchen: only filters when to_kitchen is given too
+        :rtype: dict -- {folder_in_recipe: {conflict_key: conflict_info}}
+        """
+        self.load()
+        if status is not None:
+            keys = self._by_status.get(status, set())
+        else:
+            keys = self._location.keys()
+        if from_kitchen is not None and to_kitchen is not None:
+            keys = self._by_kitchens.get((from_kitchen, to_kitchen), set()).intersection(keys)
+        found = dict()
+        for conflict_key in keys:
+            folder_in_recipe = self._location[conflict_key]
+            found.setdefault(folder_in_recipe, dict())[conflict_key] = self._conflicts[folder_in_recipe][conflict_key]
+        return found
+
+    def count(self, status=None):
+        self.load()
+        if status is None:
+            return len(self._location)
+        return len(self._by_status.get(status, set()))
+
+    def get_summary(self):
+        """
+        :rtype: dict -- {'from_kitchen|to_kitchen': {'unresolved': count, 'resolved': count}}, empty for no conflicts
+        """
+        self.load()
+        summary = dict()
+        for (from_kitchen, to_kitchen), keys in self._by_kitchens.items():
+            for status, status_keys in self._by_status.items():
+                count = len(keys.intersection(status_keys))
+                if count > 0:
+                    summary.setdefault('%s|%s' % (from_kitchen, to_kitchen), dict())[status] = count
+        return summary
+
+    def update_kitchen_index(self):
+        recipes_meta_dir, recipe_name = os.path.split(os.path.normpath(self._recipe_meta_dir))
+        kitchen_meta_dir, recipes_dir_name = os.path.split(recipes_meta_dir)
+        if recipes_dir_name != DK_RECIPES_META_DIR:
+            return True
+        return DKKitchenDisk.update_conflicts_index(kitchen_meta_dir, recipe_name, self.get_summary())
+
+    def resolve(self, path_in_recipe, recipe_name):
+        """
+        Marks the unresolved conflict of the file at path_in_recipe (e.g. 'resources/a.sql') as resolved.
+        :rtype: bool -- False if the file has no unresolved conflict
+        """
+        self.load()
+        for conflict_key in sorted(self._by_status.get(DKConflictStore.UNRESOLVED, set())):
+            conflict_info = self._conflicts[self._location[conflict_key]][conflict_key]
+            conflict_path = os.path.join(conflict_info['folder_in_recipe'], conflict_info['filename'])
+            if re.sub(r'%s/' % recipe_name, r'', conflict_path) == path_in_recipe:
+                self._by_status[DKConflictStore.UNRESOLVED].discard(conflict_key)
+                conflict_info['status'] = DKConflictStore.RESOLVED
+                self._by_status.setdefault(DKConflictStore.RESOLVED, set()).add(conflict_key)
+                self._dirty = True
+                return True
+        return False
+
+    def save(self, force=False):
+        """
+        Writes conflicts.json if anything changed, through a temp file so it is never half written.
+        """
+        if self._conflicts is None or (not self._dirty and not force):
+            return True
+        if not os.path.isdir(self._recipe_meta_dir):
+            os.makedirs(self._recipe_meta_dir)
+        fd, temp_path = tempfile.mkstemp(dir=self._recipe_meta_dir, prefix='.conflicts')
+        try:
+            with os.fdopen(fd, 'w') as temp_file:
+                temp_file.write(json.dumps(self._conflicts, sort_keys=True, indent=2, separators=(',', ': ')))
+            os.replace(temp_path, self.get_path())
+        except (IOError, OSError) as e:
+            print("%s - unable to save conflicts: %s" % (self.get_path(), str(e)))
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+        self._dirty = False
+        return self.update_kitchen_index()
@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import struct
+import threading
+import subprocess
+from signal import signal, SIGTERM
+from .DKReturnCode import DKReturnCode
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+A background dk process, so scripts running many dk commands pay the config parsing, the login and the new https
+connections once instead of once per command.
+
+dk daemon-start runs a DKDaemon that owns a logged in DKCloudAPI session (its connection pool and caches). Each dk
+command first looks for the daemon socket: when a daemon answers, the command line and the current folder are
+sent to it, it runs the command and sends back the output and the exit code. Without a daemon, or when the daemon
+says so (another config, a command that has to stay in the terminal), the command runs in its own process as
+before.
+
+The protocol is one json request and one json response per connection, each side closing its end when done:
+
+    {"op": "run", "args": [...], "cwd": ..., "config": ..., "color": false, "env": {...}}
+        -> {"exit_code": 0, "out": ..., "err": ...} or {"fallback": true}
+    {"op": "status"} -> {"pid": ..., "config": ..., "started": ..., "served": ...}
+    {"op": "stop"} -> {"stopping": true}
+
+A command runs with the environment of the daemon, so the client sends the variables dk depends on
+(get_environment) and the daemon only runs the command when they are the same as its own. A command also runs
+with an empty stdin: command lines reading stdin ('-') are never forwarded.
+
+Commands run one at a time, since a command runs in the folder it was started from: the daemon changes its
+current folder for the command, and waits for the threads a command started before running the next one. The
+socket is only open to the user running the daemon.
+"""
+
+
+class DKDaemon(object):
+    SOCKET_ENV = 'DKCLI_DAEMON_SOCKET'
+    DISABLE_ENV = 'DKCLI_NO_DAEMON'  # set to anything to never forward to a daemon
+    DEFAULT_SOCKET = '~/.dk/daemon.sock'
+    CONNECT_TIMEOUT = 1.0  # seconds, a daemon that does not accept in time is not used
+    ACCEPT_TIMEOUT = 0.5  # seconds between two checks for a stop
+    START_TIMEOUT = 30  # seconds for a new daemon to log in and answer
+    MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+    # variables that change what a dk command does, besides the DKCLI_ ones
+    ENV_VARS = ['HOME', 'USER', 'TMPDIR', 'TZ', 'LANG', 'LC_ALL', 'EDITOR', 'HTTP_PROXY', 'HTTPS_PROXY', 'NO_PROXY',
+                'http_proxy', 'https_proxy', 'no_proxy', 'REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE']
+    ENV_PREFIX = 'DKCLI_'
+
+    OP_RUN = 'run'
+    OP_STATUS = 'status'
+    OP_STOP = 'stop'
+
+    def __init__(self, socket_path, handler, config_location=None):
+        """
+        :param handler: function(request) -> dict, answers the 'run' requests
+        """
+        self._socket_path = socket_path
+        self._handler = handler
+        self._config_location = config_location
+        self._server = None
+        self._stopped = False
+        self._started = None
+        self._served = 0
+
+    @staticmethod
+    def get_socket_path():
+        socket_path = os.environ.get(DKDaemon.SOCKET_ENV)
+        if socket_path is None or len(socket_path.strip()) == 0:
+            socket_path = DKDaemon.DEFAULT_SOCKET
+        return os.path.expanduser(socket_path.strip())
+
+    @staticmethod
+    def get_environment(environ=None):
+        """
+        :rtype: dict -- the variables of environ (os.environ by default) a forwarded command depends on, without
+            the ones that only choose and disable the daemon
+        """
+        environ = os.environ if environ is None else environ
+        return dict((name, value) for name, value in environ.items()
+                    if (name in DKDaemon.ENV_VARS or name.startswith(DKDaemon.ENV_PREFIX)) and
+                    name not in (DKDaemon.SOCKET_ENV, DKDaemon.DISABLE_ENV))
+
+    @staticmethod
+    def get_log_path(socket_path):
+        return os.path.splitext(socket_path)[0] + '.log'
+
+    @staticmethod
+    def find_command(args, options_with_value):
+        """
+        :param args: list -- the dk command line, without 'dk'
+        :param options_with_value: list -- the options of the dk group that take a value, like '-c'
+        :rtype: (dict, str) -- {option: value} of the dk group options, and the command name or None
+        """
+        options = dict()
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg in options_with_value:
+                options[arg] = args[i + 1] if i + 1 < len(args) else None
+                i += 2
+                continue
+            if arg.startswith('--') and '=' in arg:
+                option, value = arg.split('=', 1)
+                options[option] = value
+            elif arg.startswith('-'):
+                short = arg[:2]
+                if short in options_with_value and len(arg) > 2:
+                    options[short] = arg[2:]
+                else:
+                    options[arg] = True
+            else:
+                return options, arg
+            i += 1
+        return options, None
+
+    # client ---------------------------------
+
+    @staticmethod
+    def send(request, socket_path=None, timeout=None):
+        """
+        :param timeout: float -- seconds to wait for the response, None to wait as long as the command runs
+        :rtype: dict -- the response, or None when no daemon answers. A daemon lost after it got the request
+            answers {'exit_code': 1, 'err': ...}, the command may have run.
+        """
+        if socket_path is None:
+            socket_path = DKDaemon.get_socket_path()
+        if not os.path.exists(socket_path):
+            return None
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.settimeout(DKDaemon.CONNECT_TIMEOUT)
+            try:
+                client.connect(socket_path)
+                client.settimeout(timeout)
+                client.sendall(json.dumps(request).encode('utf-8'))
+                client.shutdown(socket.SHUT_WR)
+            except (socket.error, socket.timeout):
+                return None
+            try:
+                return json.loads(DKDaemon._read_all(client).decode('utf-8'))
+            except (socket.error, socket.timeout, ValueError) as e:
+                return {'exit_code': 1, 'out': '', 'err': 'Error: lost the dk daemon on %s: %s\n' % (socket_path,
+                                                                                                   str(e))}
+        finally:
+            client.close()
+
+    @staticmethod
+    def get_status(socket_path=None):
+        """
+        :rtype: dict -- the status of the running daemon, {'busy': True} while it runs a long command, or None
+        """
+        response = DKDaemon.send({'op': DKDaemon.OP_STATUS}, socket_path, DKDaemon.CONNECT_TIMEOUT)
+        if response is None:
+            return None
+        if 'pid' not in response:
+            return {'busy': True}
+        return response
+
+    @staticmethod
+    def stop_daemon(socket_path=None):
+        rc = DKReturnCode()
+        if socket_path is None:
+            socket_path = DKDaemon.get_socket_path()
+        response = DKDaemon.send({'op': DKDaemon.OP_STOP}, socket_path, DKDaemon.CONNECT_TIMEOUT)
+        if response is None:
+            rc.set(rc.DK_FAIL, 'No dk daemon is running on %s' % socket_path)
+        elif 'pid' not in response:
+            rc.set(rc.DK_FAIL, 'The dk daemon on %s is busy running a command, try again' % socket_path)
+        else:
+            rc.set(rc.DK_SUCCESS, 'Stopped the dk daemon (pid %s)' % response.get('pid'))
+        return rc
+
+    @staticmethod
+    def spawn(dk_args, socket_path, timeout=START_TIMEOUT):
+        """
+        Starts 'python -m DKCloudCommand.cli <dk_args>' detached from the terminal, its output going to the daemon
+        log, and waits for it to answer on socket_path.
+        :param dk_args: list -- the dk command line that serves in the foreground
+        :rtype: DKReturnCode
+        """
+        rc = DKReturnCode()
+        package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([package_root] + [p for p in [env.get('PYTHONPATH')] if p])
+        env[DKDaemon.SOCKET_ENV] = socket_path
+        env[DKDaemon.DISABLE_ENV] = '1'
+        log_path = DKDaemon.get_log_path(socket_path)
+        try:
+            if not os.path.isdir(os.path.dirname(log_path)):
+                os.makedirs(os.path.dirname(log_path), 0o700)
+            with open(log_path, 'a') as log_file:
+                process = subprocess.Popen([sys.executable, '-m', 'DKCloudCommand.cli'] + list(dk_args),
+                                           stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                                           cwd=os.path.sep, env=env, start_new_session=True)
+        except (IOError, OSError) as e:
+            rc.set(rc.DK_FAIL, 'Unable to start the dk daemon: %s' % str(e))
+            return rc
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = DKDaemon.get_status(socket_path)
+            if status is not None:
+                rc.set(rc.DK_SUCCESS, 'dk daemon started on %s (pid %s)' % (socket_path, status.get('pid')))
+                return rc
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+        rc.set(rc.DK_FAIL, 'The dk daemon did not start, see %s' % log_path)
+        return rc
+
+    @staticmethod
+    def _read_all(conn):
+        chunks = list()
+        size = 0
+        while True:
+            chunk = conn.recv(64 * 1024)
+            if len(chunk) == 0:
+                break
+            size += len(chunk)
+            if size > DKDaemon.MAX_MESSAGE_SIZE:
+                raise ValueError('message larger than %d bytes' % DKDaemon.MAX_MESSAGE_SIZE)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    # server ---------------------------------
+
+    def bind(self):
+        """
+        :rtype: DKReturnCode -- fails when another daemon answers on the socket
+        """
+        rc = DKReturnCode()
+        if DKDaemon.get_status(self._socket_path) is not None:
+            rc.set(rc.DK_FAIL, 'A dk daemon is already running on %s' % self._socket_path)
+            return rc
+        socket_dir = os.path.dirname(self._socket_path)
+        try:
+            if len(socket_dir) > 0 and not os.path.isdir(socket_dir):
+                os.makedirs(socket_dir, 0o700)
+            if os.path.exists(self._socket_path):
+                # left by a daemon that was killed
+                os.remove(self._socket_path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            old_umask = os.umask(0o177)
+            try:
+                server.bind(self._socket_path)
+            finally:
+                os.umask(old_umask)
+            server.listen(16)
+            server.settimeout(DKDaemon.ACCEPT_TIMEOUT)
+        except (socket.error, OSError) as e:
+            rc.set(rc.DK_FAIL, 'Unable to listen on %s: %s' % (self._socket_path, str(e)))
+            return rc
+        self._server = server
+        self._started = time.time()
+        rc.set(rc.DK_SUCCESS, 'dk daemon listening on %s' % self._socket_path)
+        return rc
+
+    def serve(self):
+        """
+        Answers requests until stop(), a 'stop' request or SIGTERM.
+        :rtype: DKReturnCode
+        """
+        if self._server is None:
+            rc = self.bind()
+            if not rc.ok():
+                return rc
+        if threading.current_thread() is threading.main_thread():
+            signal(SIGTERM, lambda signum, frame: self.stop())
+        try:
+            while not self._stopped:
+                try:
+                    conn, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                except (socket.error, OSError) as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                try:
+                    self._serve_one(conn)
+                finally:
+                    conn.close()
+        finally:
+            self.close()
+        rc = DKReturnCode()
+        rc.set(rc.DK_SUCCESS, 'dk daemon stopped after %d commands' % self._served)
+        return rc
+
+    def _serve_one(self, conn):
+        conn.settimeout(None)
+        if not self._is_same_user(conn):
+            return
+        try:
+            request = json.loads(DKDaemon._read_all(conn).decode('utf-8'))
+        except (socket.error, ValueError) as e:
+            print('%s - dk daemon: bad request: %s' % (time.strftime('%Y-%m-%d %H:%M:%S'), str(e)))
+            return
+        op = request.get('op')
+        if op == DKDaemon.OP_STATUS:
+            response = {'pid': os.getpid(), 'config': self._config_location, 'started': self._started,
+                        'served': self._served, 'socket': self._socket_path}
+        elif op == DKDaemon.OP_STOP:
+            self.stop()
+            response = {'stopping': True, 'pid': os.getpid()}
+        elif op == DKDaemon.OP_RUN:
+            try:
+                response = self._handler(request)
+            except Exception as e:
+                # a broken command must not take the daemon down. It may have done part of its work already, so
+                # the client does not run it again.
+                print('%s - dk daemon: %s failed: %s' % (time.strftime('%Y-%m-%d %H:%M:%S'), request.get('args'),
+                                                         str(e)))
+                response = {'exit_code': 1, 'out': '', 'err': 'Error: dk daemon: %s\n' % str(e)}
+            if not response.get('fallback'):
+                self._served += 1
+        else:
+            response = {'error': 'unknown op %s' % op}
+        try:
+            conn.sendall(json.dumps(response).encode('utf-8'))
+        except socket.error:
+            # the client went away, e.g. Ctrl-C
+            pass
+
+    @staticmethod
+    def _is_same_user(conn):
+        # the socket file is 0600 already, this also covers sockets in a shared folder
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        return uid == os.getuid()
+
+    def stop(self):
+        self._stopped = True
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.remove(self._socket_path)
+            except OSError:
+                pass
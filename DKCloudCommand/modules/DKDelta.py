@@ -0,0 +1,62 @@
+import difflib
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+Line deltas of text files, for updating a file the server already has an older version of.
+
+A delta is a json friendly list of operations, applied in order to the lines of the base:
+
+    [['=', 120], ['-', 2], ['+', 'select 2;\n'], ['=', 40]]
+
+'=' keeps the next n lines of the base, '-' skips them, '+' inserts the text. Lines keep their line ends, so
+applying the delta to the base gives back exactly the new text.
+"""
+
+KEEP = '='
+DELETE = '-'
+INSERT = '+'
+
+
+def make_delta(base, contents):
+    """
+    :param base: str -- the text the server has
+    :param contents: str -- the new text
+    :rtype: list -- the operations that turn base into contents
+    """
+    base_lines = base.splitlines(True)
+    new_lines = contents.splitlines(True)
+    delta = list()
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base_lines, new_lines).get_opcodes():
+        if tag == 'equal':
+            delta.append([KEEP, i2 - i1])
+            continue
+        if i2 > i1:
+            delta.append([DELETE, i2 - i1])
+        if j2 > j1:
+            delta.append([INSERT, ''.join(new_lines[j1:j2])])
+    return delta
+
+
+def apply_delta(base, delta):
+    """
+    :rtype: str -- base with the delta applied
+    :raises ValueError: when the delta does not fit base
+    """
+    base_lines = base.splitlines(True)
+    position = 0
+    result = list()
+    for op, value in delta:
+        if op == KEEP or op == DELETE:
+            if not isinstance(value, int) or value < 0 or position + value > len(base_lines):
+                raise ValueError('delta goes past the end of the base')
+            if op == KEEP:
+                result.extend(base_lines[position:position + value])
+            position += value
+        elif op == INSERT:
+            result.append(value)
+        else:
+            raise ValueError('unknown delta operation %s' % op)
+    if position != len(base_lines):
+        raise ValueError('delta does not cover the whole base')
+    return ''.join(result)
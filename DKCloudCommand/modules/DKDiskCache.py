@@ -0,0 +1,244 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from hashlib import sha1
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+A small on-disk key/value cache shared by the dk commands of one user, under dk-cloud-cache-dir.
+
+Each entry is one json file named after the sha1 of its key, so lookups never read the whole cache.
+Entries can expire (ttl, seconds), and the least recently used ones are evicted once the cache holds
+more than max_entries entries or max_bytes bytes. The cache dir is listed once per process and then
+only when a write takes it over a bound, so a write costs the same however big the cache is. Writes go
+to a temp file and are renamed into place, so concurrent dk processes never read a half written entry.
+
+The cache dir is created 0700 and the entries are 0600: they hold server responses, readable by the
+user only.
+
+Values must be json serializable.
+"""
+
+
+class DKDiskCache(object):
+    ENTRY_SUFFIX = '.json'
+
+    def __init__(self, cache_dir, max_entries=1000, max_bytes=None, default_ttl=None):
+        self._cache_dir = os.path.expanduser(cache_dir)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # the entries and bytes in the cache dir, None until the first write scans it
+        self._entry_count = None
+        self._total_bytes = None
+
+    def get_cache_dir(self):
+        return self._cache_dir
+
+    def _entry_path(self, key):
+        return os.path.join(self._cache_dir, sha1(key.encode('utf-8')).hexdigest() + DKDiskCache.ENTRY_SUFFIX)
+
+    def get(self, key):
+        """
+        :rtype: the cached value, or None if it is missing or expired
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        return entry['value']
+
+    def get_entry(self, key, include_expired=False):
+        """
+        :rtype: dict -- {'key', 'value', 'created', 'expires', 'meta'}, or None
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        if not include_expired and entry.get('expires') is not None and entry['expires'] < time.time():
+            self._remove(path)
+            return None
+        try:
+            # the mtime is the last use, for the LRU eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, value, ttl=None, meta=None):
+        """
+        :param ttl: seconds until the entry expires, None for the default_ttl of the cache (None is forever)
+        :param meta: dict -- anything else to keep with the value, e.g. an ETag
+        :rtype: bool -- False if the entry could not be written
+        """
+        written = self._write(key, value, ttl, meta)
+        self._evict_if_over()
+        return written
+
+    def put_many(self, values, ttl=None):
+        """
+        Writes several entries, checking the bounds of the cache once at the end.
+        :param values: dict -- {key: value}
+        :rtype: int -- the number of entries written
+        """
+        written = 0
+        for key, value in values.items():
+            if self._write(key, value, ttl, None):
+                written += 1
+        self._evict_if_over()
+        return written
+
+    def _write(self, key, value, ttl, meta):
+        if ttl is None:
+            ttl = self._default_ttl
+        now = time.time()
+        entry = {'key': key, 'value': value, 'created': now,
+                 'expires': now + ttl if ttl is not None else None,
+                 'meta': meta if meta is not None else {}}
+        self._load_totals()
+        path = self._entry_path(key)
+        temp_path = None
+        try:
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir, mode=0o700)
+            # mkstemp creates the file 0600, the entries are only readable by the user
+            fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, prefix='.entry')
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(entry, temp_file)
+            size = os.path.getsize(temp_path)
+            replaced_size = DKDiskCache._get_size(path)
+            os.replace(temp_path, path)
+        except (IOError, OSError, TypeError, ValueError):
+            # a cache that cannot be written is only slower, never an error
+            if temp_path is not None:
+                DKDiskCache._remove_file(temp_path)
+            return False
+        with self._lock:
+            if replaced_size is None:
+                self._entry_count += 1
+            self._total_bytes += size - (replaced_size or 0)
+        return True
+
+    def delete(self, key):
+        self._remove(self._entry_path(key))
+
+    def delete_matching(self, predicate):
+        """
+        Removes every entry whose key satisfies predicate(key).
+        """
+        for path, key in self._list_entries():
+            if key is not None and predicate(key):
+                self._remove(path)
+
+    def keys(self):
+        return [key for path, key in self._list_entries() if key is not None]
+
+    def clear(self):
+        for path, key in self._list_entries():
+            self._remove(path)
+
+    def _list_entries(self):
+        if not os.path.isdir(self._cache_dir):
+            return []
+        entries = list()
+        for name in os.listdir(self._cache_dir):
+            if not name.endswith(DKDiskCache.ENTRY_SUFFIX) or name.startswith('.'):
+                continue
+            path = os.path.join(self._cache_dir, name)
+            try:
+                with open(path) as entry_file:
+                    entries.append((path, json.load(entry_file).get('key')))
+            except (IOError, OSError, ValueError):
+                entries.append((path, None))
+        return entries
+
+    def _scan(self):
+        """
+        :rtype: list -- (mtime, size, path) of every entry, oldest first
+        """
+        stats = list()
+        try:
+            names = os.listdir(self._cache_dir)
+        except OSError:
+            return stats
+        for name in names:
+            if not name.endswith(DKDiskCache.ENTRY_SUFFIX) or name.startswith('.'):
+                continue
+            path = os.path.join(self._cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats.append((st.st_mtime, st.st_size, path))
+        stats.sort()
+        return stats
+
+    def _load_totals(self):
+        # one scan of the cache dir per process, the totals are then kept up to date by the writes and removals
+        with self._lock:
+            if self._entry_count is not None:
+                return
+            stats = self._scan()
+            self._entry_count = len(stats)
+            self._total_bytes = sum(size for mtime, size, path in stats)
+
+    def _is_over(self, entry_count, total_bytes, low_water=False):
+        max_entries = self._max_entries
+        max_bytes = self._max_bytes
+        if low_water:
+            # evicting a tenth more than needed, so the next writes do not all scan the cache dir again
+            max_entries = max_entries - max_entries // 10 if max_entries is not None else None
+            max_bytes = max_bytes - max_bytes // 10 if max_bytes is not None else None
+        return ((max_entries is not None and entry_count > max_entries) or
+                (max_bytes is not None and total_bytes > max_bytes))
+
+    def _evict_if_over(self):
+        if self._max_entries is None and self._max_bytes is None:
+            return
+        self._load_totals()
+        with self._lock:
+            if not self._is_over(self._entry_count, self._total_bytes):
+                return
+            # other dk processes write to the same cache dir, the scan is what is really there
+            stats = self._scan()
+            entry_count = len(stats)
+            total_bytes = sum(size for mtime, size, path in stats)
+            while len(stats) > 0 and self._is_over(entry_count, total_bytes, low_water=True):
+                mtime, size, path = stats.pop(0)
+                DKDiskCache._remove_file(path)
+                entry_count -= 1
+                total_bytes -= size
+            self._entry_count = entry_count
+            self._total_bytes = total_bytes
+
+    def _remove(self, path):
+        size = DKDiskCache._get_size(path)
+        if size is None or not DKDiskCache._remove_file(path):
+            return
+        with self._lock:
+            if self._entry_count is not None:
+                self._entry_count -= 1
+                self._total_bytes -= size
+
+    @staticmethod
+    def _get_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
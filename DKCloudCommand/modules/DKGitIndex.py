@@ -0,0 +1,244 @@
+import os
+import re
+import struct
+import binascii
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+Blob shas from the index of the git working tree a kitchen lives in.
+
+githash computes the same sha git gives a file's content, so for a file git has already hashed and that did not
+change since, the sha in .git/index is the one get_directory_sha needs. The index is read directly (versions 2 to
+4), without running git. A file is only taken from the index when its stat matches the entry the way git checks it
+(mtime, ctime, size, inode) and the entry is not racily clean, otherwise it is hashed as before.
+
+The index holds the content after git's filters, so it is not used at all when the content of the working tree
+may differ from the blobs: core.autocrlf, filter drivers, or attributes (.gitattributes, info/attributes,
+core.attributesFile). A .gitattributes applies to git add whether it is tracked or not, so the folders on disk are
+checked too: those from the root of the working tree down to the kitchen, and a file under a folder holding one is
+hashed. Split indexes are not read either.
+"""
+
+
+class DKGitIndex(object):
+    SIGNATURE = b'DIRC'
+    ENTRY_HEADER = struct.Struct('>10I20sH')
+    EXTENDED_FLAG = 0x4000
+    INTENT_TO_ADD_FLAG = 0x2000  # in the extended flags
+    STAGE_MASK = 0x3000
+    REGULAR_FILE = 0o100000
+    FILE_TYPE_MASK = 0o170000
+
+    def __init__(self, work_tree, entries, index_mtime_ns, checked_dir=None):
+        """
+        :param entries: dict -- {path relative to work_tree, '/' separated:
+            (mtime_ns, mtime_s, ctime_ns, ctime_s, size, ino, sha)}, the nanoseconds being None when git did not
+            record them
+        :param checked_dir: str -- a folder known to be under no .gitattributes, default work_tree
+        """
+        self._work_tree = work_tree
+        self._entries = entries
+        self._index_mtime_ns = index_mtime_ns
+        # folder -> whether a .gitattributes applies to its files
+        self._has_attributes = {checked_dir or work_tree: False}
+
+    @staticmethod
+    def find(path):
+        """
+        :param path: str -- a folder inside a git working tree
+        :rtype: DKGitIndex -- or None when path is not in a working tree, or the index can not be trusted
+        """
+        work_tree, git_dir = DKGitIndex._find_git_dir(os.path.abspath(path))
+        if work_tree is None or DKGitIndex._has_filters(git_dir):
+            return None
+        index_path = os.path.join(git_dir, 'index')
+        try:
+            index_mtime_ns = os.stat(index_path).st_mtime_ns
+            with open(index_path, 'rb') as index_file:
+                data = index_file.read()
+        except (IOError, OSError):
+            return None
+        entries = DKGitIndex.parse(data)
+        if entries is None or '.gitattributes' in entries or \
+                any(p.endswith('/.gitattributes') for p in entries):
+            return None
+        path = os.path.abspath(path)
+        if DKGitIndex._has_attributes_file(work_tree, path):
+            return None
+        return DKGitIndex(work_tree, entries, index_mtime_ns, path)
+
+    @staticmethod
+    def _has_attributes_file(work_tree, path):
+        # the folders from work_tree down to path, both included
+        folder = path
+        while True:
+            if os.path.isfile(os.path.join(folder, '.gitattributes')):
+                return True
+            if folder == work_tree:
+                return False
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                return False
+            folder = parent
+
+    @staticmethod
+    def _find_git_dir(path):
+        while True:
+            dot_git = os.path.join(path, '.git')
+            if os.path.isdir(dot_git):
+                return path, dot_git
+            if os.path.isfile(dot_git):
+                # a linked worktree or a submodule: 'gitdir: <path>'
+                try:
+                    with open(dot_git, 'r') as f:
+                        line = f.readline().strip()
+                except (IOError, OSError):
+                    return None, None
+                if not line.startswith('gitdir:'):
+                    return None, None
+                return path, os.path.normpath(os.path.join(path, line[len('gitdir:'):].strip()))
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None, None
+            path = parent
+
+    @staticmethod
+    def _has_filters(git_dir):
+        config_paths = [os.path.join(git_dir, 'config'), os.path.expanduser('~/.gitconfig'),
+                        os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config'), 'git',
+                                     'config'),
+                        '/etc/gitconfig']
+        commondir = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(commondir):
+            # a linked worktree keeps its config and info/ in the main .git
+            try:
+                with open(commondir, 'r') as f:
+                    common_git_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+            except (IOError, OSError):
+                return True
+            config_paths.append(os.path.join(common_git_dir, 'config'))
+            git_dirs = [git_dir, common_git_dir]
+        else:
+            git_dirs = [git_dir]
+        for config_path in config_paths:
+            try:
+                with open(config_path, 'r') as f:
+                    config = f.read()
+            except (IOError, OSError):
+                continue
+            if re.search(r'^\s*autocrlf\s*=\s*(true|input|yes|on|1)\s*$', config, re.I | re.M) or \
+                    re.search(r'^\s*\[filter\s', config, re.I | re.M) or \
+                    re.search(r'^\s*attributesfile\s*=', config, re.I | re.M):
+                return True
+        for a_git_dir in git_dirs:
+            attributes = os.path.join(a_git_dir, 'info', 'attributes')
+            if os.path.isfile(attributes) and os.path.getsize(attributes) > 0:
+                return True
+        return False
+
+    @staticmethod
+    def parse(data):
+        """
+        :param data: bytes -- the content of .git/index
+        :rtype: dict -- the regular files of stage 0, see __init__, or None when the index is not supported
+        """
+        if len(data) < 12 or data[:4] != DKGitIndex.SIGNATURE:
+            return None
+        version, count = struct.unpack('>II', data[4:12])
+        if version not in (2, 3, 4):
+            return None
+        entries = dict()
+        offset = 12
+        previous_name = b''
+        header_size = DKGitIndex.ENTRY_HEADER.size
+        try:
+            for i in range(count):
+                ctime_s, ctime_ns, mtime_s, mtime_ns, dev, ino, mode, uid, gid, size, sha, flags = \
+                    DKGitIndex.ENTRY_HEADER.unpack_from(data, offset)
+                entry_start = offset
+                offset += header_size
+                extended_flags = 0
+                if version >= 3 and flags & DKGitIndex.EXTENDED_FLAG:
+                    extended_flags = struct.unpack_from('>H', data, offset)[0]
+                    offset += 2
+                if version == 4:
+                    # the name is the previous one without its last n bytes, plus a nul terminated suffix
+                    strip, offset = DKGitIndex._read_varint(data, offset)
+                    end = data.index(b'\0', offset)
+                    name = previous_name[:len(previous_name) - strip] + data[offset:end]
+                    offset = end + 1
+                else:
+                    end = data.index(b'\0', offset)
+                    name = data[offset:end]
+                    # entries are padded with 1 to 8 nul bytes to a multiple of 8
+                    offset = entry_start + ((end - entry_start) // 8 + 1) * 8
+                previous_name = name
+                if flags & DKGitIndex.STAGE_MASK or extended_flags & DKGitIndex.INTENT_TO_ADD_FLAG or \
+                        mode & DKGitIndex.FILE_TYPE_MASK != DKGitIndex.REGULAR_FILE:
+                    continue
+                entries[name.decode('utf-8', 'surrogateescape')] = (
+                    mtime_s * 10 ** 9 + mtime_ns if mtime_ns else None, mtime_s,
+                    ctime_s * 10 ** 9 + ctime_ns if ctime_ns else None, ctime_s,
+                    size, ino, binascii.hexlify(sha).decode('ascii'))
+            # extensions, until the trailing sha of the index
+            while offset + 8 <= len(data) - 20:
+                signature, extension_size = struct.unpack_from('>4sI', data, offset)
+                if signature == b'link':
+                    # a split index: the entries above are only the changes to a shared index
+                    return None
+                offset += 8 + extension_size
+        except (struct.error, ValueError):
+            return None
+        return entries
+
+    @staticmethod
+    def _read_varint(data, offset):
+        # git's offset encoding, each continuation adding one before the shift
+        byte = data[offset]
+        offset += 1
+        value = byte & 0x7f
+        while byte & 0x80:
+            byte = data[offset]
+            offset += 1
+            value = ((value + 1) << 7) | (byte & 0x7f)
+        return value, offset
+
+    def get_sha(self, full_path, st):
+        """
+        :param full_path: str -- the path of a file in the working tree
+        :param st: os.stat_result -- its stat, a DirEntry's
+        :rtype: str -- its sha from the index, None when it has to be hashed
+        """
+        path = os.path.relpath(full_path, self._work_tree)
+        if os.sep != '/':
+            path = path.replace(os.sep, '/')
+        entry = self._entries.get(path)
+        if entry is None or self._under_attributes(os.path.dirname(os.path.abspath(full_path))):
+            return None
+        mtime_ns, mtime_s, ctime_ns, ctime_s, size, ino, sha = entry
+        # git keeps the low 32 bits of these
+        if size != st.st_size & 0xffffffff or (ino != 0 and ino != st.st_ino & 0xffffffff):
+            return None
+        if not DKGitIndex._same_time(mtime_ns, mtime_s, st.st_mtime_ns) or \
+                not DKGitIndex._same_time(ctime_ns, ctime_s, st.st_ctime_ns):
+            return None
+        # racily clean: written in the same instant as the index, a later change may not show in the stat
+        if st.st_mtime_ns >= self._index_mtime_ns:
+            return None
+        return sha
+
+    def _under_attributes(self, folder):
+        has_attributes = self._has_attributes.get(folder)
+        if has_attributes is None:
+            parent = os.path.dirname(folder)
+            has_attributes = os.path.isfile(os.path.join(folder, '.gitattributes')) or \
+                (parent != folder and self._under_attributes(parent))
+            self._has_attributes[folder] = has_attributes
+        return has_attributes
+
+    @staticmethod
+    def _same_time(entry_ns, entry_s, stat_ns):
+        if entry_ns is None:
+            return entry_s == (stat_ns // 10 ** 9) & 0xffffffff
+        return entry_ns == stat_ns
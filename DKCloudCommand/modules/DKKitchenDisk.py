@@ -1,8 +1,11 @@
 import os
+import json
+import tempfile
 
 KITCHEN_META = 'KITCHEN_META'
 DK_DIR = '.dk'
 DK_RECIPES_META_DIR = 'recipes'
+DK_CONFLICTS_INDEX = 'conflicts_index.json'
 
 
 class DKKitchenDisk:
@@ -54,33 +57,96 @@ class DKKitchenDisk:
 
     @staticmethod
     def get_unresolved_conflicts(from_kitchen, to_kitchen, start_dir=None):
-        recipes = DKKitchenDisk.find_available_recipes(start_dir)
-        if recipes is None:
-            return None
-
-        from .DKRecipeDisk import DKRecipeDisk
-        all_unresolved = {}
-        for recipe in recipes:
-            recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir(recipe, start_dir)
-            unresolved = DKRecipeDisk.get_unresolved_conflicts_meta(recipe_meta_dir, from_kitchen, to_kitchen)
-            if len(unresolved) != 0:
-                all_unresolved[recipe] = unresolved
-        return all_unresolved
+        return DKKitchenDisk._get_conflicts('unresolved', from_kitchen, to_kitchen, start_dir)
 
     @staticmethod
     def get_resolved_conflicts(from_kitchen, to_kitchen, start_dir=None):
-        recipes = DKKitchenDisk.find_available_recipes(start_dir)
-        if recipes is None:
+        return DKKitchenDisk._get_conflicts('resolved', from_kitchen, to_kitchen, start_dir)
+
+    @staticmethod
+    def _get_conflicts(status, from_kitchen, to_kitchen, start_dir=None):
+        # only the recipes the kitchen conflicts index lists for this status are opened
+        kitchen_meta_dir = DKKitchenDisk.find_kitchen_meta_dir(start_dir)
+        if kitchen_meta_dir is None:
             return None
 
         from .DKRecipeDisk import DKRecipeDisk
-        all_resolved = {}
-        for recipe in recipes:
-            recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir(recipe, start_dir)
-            resolved = DKRecipeDisk.get_resolved_conflicts_meta(recipe_meta_dir, from_kitchen, to_kitchen)
-            if len(resolved) != 0:
-                all_resolved[recipe] = resolved
-        return all_resolved
+        all_conflicts = {}
+        index = DKKitchenDisk.get_conflicts_index(kitchen_meta_dir)
+        for recipe in DKKitchenDisk._recipes_with_conflicts(index, status, from_kitchen, to_kitchen):
+            recipe_meta_dir = os.path.join(kitchen_meta_dir, DK_RECIPES_META_DIR, recipe)
+            if status == 'unresolved':
+                conflicts = DKRecipeDisk.get_unresolved_conflicts_meta(recipe_meta_dir, from_kitchen, to_kitchen)
+            else:
+                conflicts = DKRecipeDisk.get_resolved_conflicts_meta(recipe_meta_dir, from_kitchen, to_kitchen)
+            if len(conflicts) != 0:
+                all_conflicts[recipe] = conflicts
+        return all_conflicts
+
+    @staticmethod
+    def _recipes_with_conflicts(index, status, from_kitchen=None, to_kitchen=None):
+        recipes = list()
+        for recipe, summary in sorted(index.items()):
+            if from_kitchen is not None and to_kitchen is not None:
+                counts = [summary.get('%s|%s' % (from_kitchen, to_kitchen), {}).get(status, 0)]
+            else:
+                counts = [kitchens_summary.get(status, 0) for kitchens_summary in summary.values()]
+            if sum(counts) > 0:
+                recipes.append(recipe)
+        return recipes
+
+    @staticmethod
+    def get_conflicts_index(kitchen_meta_dir):
+        """
+        The conflict counts of every recipe of the kitchen, from .dk/conflicts_index.json, rebuilt if it is missing.
+        :rtype: dict -- {recipe: {'from_kitchen|to_kitchen': {'unresolved': count, 'resolved': count}}}
+        """
+        index_path = os.path.join(kitchen_meta_dir, DK_CONFLICTS_INDEX)
+        try:
+            with open(index_path, 'r') as index_file:
+                return json.load(index_file)
+        except (IOError, OSError, ValueError):
+            return DKKitchenDisk.rebuild_conflicts_index(kitchen_meta_dir)
+
+    @staticmethod
+    def rebuild_conflicts_index(kitchen_meta_dir):
+        from .DKConflictStore import DKConflictStore
+        index = dict()
+        recipes_meta_dir = os.path.join(kitchen_meta_dir, DK_RECIPES_META_DIR)
+        if os.path.isdir(recipes_meta_dir):
+            for recipe in next(os.walk(recipes_meta_dir))[1]:
+                summary = DKConflictStore(os.path.join(recipes_meta_dir, recipe)).get_summary()
+                if len(summary) != 0:
+                    index[recipe] = summary
+        DKKitchenDisk._save_conflicts_index(kitchen_meta_dir, index)
+        return index
+
+    @staticmethod
+    def update_conflicts_index(kitchen_meta_dir, recipe_name, summary):
+        """
+        Replaces the conflict counts of one recipe in the kitchen conflicts index.
+        :param summary: dict -- see DKConflictStore.get_summary
+        """
+        index = DKKitchenDisk.get_conflicts_index(kitchen_meta_dir)
+        if len(summary) != 0:
+            index[recipe_name] = summary
+        elif recipe_name in index:
+            del index[recipe_name]
+        else:
+            return True
+        return DKKitchenDisk._save_conflicts_index(kitchen_meta_dir, index)
+
+    @staticmethod
+    def _save_conflicts_index(kitchen_meta_dir, index):
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=kitchen_meta_dir, prefix='.conflicts_index')
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(index, temp_file, sort_keys=True)
+            os.replace(temp_path, os.path.join(kitchen_meta_dir, DK_CONFLICTS_INDEX))
+        except (IOError, OSError) as e:
+            print("%s - unable to save the conflicts index: %s" % (kitchen_meta_dir, str(e)))
+            return False
+        return True
 
     @staticmethod
     def write_kitchen(kitchen_name, root_dir):
@@ -0,0 +1,64 @@
+import json
+import threading
+from collections import OrderedDict
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+A key/value cache in the memory of the process, for values that must not be written to disk.
+
+The least recently used entries are evicted once the values take more than max_bytes, counted as the length of
+their json. Values are kept as json and decoded on each get, so a caller changing what it got does not change the
+cache. Values must be json serializable.
+"""
+
+
+class DKMemoryCache(object):
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> json of the value, the most recently used last
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :rtype: the cached value, or None
+        """
+        with self._lock:
+            value_json = self._entries.get(key)
+            if value_json is None:
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(value_json)
+
+    def put(self, key, value):
+        """
+        :rtype: bool -- False if the value is not kept, too large or not json
+        """
+        try:
+            value_json = json.dumps(value)
+        except (TypeError, ValueError):
+            return False
+        if len(value_json) > self._max_bytes:
+            return False
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = value_json
+            self._total_bytes += len(value_json)
+            while self._total_bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def _remove(self, key):
+        value_json = self._entries.pop(key, None)
+        if value_json is not None:
+            self._total_bytes -= len(value_json)
@@ -0,0 +1,118 @@
+import functools
+import json
+import os
+import threading
+import time
+from prettytable import PrettyTable
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+Lightweight timing for dk commands, turned on with 'dk --profile ...' or 'dk --profile-trace trace.json ...'.
+
+Every DKCloudAPI request and the hot DKRecipeDisk functions record a span (name, duration, bytes sent and
+received). At the end of the command the spans are printed as a summary table, and/or written as a Chrome
+trace event file, which chrome://tracing, https://ui.perfetto.dev or speedscope load as a flame graph.
+
+When profiling is off, recording is a single attribute check.
+"""
+
+
+class DKProfiler(object):
+    __shared_state = {}
+
+    def __init__(self):
+        # Borg: every DKProfiler() shares the same spans, so the api, the runner and the cli all report to one place
+        self.__dict__ = self.__shared_state
+        if 'enabled' not in self.__dict__:
+            self.enabled = False
+            self._lock = threading.Lock()
+            self._spans = list()
+            self._origin = time.time()
+
+    def enable(self):
+        with self._lock:
+            self.enabled = True
+            self._spans = list()
+            self._origin = time.time()
+
+    def disable(self):
+        self.enabled = False
+
+    def is_enabled(self):
+        return self.enabled
+
+    def get_spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def record(self, name, category, start, duration, bytes_sent=0, bytes_received=0):
+        """
+        :param start: float -- time.time() when the span started
+        :param duration: float -- seconds
+        """
+        if not self.enabled:
+            return
+        span = {'name': name, 'category': category, 'start': start, 'duration': duration,
+                'bytes_sent': bytes_sent, 'bytes_received': bytes_received,
+                'thread': threading.current_thread().ident}
+        with self._lock:
+            self._spans.append(span)
+
+    def summary(self):
+        """
+        :rtype: str -- one row per span name, slowest total first
+        """
+        totals = dict()
+        for span in self.get_spans():
+            key = (span['category'], span['name'])
+            if key not in totals:
+                totals[key] = {'count': 0, 'total': 0.0, 'max': 0.0, 'sent': 0, 'received': 0}
+            t = totals[key]
+            t['count'] += 1
+            t['total'] += span['duration']
+            t['max'] = max(t['max'], span['duration'])
+            t['sent'] += span['bytes_sent']
+            t['received'] += span['bytes_received']
+
+        x = PrettyTable()
+        x.field_names = ['Category', 'Name', 'Count', 'Total (s)', 'Mean (ms)', 'Max (ms)', 'Sent (B)', 'Received (B)']
+        x.align['Name'] = 'l'
+        for (category, name), t in sorted(list(totals.items()), key=lambda item: item[1]['total'], reverse=True):
+            x.add_row([category, name, t['count'], '%.3f' % t['total'], '%.1f' % (1000 * t['total'] / t['count']),
+                       '%.1f' % (1000 * t['max']), t['sent'], t['received']])
+        return x.get_string()
+
+    def write_trace(self, path):
+        """
+        Writes the spans in the Chrome trace event format ('X' complete events, in microseconds).
+        """
+        pid = os.getpid()
+        events = list()
+        for span in self.get_spans():
+            events.append({'name': span['name'], 'cat': span['category'], 'ph': 'X', 'pid': pid,
+                           'tid': span['thread'],
+                           'ts': int((span['start'] - self._origin) * 1000000),
+                           'dur': int(span['duration'] * 1000000),
+                           'args': {'bytes_sent': span['bytes_sent'], 'bytes_received': span['bytes_received']}})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+def profiled(category):
+    """
+    Decorator recording each call of the function as a span named after it.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = DKProfiler()
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(func.__name__, category, start, time.time() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,125 @@
+import threading
+import time
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+Client side throttling for DKCloudAPI, so many concurrent commands (or many CI agents) do not
+hammer one DataKitchen server.
+
+Every host gets one DKRateLimiter, shared by all endpoints and all DKCloudAPI objects in the process:
+  - a token bucket: 'rate' requests per second on average, bursts of up to 'burst'
+  - a semaphore: at most 'max-in-flight' requests waiting on the server at once
+
+Limits come from dk-cloud-rate-limits in the config, per host, e.g.
+
+    "dk-cloud-rate-limits": {"dkapp.example.com": {"rate": 20, "burst": 40, "max-in-flight": 8},
+                             "*": {"max-in-flight": 4}}
+
+A rate of 0 means no rate limit. When the server answers 429, every caller pauses for Retry-After and
+the rate is halved, then it creeps back up to the configured rate on each successful call.
+"""
+
+
+class DKRateLimiter(object):
+    RATE = 'rate'
+    BURST = 'burst'
+    MAX_IN_FLIGHT = 'max-in-flight'
+
+    MIN_RATE = 0.5  # requests per second, never throttle below this
+    RECOVERY_STEP = 0.1  # fraction of the configured rate regained per successful request
+
+    def __init__(self, rate=0, burst=None, max_in_flight=None):
+        self._lock = threading.Lock()
+        self._configured_rate = float(rate) if rate else 0.0
+        self._rate = self._configured_rate
+        if burst is None:
+            burst = max(1.0, self._configured_rate)
+        self._burst = float(burst)
+        self._tokens = self._burst
+        self._last_refill = time.time()
+        self._paused_until = 0.0
+        self._max_in_flight = max_in_flight
+        if max_in_flight is not None and max_in_flight > 0:
+            self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        else:
+            self._in_flight = None
+
+    def get_rate(self):
+        return self._rate
+
+    def get_max_in_flight(self):
+        return self._max_in_flight
+
+    def acquire(self):
+        """
+        Blocks until the request is allowed to go out. Every acquire() must be paired with a release().
+        """
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        if self._in_flight is not None:
+            self._in_flight.acquire()
+
+    def release(self):
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+    def _reserve(self):
+        # returns 0 when a token was taken, otherwise the number of seconds to wait before trying again
+        with self._lock:
+            now = time.time()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._rate <= 0:
+                return 0
+            self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self._rate
+
+    def on_throttled(self, retry_after=None):
+        """
+        The server answered 429: stop everyone for retry_after seconds and halve the rate.
+        """
+        with self._lock:
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, time.time() + retry_after)
+            if self._rate > 0:
+                self._rate = max(DKRateLimiter.MIN_RATE, self._rate / 2)
+            self._tokens = 0
+
+    def on_success(self):
+        with self._lock:
+            if 0 < self._rate < self._configured_rate:
+                self._rate = min(self._configured_rate,
+                                 self._rate + self._configured_rate * DKRateLimiter.RECOVERY_STEP)
+
+
+_limiters = dict()
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host, limits=None):
+    """
+    :param host: str -- the netloc of the url, e.g. 'dkapp.example.com:443'
+    :param limits: dict -- {'rate': , 'burst': , 'max-in-flight': }, only used the first time a host is seen
+    :rtype: DKRateLimiter
+    """
+    with _limiters_lock:
+        if host not in _limiters:
+            if limits is None:
+                limits = dict()
+            _limiters[host] = DKRateLimiter(limits.get(DKRateLimiter.RATE, 0),
+                                            limits.get(DKRateLimiter.BURST),
+                                            limits.get(DKRateLimiter.MAX_IN_FLIGHT))
+        return _limiters[host]
+
+
+def reset_rate_limiters():
+    with _limiters_lock:
+        _limiters.clear()
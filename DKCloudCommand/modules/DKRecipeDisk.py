@@ -1,12 +1,19 @@
 import os
 import json
+import base64
 import filecmp
 import glob
+import tempfile
+import time
 from .githash import *
 import re
 import glob
 from .DKKitchenDisk import DKKitchenDisk
 from .DKIgnore import DKIgnore
+from .DKConflictStore import DKConflictStore
+from .DKRecipeTree import RecipeTree
+from .DKGitIndex import DKGitIndex
+from .DKProfiler import profiled
 
 # import os.path
 
@@ -20,9 +27,11 @@ from .DKIgnore import DKIgnore
 __author__ = 'DataKitchen, Inc.'
 
 RECIPE_META = 'RECIPE_META'
-DK_CONFLICTS_META = 'conflicts.json'
+DK_CONFLICTS_META = DKConflictStore.CONFLICTS_META
 ORIG_HEAD = 'ORIG_HEAD'
+REMOTE_TREE = 'REMOTE_TREE'
 IGNORED_FILES = ['.DS_Store', '.dk']
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
 
 class DKRecipeDisk:
     def __init__(self, recipe_sha=None, recipe=None, path=None):
@@ -39,6 +48,7 @@ class DKRecipeDisk:
     #     create the file
     #     write the contents
     #   write our metadata to the kitchen folder (.dk)
+    @profiled('disk')
     def save_recipe_to_disk(self, update_meta=True):
         recipe_dict = self.recipe
         root_dir = self._recipe_path
@@ -127,6 +137,46 @@ class DKRecipeDisk:
             return None
         return orig_head
 
+    @staticmethod
+    def write_remote_tree(recipe_meta_dir, kitchen, recipe, tree, etag=None, head=None):
+        """
+        Keeps the recipe tree last fetched from the server, for recipe-status --cached and for revalidating it.
+        :param tree: dict -- {folder: [{'filename', 'sha'}]} as /v2/recipe/tree answers it
+        :param etag: str -- the ETag it came with, sent back as If-None-Match
+        :param head: str -- the commit of the kitchen it was fetched at, when the server tells
+        """
+        if recipe_meta_dir is None or not os.path.isdir(recipe_meta_dir):
+            return False
+        snapshot = {'kitchen': kitchen, 'recipe': recipe, 'etag': etag, 'head': head, 'time': time.time(),
+                    'tree': tree}
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=recipe_meta_dir, prefix='.' + REMOTE_TREE)
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(snapshot, temp_file)
+            os.replace(temp_path, os.path.join(recipe_meta_dir, REMOTE_TREE))
+        except (IOError, OSError) as e:
+            print("%s - unable to save the remote tree: %s" % (recipe_meta_dir, str(e)))
+            return False
+        return True
+
+    @staticmethod
+    def read_remote_tree(recipe_meta_dir, kitchen, recipe):
+        """
+        :rtype: dict -- {'kitchen', 'recipe', 'etag', 'head', 'time', 'tree'} see write_remote_tree, or None when
+            there is no snapshot of this recipe in this kitchen
+        """
+        if recipe_meta_dir is None:
+            return None
+        try:
+            with open(os.path.join(recipe_meta_dir, REMOTE_TREE), 'r') as f:
+                snapshot = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('kitchen') != kitchen or \
+                snapshot.get('recipe') != recipe or not isinstance(snapshot.get('tree'), dict):
+            return None
+        return snapshot
+
     @staticmethod
     def create_conflicts_meta(recipe_meta_dir):
         conflicts_file_path = os.path.join(recipe_meta_dir, DK_CONFLICTS_META)
@@ -137,20 +187,18 @@ class DKRecipeDisk:
                 conflicts_file.write('{}')
             return conflicts_file_path
 
+    @staticmethod
+    def get_conflict_store(recipe_name, kitchen_dir):
+        """
+        :rtype: DKConflictStore -- for batching many conflict updates of one recipe into one write
+        """
+        return DKConflictStore(DKKitchenDisk.get_recipe_meta_dir(recipe_name, kitchen_dir))
+
     @staticmethod
     def add_conflict_to_conflicts_meta(conflict_info, folder_in_recipe, recipe_name, kitchen_dir):
-        recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir(recipe_name, kitchen_dir)
-        conflicts_meta = DKRecipeDisk.get_conflicts_meta(recipe_meta_dir)
-        conflict_key = '%s|%s|%s|%s|%s' % (conflict_info['from_kitchen'], conflict_info['to_kitchen'], recipe_name,
-                                           folder_in_recipe, conflict_info['filename'])
-
-        conflict_for_save = conflict_info.copy()
-        conflict_for_save['folder_in_recipe'] = folder_in_recipe
-        conflict_for_save['status'] = 'unresolved'
-        if folder_in_recipe not in conflicts_meta:
-            conflicts_meta[folder_in_recipe] = {}
-        conflicts_meta[folder_in_recipe][conflict_key] = conflict_for_save
-        return DKRecipeDisk.save_conflicts_meta(recipe_meta_dir, conflicts_meta)
+        store = DKRecipeDisk.get_conflict_store(recipe_name, kitchen_dir)
+        store.add_conflict(conflict_info, folder_in_recipe, recipe_name)
+        return store.save()
 
     @staticmethod
     def get_conflicts_meta(recipe_meta_dir):
@@ -164,66 +212,37 @@ class DKRecipeDisk:
 
     @staticmethod
     def get_unresolved_conflicts_meta(recipe_meta_dir, from_kitchen=None, to_kitchen=None):
-        conflicts = DKRecipeDisk.get_conflicts_meta(recipe_meta_dir)
-        unresolved_conflicts = {}
-        for recipe_folder, folder_conflicts in conflicts.items():
-            for conflict_key, conflict_info in folder_conflicts.items():
-                if conflict_info['status'] == 'unresolved':
-                    add_it = True
-                    if from_kitchen is not None and to_kitchen is not None:
-                        if from_kitchen != conflict_info['from_kitchen'] or conflict_info['to_kitchen'] != to_kitchen:
-                            add_it = False
-                    if add_it:
-                        if recipe_folder not in unresolved_conflicts:
-                            unresolved_conflicts[recipe_folder] = {}
-                        unresolved_conflicts[recipe_folder][conflict_key] = conflict_info
-        return unresolved_conflicts
+        return DKConflictStore(recipe_meta_dir).get_conflicts(DKConflictStore.UNRESOLVED, from_kitchen, to_kitchen)
 
     @staticmethod
     def get_resolved_conflicts_meta(recipe_meta_dir, from_kitchen=None, to_kitchen=None):
-        conflicts = DKRecipeDisk.get_conflicts_meta(recipe_meta_dir)
-        resolved_conflicts = {}
-        for recipe_folder, folder_conflicts in conflicts.items():
-            for conflict_key, conflict_info in folder_conflicts.items():
-                if conflict_info['status'] == 'resolved':
-                    add_it = True
-                    if from_kitchen is not None and to_kitchen is not None:
-                        if from_kitchen != conflict_info['from_kitchen'] or conflict_info['to_kitchen'] != to_kitchen:
-                            add_it = False
-                    if add_it:
-                        if recipe_folder not in resolved_conflicts:
-                            resolved_conflicts[recipe_folder] = {}
-                        resolved_conflicts[recipe_folder][conflict_key] = conflict_info
-                    else:
+        store = DKConflictStore(recipe_meta_dir)
+        resolved_conflicts = store.get_conflicts(DKConflictStore.RESOLVED, from_kitchen, to_kitchen)
+        if from_kitchen is not None and to_kitchen is not None:
+            for recipe_folder, folder_conflicts in store.get_conflicts(DKConflictStore.RESOLVED).items():
+                for conflict_key, conflict_info in folder_conflicts.items():
+                    if conflict_key not in resolved_conflicts.get(recipe_folder, {}):
                         print("Found a resolved conflict for from '%s' to '%s', but we are looking for from '%s' to '%s'" % (
                             conflict_info['from_kitchen'], conflict_info['to_kitchen'], from_kitchen, to_kitchen))
         return resolved_conflicts
 
     @staticmethod
     def resolve_conflict(recipe_meta_dir, recipe_root_dir, file_path):
-        all_conflicts = DKRecipeDisk.get_conflicts_meta(recipe_meta_dir)
         norm_file_path = os.path.normpath(file_path)
         local_path_in_recipe = norm_file_path.replace(recipe_root_dir, '')
         local_path_in_recipe = re.sub("^" + os.sep + "|/$", "", local_path_in_recipe)
         recipe_name = DKRecipeDisk.find_recipe_name(recipe_root_dir)
-        for recipe_folder, folder_contents in all_conflicts.items():
-            for conflict_key, conflict_info in folder_contents.items():
-                if conflict_info['status'] == 'unresolved':
-                    path_in_recipe = os.path.join(conflict_info['folder_in_recipe'], conflict_info['filename'])
-                    path_in_recipe = re.sub(r'%s/' % recipe_name, r'', path_in_recipe)
-                    if local_path_in_recipe == path_in_recipe:
-                        conflict_info['status'] = 'resolved'
-                        folder_contents[conflict_key] = conflict_info
-                        DKRecipeDisk.save_conflicts_meta(recipe_meta_dir, all_conflicts)
-                        return True
-        return False
+        store = DKConflictStore(recipe_meta_dir)
+        if not store.resolve(local_path_in_recipe, recipe_name):
+            return False
+        return store.save()
 
     @staticmethod
     def save_conflicts_meta(recipe_meta_dir, conflicts_meta):
         conflicts_file_path = os.path.join(recipe_meta_dir, DK_CONFLICTS_META)
         with open(conflicts_file_path, 'w') as conflicts_file:
             conflicts_file.write(json.dumps(conflicts_meta, sort_keys=True, indent=2, separators=(',', ': ')))
-        return True
+        return DKConflictStore(recipe_meta_dir).update_kitchen_index()
 
     @staticmethod
     def _get_my_recipe_meta(kitchen_meta_dir, recipe_name):
@@ -323,22 +342,48 @@ class DKRecipeDisk:
         #    file_name = this_file
         return list_of_files
 
+    @staticmethod
+    def _to_bytes(contents):
+        if isinstance(contents, str):
+            return contents.encode('utf-8')
+        return contents
+
     @staticmethod
     def write_files(full_dir, file_dict):
         if 'filename' in file_dict:
             abspath = os.path.join(full_dir, file_dict['filename'])
+            if 'base64' in file_dict:
+                # a binary file
+                DKRecipeDisk.write_base64_file(abspath, file_dict['base64'])
+                return
             with open(abspath, 'wb') as the_file:
                 the_file.seek(0)
                 the_file.truncate()
                 if 'json' in file_dict:
                     if isinstance(file_dict['json'], dict) is True:
-                        json.dump(file_dict['json'], the_file, indent=4)
+                        the_file.write(json.dumps(file_dict['json'], indent=4).encode('utf-8'))
                     else:
-                        the_file.write(file_dict['json'])
+                        the_file.write(DKRecipeDisk._to_bytes(file_dict['json']))
                 elif 'text' in file_dict:
                     the_file.seek(0)
                     the_file.truncate()
-                    the_file.write(file_dict['text'])
+                    the_file.write(DKRecipeDisk._to_bytes(file_dict['text']))
+
+    @staticmethod
+    def write_base64_file(abspath, encoded, chunk_size=BASE64_CHUNK_SIZE):
+        """
+        Decodes base64 into the file a chunk at a time, so a large file is never held decoded in memory.
+        :param chunk_size: int -- characters of base64 per chunk, a multiple of 4
+        """
+        if isinstance(encoded, bytes):
+            encoded = encoded.decode('ascii')
+        if '\n' in encoded or '\r' in encoded or ' ' in encoded:
+            # wrapped base64, the chunks have to line up on whole 4 character groups
+            encoded = ''.join(encoded.split())
+        with open(abspath, 'wb') as the_file:
+            for start in range(0, len(encoded), chunk_size):
+                the_file.write(base64.b64decode(encoded[start:start + chunk_size]))
+        return True
 
 
 # http://stackoverflow.com/questions/4187564/recursive-dircmp-compare-two-directories-to-ensure-they-have-the-same-files-and
@@ -376,22 +421,27 @@ def is_same(dir1, dir2):
 
 
 def flatten_tree(remote_sha):
-    flattened_tree = {}
-    return flattened_tree
+    """
+    :param remote_sha: dict -- {'recipe/folder': [{'filename': ..., 'sha': ...}]}
+    :rtype: dict -- {path in recipe: sha}, like {'resources/a.sql': sha}
+    """
+    return RecipeTree.from_tree(remote_sha).to_dict()
 
 
+@profiled('disk')
 def compare_sha(remote_sha, local_sha):
     same = dict()
     different = dict()
     only_local = dict()
     only_remote = dict()
-    # Look for differences from remote
+    # Look for differences from remote, the files of a folder being looked up by name
     for remote_path in remote_sha:
         if remote_path in local_sha:
+            local_files = dict((local_file['filename'], local_file) for local_file in local_sha[remote_path])
             for remote_file in remote_sha[remote_path]:
-                local_files_found = [local_file for local_file in local_sha[remote_path] if local_file['filename'] == remote_file['filename']]
-                if len(local_files_found) != 0:
-                    if local_files_found[0]['sha'] == remote_file['sha']:
+                local_file = local_files.get(remote_file['filename'])
+                if local_file is not None:
+                    if local_file['sha'] == remote_file['sha']:
                         # print '%s matches' % remote_file['filename']
                         if remote_path not in same:
                             same[remote_path] = list()
@@ -401,9 +451,6 @@ def compare_sha(remote_sha, local_sha):
                             different[remote_path] = list()
                         # print '%s different' % remote_file['filename']
                         different[remote_path].append(remote_file)
-                elif len(local_files_found) > 1:
-                    # print 'compare_sha: Unexpected return in remote_path'
-                    raise
                 else:
                     # print '%s not found for local' % remote_file['filename']
                     if remote_path not in only_remote:
@@ -415,6 +462,8 @@ def compare_sha(remote_sha, local_sha):
                 only_remote[remote_path] = list()
 
     ignore = DKIgnore()
+    remote_files = dict((remote_path, set(remote_file['filename'] for remote_file in remote_sha[remote_path]))
+                        for remote_path in remote_sha if remote_path in local_sha)
     for local_path, local_files in local_sha.items():
         if ignore.ignore(local_path):
             # Ignore some stuff.
@@ -428,11 +477,7 @@ def compare_sha(remote_sha, local_sha):
                 elif ignore.ignore(os.path.join(local_path, local_file['filename'])):
                     # print '%s ignoring' % os.path.join(local_path, local_file['filename'])
                     continue
-                remote_files_found = [remote_file for remote_file in remote_sha[local_path] if remote_file['filename'] == local_file['filename']]
-                if len(remote_files_found) > 1:
-                    # print 'compare_sha: Unexpected return in remote_path'
-                    raise
-                elif len(remote_files_found) == 0:
+                if local_file['filename'] not in remote_files[local_path]:
                     if local_path not in only_local:
                         only_local[local_path] = list()
                     # print '%s missing from remote' % local_file['filename']
@@ -450,23 +495,58 @@ def compare_sha(remote_sha, local_sha):
     return rv
 
 
-def get_directory_sha(walk_dir):
+def walk_recipe(walk_dir, ignore=None):
+    """
+    Walks a recipe folder with os.scandir, lazily and in name order, a folder before what it holds.
+    The folders ignore rejects are not entered, nor are the links to folders.
+    :param ignore: DKIgnore -- checked against the name of each folder, None to enter them all
+    :rtype: generator of (path relative to walk_dir, os.DirEntry) -- for the files and the folders, the DirEntry
+        keeping its stat for the caller
+    """
+    folders = ['']
+    while len(folders) > 0:
+        relative_dir = folders.pop()
+        try:
+            # read at once so no folder stays open while the caller works on an entry
+            with os.scandir(os.path.join(walk_dir, relative_dir)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = list()
+        for entry in entries:
+            path = os.path.join(relative_dir, entry.name) if len(relative_dir) > 0 else entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if ignore is not None and ignore.ignore(entry.name):
+                    continue
+                if not entry.is_symlink():
+                    subdirs.append(path)
+            yield path, entry
+        folders.extend(reversed(subdirs))
+
+
+@profiled('disk')
+def get_directory_sha(walk_dir, use_git_index=False):
+    """
+    :param use_git_index: bool -- take the sha of the files git has not seen change from the index of the git
+        working tree walk_dir is in, if any, see DKGitIndex
+    :rtype: dict -- {'recipe/folder': [{'filename': ..., 'sha': ...}]}
+    """
     recipe_name = os.path.basename(walk_dir)
-    rootdir = os.path.dirname(walk_dir)
+    git_index = DKGitIndex.find(walk_dir) if use_git_index else None
     r = dict()
     r[recipe_name] = []
-    for root, subdirs, files in os.walk(walk_dir):
-        for filename in files:
-            if not filename in IGNORED_FILES:
-                file_path = os.path.join(root, filename)
-                part = file_path.split(rootdir, 1)[1]
-                part2 = part.split(filename, 1)[0]
-                part3 = part2[1:-1]
-                with open(file_path) as file_obj:
-                    r[part3].append({'filename': filename, 'sha': githash_fileobj(file_obj)})
-        for subdir in subdirs:
-            subdir_fullpath = os.path.join(root, subdir)
-            part = subdir_fullpath.split(rootdir, 1)[1]
-            part2 = part[1:]
-            r[part2] = []
+    for path, entry in walk_recipe(walk_dir, DKIgnore()):
+        if entry.is_dir():
+            r[os.path.join(recipe_name, path)] = []
+        elif entry.name not in IGNORED_FILES:
+            sha = git_index.get_sha(entry.path, entry.stat()) if git_index is not None else None
+            if sha is None:
+                with open(entry.path, 'rb') as file_obj:
+                    sha = githash_fileobj(file_obj)
+            r[os.path.join(recipe_name, os.path.dirname(path)).rstrip(os.sep)].append(
+                {'filename': entry.name, 'sha': sha})
     return r
@@ -0,0 +1,237 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .DKRecipeDisk import DKRecipeDisk, IGNORED_FILES
+from .DKRecipeTree import RecipeTree
+from .DKIgnore import DKIgnore
+from .DKGitIndex import DKGitIndex
+from .DKProfiler import profiled
+from .DKReturnCode import DKReturnCode
+from .githash import githash_fileobj
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+recipe-get into a recipe folder that already exists, as a pipeline instead of one stage after the other.
+
+    tree fetch ---\
+                   diff, a folder at a time --> [batches of paths] --> downloads --> [files] --> disk writes
+    hashing ------/
+
+The remote tree is fetched while the local folders are hashed on a pool of disk workers, and each folder is
+compared with the tree as soon as both are there. The files missing locally go out in recipe/get requests of
+batch_size paths while the earlier batches are written, so the time is close to the slower of the network and the
+disk rather than their sum. The two queues between the stages hold at most queue_size items each: when the disk
+falls behind the downloads wait, and when the downloads fall behind the diff waits, so memory does not grow with
+the size of the recipe.
+
+Only the files missing locally are written. The files that differ are reported, for the caller to merge.
+"""
+
+
+class DKRecipeGetPipeline(object):
+    BATCH_SIZE = 50  # paths asked for in one recipe/get
+    QUEUE_SIZE = 4  # items waiting between two stages
+    DOWNLOAD_WORKERS = 4
+    WRITE_WORKERS = 2
+
+    def __init__(self, dk_api, kitchen, recipe, kitchen_dir, use_git_index=False, disk_workers=8,
+                 batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE, download_workers=DOWNLOAD_WORKERS,
+                 write_workers=WRITE_WORKERS):
+        """
+        :param kitchen_dir: str -- the root of the kitchen folder, the recipe folder being kitchen_dir/recipe
+        :param disk_workers: int -- threads hashing the local folders
+        """
+        self._dk_api = dk_api
+        self._kitchen = kitchen
+        self._recipe = recipe
+        self._kitchen_dir = kitchen_dir
+        self._recipe_dir = os.path.join(kitchen_dir, recipe)
+        self._git_index = DKGitIndex.find(self._recipe_dir) if use_git_index else None
+        self._ignore = DKIgnore()
+        self._disk_workers = disk_workers
+        self._batch_size = batch_size
+        self._download_workers = download_workers
+        self._write_workers = write_workers
+        self._download_queue = queue.Queue(maxsize=queue_size)
+        self._write_queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._batch = list()
+        self._remote_only_folders = set()
+        self._different = dict()
+        self._written = list()
+        self._failed = list()
+
+    def run(self):
+        """
+        :rtype: DKReturnCode -- the payload is {'only_remote': [paths written], 'only_remote_folders': [folders
+            created], 'different': {folder: [{'filename', 'sha'}]} as in compare_sha, the remote shas}
+        """
+        rc = DKReturnCode()
+        tree_executor = ThreadPoolExecutor(max_workers=1)
+        disk_executor = ThreadPoolExecutor(max_workers=self._disk_workers)
+        threads = [threading.Thread(target=self._download, name='DKRecipeGetPipeline-download')
+                   for i in range(self._download_workers)]
+        writers = [threading.Thread(target=self._write, name='DKRecipeGetPipeline-write')
+                   for i in range(self._write_workers)]
+        for thread in threads + writers:
+            thread.daemon = True
+            thread.start()
+        try:
+            tree_future = tree_executor.submit(self._dk_api.get_remote_tree, self._kitchen, self._recipe,
+                                               self._recipe_dir)
+            pending = {disk_executor.submit(self._hash_folder, '')}
+            remote = None
+            hashed = list()  # folders hashed before the tree came
+            while len(pending) > 0 or remote is None:
+                waiting = pending | {tree_future} if remote is None else pending
+                done, not_done = wait(waiting, return_when=FIRST_COMPLETED)
+                pending = not_done - {tree_future}
+                if tree_future in done:
+                    tree_rc = tree_future.result()
+                    if not tree_rc.ok():
+                        return tree_rc
+                    remote = RecipeTree.from_tree(tree_rc.get_payload(), self._recipe)
+                    self._add_remote_only_folders(remote)
+                    for folder, files in hashed:
+                        self._diff_folder(remote, folder, files)
+                    hashed = list()
+                for future in done - {tree_future}:
+                    folder, files, subdirs = future.result()
+                    for subdir in subdirs:
+                        if subdir not in self._remote_only_folders:
+                            pending.add(disk_executor.submit(self._hash_folder, subdir))
+                    if remote is None:
+                        hashed.append((folder, files))
+                    else:
+                        self._diff_folder(remote, folder, files)
+            if len(self._batch) > 0:
+                self._download_queue.put(self._batch)
+                self._batch = list()
+        finally:
+            for thread in threads:
+                self._download_queue.put(None)
+            for thread in threads:
+                thread.join()
+            for thread in writers:
+                self._write_queue.put(None)
+            for thread in writers:
+                thread.join()
+            disk_executor.shutdown()
+            tree_executor.shutdown()
+
+        payload = {'only_remote': sorted(self._written), 'only_remote_folders': sorted(self._remote_only_folders),
+                   'different': self._different}
+        if len(self._failed) > 0:
+            rc.set(rc.DK_FAIL, '\n'.join(self._failed), payload)
+        else:
+            rc.set(rc.DK_SUCCESS, None, payload)
+        return rc
+
+    # diff ---------------------------------
+
+    def _get_folder_key(self, folder):
+        return os.path.join(self._recipe, folder) if len(folder) > 0 else self._recipe
+
+    def _add_remote_only_folders(self, remote):
+        # the folders missing locally are not hashed, all their files are fetched
+        for folder in remote.get_folders():
+            if len(folder) == 0 or os.path.isdir(os.path.join(self._recipe_dir, folder)):
+                continue
+            self._remote_only_folders.add(folder)
+            os.makedirs(os.path.join(self._recipe_dir, folder), exist_ok=True)
+            for path in remote.get_files_in_folder(folder):
+                self._get_later(path)
+
+    def _diff_folder(self, remote, folder, files):
+        for path in remote.get_files_in_folder(folder):
+            filename = os.path.basename(path)
+            if filename not in files:
+                self._get_later(path)
+            elif files[filename] != remote.get_sha(path):
+                folder_key = self._get_folder_key(folder)
+                if folder_key not in self._different:
+                    self._different[folder_key] = list()
+                self._different[folder_key].append({'filename': filename, 'sha': remote.get_sha(path)})
+
+    def _get_later(self, path):
+        self._batch.append(path)
+        if len(self._batch) >= self._batch_size:
+            # blocks while the downloads are queue_size batches behind
+            self._download_queue.put(self._batch)
+            self._batch = list()
+
+    # stages ---------------------------------
+
+    @profiled('disk')
+    def _hash_folder(self, folder):
+        """
+        :param folder: str -- relative to the recipe root, '' for the root
+        :rtype: (str, dict, list) -- the folder, {filename: sha} of its files and its sub folders
+        """
+        files = dict()
+        subdirs = list()
+        try:
+            with os.scandir(os.path.join(self._recipe_dir, folder)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            return folder, files, subdirs
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                # as walk_recipe does
+                if not self._ignore.ignore(entry.name) and not entry.is_symlink():
+                    subdirs.append(os.path.join(folder, entry.name) if len(folder) > 0 else entry.name)
+            elif entry.name not in IGNORED_FILES:
+                sha = self._git_index.get_sha(entry.path, entry.stat()) if self._git_index is not None else None
+                if sha is None:
+                    with open(entry.path, 'rb') as file_obj:
+                        sha = githash_fileobj(file_obj)
+                files[entry.name] = sha
+        return folder, files, subdirs
+
+    def _download(self):
+        # every failure is reported and the thread goes on draining the queue, a dead stage would block the others
+        while True:
+            batch = self._download_queue.get()
+            if batch is None:
+                return
+            try:
+                rc = self._dk_api.get_recipe(self._kitchen, self._recipe, batch)
+                if not rc.ok():
+                    self._fail('Unable to get %d files: %s' % (len(batch), rc.get_message()))
+                    continue
+                folders = rc.get_payload()['recipes'][self._recipe]
+            except Exception as e:
+                self._fail('Unable to get %d files: %s' % (len(batch), str(e)))
+                continue
+            # blocks while the disk is queue_size batches behind
+            self._write_queue.put(folders)
+
+    def _write(self):
+        while True:
+            folders = self._write_queue.get()
+            if folders is None:
+                return
+            try:
+                self._write_batch(folders)
+            except Exception as e:
+                self._fail('Unable to write files: %s' % str(e))
+
+    @profiled('disk')
+    def _write_batch(self, folders):
+        for folder, files in folders.items():
+            full_dir = os.path.join(self._kitchen_dir, folder)
+            os.makedirs(full_dir, exist_ok=True)
+            for file_dict in files:
+                DKRecipeDisk.write_files(full_dir, file_dict)
+                with self._lock:
+                    self._written.append(RecipeTree.get_path_in_recipe(folder, file_dict['filename']))
+
+    def _fail(self, message):
+        with self._lock:
+            self._failed.append(message)
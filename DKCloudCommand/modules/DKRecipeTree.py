@@ -0,0 +1,197 @@
+import os
+from bisect import bisect_left
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+A path indexed view of a recipe tree.
+
+The server (recipe/tree) and get_directory_sha describe a recipe as folders of files:
+
+    {'simple': [{'filename': 'description.json', 'sha': ...}], 'simple/resources': [...], 'simple/empty': []}
+
+RecipeTree keeps the same content as two aligned lists sorted by the path of each file in the recipe
+('resources/a.sql'), plus the sorted list of folders so the empty ones are kept. Lookups are a bisect, a folder is
+a contiguous slice of the paths and two trees are compared in one merge walk, instead of the nested folder and file
+loops, and a file costs one path and one sha string instead of a dict.
+"""
+
+
+class RecipeTree(object):
+
+    def __init__(self, recipe_name, paths=(), shas=(), folders=()):
+        """
+        :param paths: sorted list of the paths of the files in the recipe
+        :param shas: the shas of the files, aligned with paths
+        :param folders: sorted list of the folders in the recipe, '' being the recipe root
+        """
+        self._recipe_name = recipe_name
+        self._paths = list(paths)
+        self._shas = list(shas)
+        self._folders = list(folders)
+
+    @staticmethod
+    def get_path_in_recipe(folder, filename=None):
+        """
+        :param folder: str -- a folder of a recipe tree, starting with the recipe name: 'simple/resources'
+        :param filename: str -- a file in that folder, or None for the folder itself
+        :rtype: str -- the path relative to the recipe root: 'resources/a.sql'
+        """
+        folder_in_recipe = os.sep.join(folder.split(os.sep)[1:])
+        if filename is None:
+            return folder_in_recipe
+        return os.path.join(folder_in_recipe, filename)
+
+    @staticmethod
+    def from_tree(tree, recipe_name=None):
+        """
+        :param tree: dict -- {'recipe/folder': [{'filename': ..., 'sha': ...}]}, from recipe/tree or
+            get_directory_sha
+        :rtype: RecipeTree
+        """
+        entries = list()
+        folders = set()
+        for folder, files in tree.items():
+            if recipe_name is None:
+                recipe_name = folder.split(os.sep)[0]
+            folder_in_recipe = RecipeTree.get_path_in_recipe(folder)
+            folders.add(folder_in_recipe)
+            for the_file in files:
+                entries.append((os.path.join(folder_in_recipe, the_file['filename']), the_file['sha']))
+        entries.sort()
+        return RecipeTree(recipe_name, [path for path, sha in entries], [sha for path, sha in entries],
+                          sorted(folders))
+
+    def to_tree(self):
+        """
+        :rtype: dict -- the folders of files format from_tree takes
+        """
+        tree = dict()
+        for folder in self._folders:
+            tree[self._get_folder_key(folder)] = list()
+        for path, sha in zip(self._paths, self._shas):
+            folder = self._get_folder_key(os.path.dirname(path))
+            tree.setdefault(folder, list()).append({'filename': os.path.basename(path), 'sha': sha})
+        return tree
+
+    def to_dict(self):
+        """
+        :rtype: dict -- {path in recipe: sha}
+        """
+        return dict(zip(self._paths, self._shas))
+
+    def _get_folder_key(self, folder):
+        return os.path.join(self._recipe_name, folder) if len(folder) > 0 else self._recipe_name
+
+    def get_recipe_name(self):
+        return self._recipe_name
+
+    def get_paths(self):
+        return self._paths
+
+    def get_folders(self):
+        return self._folders
+
+    def items(self):
+        return zip(self._paths, self._shas)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __contains__(self, path):
+        i = bisect_left(self._paths, path)
+        return i < len(self._paths) and self._paths[i] == path
+
+    def get_sha(self, path):
+        """
+        :rtype: str -- the sha of the file, or None when it is not in the tree
+        """
+        i = bisect_left(self._paths, path)
+        if i < len(self._paths) and self._paths[i] == path:
+            return self._shas[i]
+        return None
+
+    def has_folder(self, folder):
+        i = bisect_left(self._folders, folder)
+        return i < len(self._folders) and self._folders[i] == folder
+
+    @staticmethod
+    def _get_range(sorted_list, folder):
+        # the paths under folder are the ones between 'folder/' and 'folder0', '0' being the character after '/'
+        if len(folder) == 0:
+            return 0, len(sorted_list)
+        prefix = folder.rstrip(os.sep) + os.sep
+        after = prefix[:-1] + chr(ord(os.sep) + 1)
+        return bisect_left(sorted_list, prefix), bisect_left(sorted_list, after)
+
+    def get_files_in_folder(self, folder, recursive=False):
+        """
+        :param folder: str -- a folder in the recipe, '' for the recipe root
+        :param recursive: bool -- also the files of the sub folders
+        :rtype: list -- the paths of the files, sorted
+        """
+        lo, hi = RecipeTree._get_range(self._paths, folder)
+        if recursive:
+            return self._paths[lo:hi]
+        start = len(folder.rstrip(os.sep)) + 1 if len(folder) > 0 else 0
+        return [path for path in self._paths[lo:hi] if os.sep not in path[start:]]
+
+    def subtree(self, folder):
+        """
+        :rtype: RecipeTree -- the files and folders under folder, their paths still relative to the recipe root
+        """
+        lo, hi = RecipeTree._get_range(self._paths, folder)
+        folder_lo, folder_hi = RecipeTree._get_range(self._folders, folder)
+        folders = self._folders[folder_lo:folder_hi]
+        if len(folder) > 0 and self.has_folder(folder.rstrip(os.sep)):
+            folders.insert(0, folder.rstrip(os.sep))
+        return RecipeTree(self._recipe_name, self._paths[lo:hi], self._shas[lo:hi], folders)
+
+    def compare(self, local):
+        """
+        This tree is the remote side. One walk over both sorted path lists.
+        :param local: RecipeTree
+        :rtype: dict -- lists of paths: 'same', 'different', 'only_local', 'only_remote', and the folders
+            'only_local_folders', 'only_remote_folders'
+        """
+        rv = {'same': list(), 'different': list(), 'only_local': list(), 'only_remote': list()}
+        remote_paths, local_paths = self._paths, local.get_paths()
+        local_shas = local._shas
+        i = j = 0
+        while i < len(remote_paths) and j < len(local_paths):
+            if remote_paths[i] == local_paths[j]:
+                rv['same' if self._shas[i] == local_shas[j] else 'different'].append(remote_paths[i])
+                i += 1
+                j += 1
+            elif remote_paths[i] < local_paths[j]:
+                rv['only_remote'].append(remote_paths[i])
+                i += 1
+            else:
+                rv['only_local'].append(local_paths[j])
+                j += 1
+        rv['only_remote'].extend(remote_paths[i:])
+        rv['only_local'].extend(local_paths[j:])
+        rv['only_remote_folders'], rv['only_local_folders'] = RecipeTree._diff_sorted(self._folders,
+                                                                                      local.get_folders())
+        return rv
+
+    @staticmethod
+    def _diff_sorted(left, right):
+        only_left, only_right = list(), list()
+        i = j = 0
+        while i < len(left) and j < len(right):
+            if left[i] == right[j]:
+                i += 1
+                j += 1
+            elif left[i] < right[j]:
+                only_left.append(left[i])
+                i += 1
+            else:
+                only_right.append(right[j])
+                j += 1
+        only_left.extend(left[i:])
+        only_right.extend(right[j:])
+        return only_left, only_right
@@ -0,0 +1,360 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from .githash import githash_fileobj
+from .DKIgnore import DKIgnore
+from .DKRecipeDisk import flatten_tree, walk_recipe
+from .DKReturnCode import DKReturnCode
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+dk recipe-watch: pushes the files of a recipe to its kitchen as they are saved.
+
+File system events come from inotify on Linux (through ctypes, no extra package), or from polling the stats of
+the recipe files elsewhere. A burst of events (an editor saving, a git checkout) is collected until the recipe
+has been quiet for 'debounce' seconds, then only the files that really changed are sent, over the one logged
+in DKCloudAPI session.
+
+The watcher keeps two indexes in memory:
+  - local: path -> (mtime_ns, size, sha), so a file is only hashed again when its stat changes
+  - remote: path -> sha, the recipe tree fetched once at start, then kept up to date with what was sent
+"""
+
+
+class DKRecipeWatcher(object):
+    DEFAULT_DEBOUNCE = 0.3  # seconds of quiet before a burst of events is synced
+    DEFAULT_POLL_INTERVAL = 1.0  # seconds, for the polling fallback
+
+    def __init__(self, dk_api, kitchen, recipe, recipe_dir, message, debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True, output=None):
+        self._dk_api = dk_api
+        self._kitchen = kitchen
+        self._recipe = recipe
+        self._recipe_dir = os.path.abspath(recipe_dir)
+        self._message = message
+        self._debounce = debounce
+        self._poll_interval = poll_interval
+        self._use_inotify = use_inotify
+        self._output = output if output is not None else sys.stdout
+        self._ignore = DKIgnore()
+        self._local_index = dict()
+        self._remote_index = dict()
+        self._source = None
+        self._stopped = False
+
+    # indexes ---------------------------------
+
+    def start(self):
+        """
+        Fetches the remote tree, hashes the recipe once and subscribes to the file events.
+        :rtype: DKReturnCode -- the message lists the files that already differ from the server
+        """
+        rc = self._dk_api.recipe_tree(self._kitchen, self._recipe)
+        if not rc.ok():
+            rc.set_message('recipe-watch: unable to get the tree of recipe %s\nmessage: %s' % (self._recipe,
+                                                                                             rc.get_message()))
+            return rc
+        self._remote_index = flatten_tree(rc.get_payload())
+        for path, entry in self._walk():
+            try:
+                self._hash(path, entry.stat())
+            except OSError:
+                continue
+
+        if self._use_inotify and _InotifySource.is_available():
+            self._source = _InotifySource(self._recipe_dir, self._ignore)
+        else:
+            self._source = _PollingSource(self._walk_stats)
+
+        pending = sorted(path for path in set(self._local_index) | set(self._remote_index)
+                         if self._local_index.get(path, (None, None, None))[2] != self._remote_index.get(path))
+        msg = "Watching recipe '%s' in kitchen '%s' (%s)" % (self._recipe, self._kitchen, self._source.NAME)
+        if len(pending) > 0:
+            msg += '\n%d files differ from the server and are only sent once they change, or with recipe-update:\n%s' \
+                   % (len(pending), '\n'.join('\t%s' % path for path in pending))
+        rc = DKReturnCode()
+        rc.set(rc.DK_SUCCESS, msg)
+        return rc
+
+    def get_local_index(self):
+        return self._local_index
+
+    def get_remote_index(self):
+        return self._remote_index
+
+    def _walk(self):
+        """
+        :rtype: generator of (path, os.DirEntry) for the files of the recipe that are not ignored
+        """
+        for path, entry in walk_recipe(self._recipe_dir, self._ignore):
+            if not entry.is_dir() and not self._ignore.ignore(entry.name):
+                yield path, entry
+
+    def _walk_stats(self):
+        stats = dict()
+        for path, entry in self._walk():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            stats[path] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def _hash(self, path, st=None):
+        """
+        :param st: os.stat_result -- the stat of the file when the caller has it already, from a DirEntry
+        :rtype: str -- the sha of the file, from the index when its stat did not change, None if it is gone
+        """
+        full_path = os.path.join(self._recipe_dir, path)
+        try:
+            if st is None:
+                st = os.stat(full_path)
+            entry = self._local_index.get(path)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                return entry[2]
+            with open(full_path, 'rb') as file_obj:
+                sha = githash_fileobj(file_obj)
+        except (IOError, OSError):
+            self._local_index.pop(path, None)
+            return None
+        self._local_index[path] = (st.st_mtime_ns, st.st_size, sha)
+        return sha
+
+    # sync ---------------------------------
+
+    def sync(self, paths):
+        """
+        Sends the files among paths whose content differs from the server: update, add or delete.
+        :param paths: iterable of paths relative to the recipe root
+        :rtype: DKReturnCode -- the payload is the list of (op, path) sent
+        """
+        sent = list()
+        failed = list()
+        for path in sorted(self._expand_folders(paths)):
+            if self._ignore.ignore(path):
+                continue
+            sha = self._hash(path)
+            remote_sha = self._remote_index.get(path)
+            if sha == remote_sha:
+                continue
+            if sha is None:
+                op = 'delete'
+                rc = self._dk_api.delete_file(self._kitchen, self._recipe, self._message, path, os.path.basename(path))
+            else:
+                op = 'add' if remote_sha is None else 'update'
+                rc = self._dk_api.upload_file(self._kitchen, self._recipe, self._message, path,
+                                              os.path.join(self._recipe_dir, path), add=remote_sha is None,
+                                              base_sha=remote_sha)
+            if not rc.ok():
+                failed.append('%s: %s' % (path, rc.get_message()))
+                continue
+            if sha is None:
+                del self._remote_index[path]
+            else:
+                self._remote_index[path] = sha
+            sent.append((op, path))
+
+        rc = DKReturnCode()
+        msg = '\n'.join('%s - %s %s' % (time.strftime('%Y-%m-%d %H:%M:%S'), op, path) for op, path in sent)
+        if len(failed) > 0:
+            rc.set(rc.DK_FAIL, msg + '\nFailed:\n' + '\n'.join('\t%s' % f for f in failed), sent)
+        else:
+            rc.set(rc.DK_SUCCESS, msg, sent)
+        return rc
+
+    def _expand_folders(self, paths):
+        # a folder moved away or deleted stands for every file known under it
+        expanded = set()
+        for path in paths:
+            if os.path.isdir(os.path.join(self._recipe_dir, path)):
+                continue
+            prefix = path + os.sep
+            under = [known for known in set(self._local_index) | set(self._remote_index) if known.startswith(prefix)]
+            if len(under) > 0:
+                expanded.update(under)
+            else:
+                expanded.add(path)
+        return expanded
+
+    def run_once(self, timeout=None):
+        """
+        Waits for a burst of changes, then syncs it.
+        :rtype: DKReturnCode, or None when nothing changed before timeout
+        """
+        paths = self._source.wait(timeout)
+        if len(paths) == 0:
+            return None
+        # debounce: keep collecting until the recipe has been quiet for a while
+        while True:
+            more = self._source.wait(self._debounce)
+            if len(more) == 0:
+                break
+            paths.update(more)
+        return self.sync(paths)
+
+    def run(self):
+        """
+        Syncs until stop() or Ctrl-C.
+        """
+        try:
+            while not self._stopped:
+                rc = self.run_once(self._poll_interval)
+                if rc is not None and len(rc.get_message()) > 0:
+                    self._output.write(rc.get_message() + '\n')
+                    self._output.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stopped = True
+
+    def close(self):
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+
+class _PollingSource(object):
+    NAME = 'polling'
+    STAT_INTERVAL = 0.1  # seconds between two walks of the recipe
+
+    def __init__(self, walk_stats):
+        self._walk_stats = walk_stats
+        self._stats = walk_stats()
+
+    def wait(self, timeout=None):
+        """
+        :rtype: set -- the paths whose stat changed, appeared or disappeared
+        """
+        deadline = time.time() + (timeout if timeout is not None else float('inf'))
+        while True:
+            stats = self._walk_stats()
+            changed = set(path for path in set(stats) | set(self._stats) if stats.get(path) != self._stats.get(path))
+            self._stats = stats
+            if len(changed) > 0 or time.time() >= deadline:
+                return changed
+            time.sleep(min(max(0.0, deadline - time.time()), _PollingSource.STAT_INTERVAL))
+
+    def close(self):
+        pass
+
+
+class _InotifySource(object):
+    NAME = 'inotify'
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct('iIII')
+
+    _libc = None
+
+    @staticmethod
+    def is_available():
+        if not sys.platform.startswith('linux'):
+            return False
+        return _InotifySource._get_libc() is not None
+
+    @staticmethod
+    def _get_libc():
+        if _InotifySource._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError):
+                return None
+            _InotifySource._libc = libc
+        return _InotifySource._libc
+
+    def __init__(self, recipe_dir, ignore):
+        self._libc = _InotifySource._get_libc()
+        self._ignore = ignore
+        self._fd = self._libc.inotify_init1(_InotifySource.IN_NONBLOCK | _InotifySource.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = dict()  # watch descriptor -> directory relative to the recipe root
+        self._recipe_dir = recipe_dir
+        self._add_tree('')
+
+    def _add_tree(self, relative_dir):
+        self._add_watch(relative_dir)
+        for path, entry in walk_recipe(os.path.join(self._recipe_dir, relative_dir), self._ignore):
+            if entry.is_dir() and not entry.is_symlink():
+                self._add_watch(os.path.join(relative_dir, path))
+
+    def _add_watch(self, relative_dir):
+        full_dir = os.path.normpath(os.path.join(self._recipe_dir, relative_dir))
+        wd = self._libc.inotify_add_watch(self._fd, full_dir.encode('utf-8'), _InotifySource.MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, 'inotify_add_watch failed for %s' % full_dir)
+        self._watches[wd] = '' if relative_dir == '.' else relative_dir
+
+    def _files_under(self, relative_dir):
+        found = set()
+        for path, entry in walk_recipe(os.path.join(self._recipe_dir, relative_dir), self._ignore):
+            if not entry.is_dir():
+                found.add(os.path.normpath(os.path.join(relative_dir, path)))
+        return found
+
+    def wait(self, timeout=None):
+        """
+        :rtype: set -- paths of the files created, written, moved or deleted
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _InotifySource.EVENT_HEADER.unpack_from(data, offset)
+                offset += _InotifySource.EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += length
+                if mask & _InotifySource.IN_IGNORED:
+                    # the kernel dropped the watch, its folder is gone
+                    self._watches.pop(wd, None)
+                    continue
+                if wd not in self._watches or len(name) == 0 or self._ignore.ignore(name):
+                    continue
+                path = os.path.join(self._watches[wd], name)
+                if mask & _InotifySource.IN_ISDIR:
+                    if mask & (_InotifySource.IN_CREATE | _InotifySource.IN_MOVED_TO):
+                        # a new folder: watch it, and its files count as created
+                        self._add_tree(path)
+                        changed.update(self._files_under(path))
+                    # the folder itself too, so an empty new folder still counts as activity for the debounce.
+                    # DKRecipeWatcher.sync skips existing folders and expands a gone one to the files it knew there
+                    changed.add(path)
+                    continue
+                changed.add(path)
+        return changed
+
+    def close(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,154 @@
+import os
+import json
+import tempfile
+from .DKIgnore import DKIgnore
+from .DKRecipeDisk import walk_recipe
+
+__author__ = 'DataKitchen, Inc.'
+
+"""
+Progress of a recipe-update, in .dk/recipes/<recipe>/UPDATE_JOURNAL, so an interrupted update resumes where it
+stopped instead of hashing the recipe and fetching the remote tree again.
+
+The journal is json lines: the first line is the plan of the update,
+
+    {"kitchen": ..., "recipe": ..., "plan": {"update": [paths], "add": [paths], "delete": [paths]},
+     "snapshot": {path: [mtime_ns, size], ...}}
+
+where snapshot is the stat of every local file when the plan was made, and each following line is one change
+the server confirmed, {"op": "update", "path": "resources/a.sql"}. Lines are only ever appended, so recording a
+change costs one small write, whatever the size of the update.
+
+The plan is only trusted again when no file outside of it was touched since (same files, same stats).
+Planned files that changed since are sent again. The journal is removed once the update completes.
+"""
+
+
+class DKUpdateJournal(object):
+    UPDATE_JOURNAL = 'UPDATE_JOURNAL'
+    UPDATE = 'update'
+    ADD = 'add'
+    DELETE = 'delete'
+    OPS = [UPDATE, ADD, DELETE]
+
+    def __init__(self, recipe_meta_dir):
+        self._recipe_meta_dir = recipe_meta_dir
+        self._journal_file = None
+
+    def get_path(self):
+        return os.path.join(self._recipe_meta_dir, DKUpdateJournal.UPDATE_JOURNAL)
+
+    @staticmethod
+    def take_snapshot(recipe_dir):
+        """
+        :rtype: dict -- {path relative to recipe_dir: [mtime_ns, size]} for every file recipe-update looks at
+        """
+        ignore = DKIgnore()
+        snapshot = dict()
+        for path, entry in walk_recipe(recipe_dir, ignore):
+            if entry.is_dir() or ignore.ignore(entry.name):
+                continue
+            st = entry.stat()
+            snapshot[path] = [st.st_mtime_ns, st.st_size]
+        return snapshot
+
+    def start(self, kitchen, recipe, plan, snapshot):
+        """
+        Replaces any earlier journal with the plan of a new update.
+        :param plan: dict -- {'update': [paths], 'add': [paths], 'delete': [paths]}
+        """
+        self.close()
+        header = {'kitchen': kitchen, 'recipe': recipe, 'plan': plan, 'snapshot': snapshot}
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self._recipe_meta_dir, prefix='.journal')
+            with os.fdopen(fd, 'w') as temp_file:
+                temp_file.write(json.dumps(header) + '\n')
+            os.replace(temp_path, self.get_path())
+            self._journal_file = open(self.get_path(), 'a')
+        except (IOError, OSError) as e:
+            print('%s - unable to start the update journal: %s' % (self.get_path(), str(e)))
+            self._journal_file = None
+            return False
+        return True
+
+    def record(self, op, path):
+        if self._journal_file is None:
+            return
+        self._journal_file.write(json.dumps({'op': op, 'path': path}) + '\n')
+        # flushed so the change survives the process being killed
+        self._journal_file.flush()
+
+    def load(self):
+        """
+        :rtype: (dict, set) -- the header and the set of (op, path) done, or (None, None) without a journal
+        """
+        try:
+            with open(self.get_path(), 'r') as journal_file:
+                lines = journal_file.read().split('\n')
+        except (IOError, OSError):
+            return None, None
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return None, None
+        done = set()
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of a killed process can be cut short
+                continue
+            done.add((entry['op'], entry['path']))
+        return header, done
+
+    def resume(self, kitchen, recipe, snapshot):
+        """
+        :param snapshot: dict -- take_snapshot of the recipe now
+        :rtype: (dict, set) -- the plan and the (op, path) still valid as done, or (None, None) when the journal
+            is missing, belongs to another update, or files outside the plan changed since
+        """
+        header, done = self.load()
+        if header is None or header.get('kitchen') != kitchen or header.get('recipe') != recipe:
+            return None, None
+        plan = header['plan']
+        planned = set()
+        for op in DKUpdateJournal.OPS:
+            planned.update(plan.get(op, []))
+        old_snapshot = header.get('snapshot', {})
+        if set(old_snapshot.keys()) != set(snapshot.keys()):
+            return None, None
+        changed = set(path for path, stat in snapshot.items() if old_snapshot[path] != stat)
+        if len(changed - planned) > 0:
+            return None, None
+        # a planned file edited after it was sent is sent again
+        done = set((op, path) for op, path in done if path not in changed)
+        # stat of the edited files, for the next resume
+        header['snapshot'] = snapshot
+        self._rewrite(header, done)
+        return plan, done
+
+    def _rewrite(self, header, done):
+        self.close()
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self._recipe_meta_dir, prefix='.journal')
+            with os.fdopen(fd, 'w') as temp_file:
+                temp_file.write(json.dumps(header) + '\n')
+                for op, path in sorted(done):
+                    temp_file.write(json.dumps({'op': op, 'path': path}) + '\n')
+            os.replace(temp_path, self.get_path())
+            self._journal_file = open(self.get_path(), 'a')
+        except (IOError, OSError) as e:
+            print('%s - unable to update the update journal: %s' % (self.get_path(), str(e)))
+            self._journal_file = None
+
+    def close(self):
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def clear(self):
+        self.close()
+        try:
+            os.remove(self.get_path())
+        except OSError:
+            pass
@@ -1,20 +1,23 @@
 #!/usr/bin/env python
 
+import os
 from sys import argv
 from hashlib import sha1
-from io import StringIO
+from io import BytesIO
 
 class githash(object):
     def __init__(self):
-        self.buf = StringIO()
+        self.buf = BytesIO()
 
     def update(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         self.buf.write(data)
 
     def hexdigest(self):
         data = self.buf.getvalue()
         h = sha1()
-        h.update("blob %u\0" % len(data))
+        h.update(("blob %u\0" % len(data)).encode('utf-8'))
         h.update(data)
 
         return h.hexdigest()
@@ -30,7 +33,22 @@ def githash_fileobj(fileobj):
     return githash_data(fileobj.read())
 
 
+def githash_path(path, chunk_size=1024 * 1024):
+    """
+    The git blob sha of a file, read chunk_size bytes at a time instead of all at once.
+    """
+    with open(path, 'rb') as fileobj:
+        h = sha1()
+        h.update(("blob %u\0" % os.fstat(fileobj.fileno()).st_size).encode('utf-8'))
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
 if __name__ == '__main__':
     for filename in argv[1:]:
-        fileobj = file(filename)
+        fileobj = open(filename, 'rb')
         print((githash_fileobj(fileobj)))
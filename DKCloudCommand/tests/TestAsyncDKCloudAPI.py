@@ -0,0 +1,73 @@
+import unittest
+import threading
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from AsyncDKCloudAPI import AsyncDKCloudAPI
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKReturnCode import DKReturnCode
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class SlowAPI(DKCloudAPI):
+    _delay = 0.2
+
+    def __init__(self, dk_cli_config):
+        DKCloudAPI.__init__(self, dk_cli_config)
+        self.threads_used = set()
+        self._lock = threading.Lock()
+
+    def recipe_tree(self, kitchen, recipe):
+        with self._lock:
+            self.threads_used.add(threading.current_thread().name)
+        time.sleep(self._delay)
+        rc = DKReturnCode()
+        rc.set(rc.DK_SUCCESS, None, {'%s/%s' % (kitchen, recipe): []})
+        return rc
+
+
+class TestAsyncDKCloudAPI(DKCommonUnitTestSettings):
+
+    def _make_config(self):
+        cfg = DKCloudCommandConfig()
+        cfg.init_from_dict({DKCloudCommandConfig.DK_CLOUD_IP: 'http://localhost',
+                            DKCloudCommandConfig.DK_CLOUD_PORT: '0',
+                            DKCloudCommandConfig.DK_CLOUD_USERNAME: 'a@b.c',
+                            DKCloudCommandConfig.DK_CLOUD_PASSWORD: 'shhh',
+                            DKCloudCommandConfig.DK_CLOUD_MAX_CONNECTIONS: 8})
+        return cfg
+
+    def test_same_method_surface(self):
+        async_api = AsyncDKCloudAPI(self._make_config())
+        for name in ['list_kitchen', 'recipe_tree', 'get_recipe', 'update_file', 'secret_write', 'orderrun_detail']:
+            self.assertTrue(hasattr(async_api, name))
+        async_api.close()
+
+    def test_run_all_is_concurrent_and_ordered(self):
+        api = SlowAPI(self._make_config())
+        async_api = AsyncDKCloudAPI(api)
+        recipes = ['recipe%d' % i for i in range(8)]
+        start = time.time()
+        rcs = async_api.run_all([('recipe_tree', ('kitchen', recipe)) for recipe in recipes])
+        elapsed = time.time() - start
+        async_api.close()
+
+        self.assertEqual(len(rcs), len(recipes))
+        for recipe, rc in zip(recipes, rcs):
+            self.assertTrue(rc.ok())
+            self.assertIn('kitchen/%s' % recipe, rc.get_payload())
+        # 8 calls of 0.2s on 8 workers should take about one call, not eight
+        self.assertLess(elapsed, SlowAPI._delay * 4)
+        self.assertTrue(len(api.threads_used) > 1)
+
+    def test_map_in_pool(self):
+        async_api = AsyncDKCloudAPI(self._make_config(), max_workers=2)
+        rv = async_api.map_in_pool(lambda a, b: a + b, [(1, 2), (3, 4), (5, 6)])
+        async_api.close()
+        self.assertEqual(rv, [3, 7, 11])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKCloudCommandRunner import DKCloudCommandRunner
+from DKKitchenDisk import DKKitchenDisk
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKCloudAPIFakeServer(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer(seed=1)
+        self._server.add_recipe('master', 'simple', {'description.json': '{"a": 1}\n',
+                                                     'resources/cool.sql': 'select 1\n',
+                                                     'node1/data_sources/source.json': '{}\n'})
+        self._server.start()
+        self._api = DKCloudAPI(self._server.make_config())
+        self.assertIsNotNone(self._api.login())
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def test_cache_dir_is_the_servers(self):
+        server = DKCloudAPIFakeServer()
+        server.start()
+        cache_dir = server.make_config().get_cache_dir()
+        self.assertEqual(server.make_config().get_cache_dir(), cache_dir)
+        self.assertFalse(cache_dir.startswith(os.path.expanduser('~')))
+        server.stop()
+        self.assertFalse(os.path.exists(cache_dir))
+
+    def test_kitchens(self):
+        rc = self._api.create_kitchen('master', 'child', 'message')
+        self.assertTrue(rc.ok())
+        names = [kitchen['name'] for kitchen in self._api.list_kitchen().get_payload()]
+        self.assertEqual(sorted(names), ['child', 'master'])
+        self.assertEqual(self._api.list_recipe('child').get_payload(), ['simple'])
+        self.assertTrue(self._api.delete_kitchen('child', 'message').ok())
+        self.assertFalse(self._api.list_recipe('child').ok())
+
+    def test_recipe_round_trip(self):
+        DKKitchenDisk.write_kitchen('master', self._temp_dir)
+        kitchen_dir = os.path.join(self._temp_dir, 'master')
+        rc = DKCloudCommandRunner.get_recipe(self._api, 'master', 'simple', kitchen_dir)
+        self.assertTrue(rc.ok())
+        recipe_dir = os.path.join(kitchen_dir, 'simple')
+        with open(os.path.join(recipe_dir, 'resources', 'cool.sql')) as f:
+            self.assertEqual(f.read(), 'select 1\n')
+
+        # the local shas match what the server computes
+        status = self._api.recipe_status('master', 'simple', recipe_dir).get_payload()
+        self.assertEqual(len(status['different']), 0)
+        self.assertEqual(len(status['only_local']), 0)
+        self.assertEqual(len(status['only_remote']), 0)
+
+        self.assertTrue(self._api.update_file('master', 'simple', 'm', 'resources/cool.sql', 'select 2\n').ok())
+        self.assertTrue(self._api.add_file('master', 'simple', 'm', 'resources/new.sql', 'select 3\n').ok())
+        self.assertTrue(self._api.delete_file('master', 'simple', 'm', 'description.json', 'description.json').ok())
+        files = self._server.get_recipe_files('master', 'simple')
+        self.assertEqual(files['resources/cool.sql'], 'select 2\n')
+        self.assertIn('resources/new.sql', files)
+        self.assertNotIn('description.json', files)
+
+        rc = self._api.get_recipe('master', 'simple', ['resources/*'])
+        self.assertEqual(list(rc.get_payload()['recipes']['simple'].keys()), ['simple/resources'])
+
+    def test_orders_and_secrets(self):
+        order_id = self._api.create_order('master', 'simple', 'variation1').get_payload()
+        self.assertEqual(DKCloudCommandRunner.parse_order_id(order_id)['kitchen'], 'master')
+        servings = self._api.orderrun_detail('master', {}).get_payload()
+        self.assertEqual(servings[0]['serving_chronos_id'], order_id)
+        self.assertEqual(len(self._api.list_order('master').get_payload()['orders']), 1)
+
+        self.assertTrue(self._api.secret_write('vault/a', 'shhh').ok())
+        self.assertTrue(self._api.secret_exists('vault/a').get_payload())
+        self.assertEqual(self._api.secret_list('vault').get_payload(), ['vault/a'])
+        self.assertTrue(self._api.secret_delete('vault/a').ok())
+        self.assertFalse(self._api.secret_exists('vault/a').get_payload())
+
+    def test_injected_errors_are_retried(self):
+        self._server.error_rate = 0.5
+        api = DKCloudAPI(self._server.make_config({DKCloudCommandConfig.DK_CLOUD_RETRIES: 20,
+                                                   DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF: 0.001}))
+        api.login()
+        for i in range(5):
+            self.assertTrue(api.recipe_tree('master', 'simple').ok())
+        self.assertTrue(self._server.get_request_counts()['GET recipe/tree'] > 5)
+
+    def test_generate_kitchen(self):
+        self._server.generate_kitchen('big', recipes=3, files_per_recipe=40, file_size=256)
+        self.assertEqual(len(self._api.list_recipe('big').get_payload()), 4)
+        tree = self._api.recipe_tree('big', 'recipe001').get_payload()
+        self.assertEqual(sum(len(files) for files in tree.values()), 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudCommandConfig import DKCloudCommandConfig
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else dict()
+        self.text = '""'
+
+
+class FakeSession(object):
+    """
+    Plays back a list of responses / exceptions, one per request.
+    """
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = list()
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestDKCloudAPIRetries(DKCommonUnitTestSettings):
+
+    def _make_api(self, outcomes, extra_config=None):
+        cfg = DKCloudCommandConfig()
+        config_dict = {DKCloudCommandConfig.DK_CLOUD_IP: 'http://localhost',
+                       DKCloudCommandConfig.DK_CLOUD_PORT: '0',
+                       DKCloudCommandConfig.DK_CLOUD_USERNAME: 'a@b.c',
+                       DKCloudCommandConfig.DK_CLOUD_PASSWORD: 'shhh',
+                       DKCloudCommandConfig.DK_CLOUD_RETRIES: 2,
+                       DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF: 0.001}
+        if extra_config is not None:
+            config_dict.update(extra_config)
+        cfg.init_from_dict(config_dict)
+        api = DKCloudAPI(cfg)
+        api._session = FakeSession(outcomes)
+        return api
+
+    def test_get_retries_transient_errors(self):
+        api = self._make_api([ReadTimeout(), FakeResponse(503), FakeResponse(200)])
+        response = api._request('GET', 'http://localhost:0/v2/kitchen/list')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(api._session.calls), 3)
+
+    def test_gives_up_after_retries(self):
+        api = self._make_api([FakeResponse(502), FakeResponse(502), FakeResponse(502)])
+        response = api._request('GET', 'http://localhost:0/v2/kitchen/list')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(len(api._session.calls), 3)
+
+    def test_non_idempotent_not_resent(self):
+        api = self._make_api([FakeResponse(503), FakeResponse(200)])
+        response = api._request('PUT', 'http://localhost:0/v2/order/create/k/r/v')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(api._session.calls), 1)
+
+        api = self._make_api([ReadTimeout(), FakeResponse(200)])
+        self.assertRaises(ReadTimeout, api._request, 'PUT', 'http://localhost:0/v2/order/create/k/r/v')
+        self.assertEqual(len(api._session.calls), 1)
+
+        # the request never reached the server, so it is safe to send again
+        api = self._make_api([ConnectTimeout(), FakeResponse(200)])
+        response = api._request('PUT', 'http://localhost:0/v2/order/create/k/r/v')
+        self.assertEqual(response.status_code, 200)
+
+    def test_idempotent_post(self):
+        api = self._make_api([FakeResponse(504), FakeResponse(200)])
+        response = api._request('POST', 'http://localhost:0/v2/recipe/get/k/r', idempotent=True)
+        self.assertEqual(response.status_code, 200)
+
+    def test_endpoint_timeouts(self):
+        api = self._make_api([FakeResponse(200), FakeResponse(200), FakeResponse(200)],
+                             {DKCloudCommandConfig.DK_CLOUD_READ_TIMEOUT: 30,
+                              DKCloudCommandConfig.DK_CLOUD_TIMEOUTS: {'recipe/tree': [5, 300]}})
+        api._request('GET', 'http://localhost:0/v2/kitchen/list')
+        api._request('GET', 'http://localhost:0/v2/recipe/tree/k/r')
+        api._request('POST', 'http://localhost:0/v2/kitchen/merge/a/b')
+        self.assertEqual(api._session.calls[0][2]['timeout'], (10, 30))
+        self.assertEqual(api._session.calls[1][2]['timeout'], (5, 300))
+        self.assertEqual(api._session.calls[2][2]['timeout'], (10, 600))
+
+    def test_backoff_honours_retry_after(self):
+        cfg = DKCloudCommandConfig()
+        cfg.init_from_dict({DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF_MAX: 4})
+        self.assertEqual(DKCloudAPI._get_backoff(cfg, 0, 2.0), 2.0)
+        self.assertEqual(DKCloudAPI._get_backoff(cfg, 0, 60.0), 4)
+        for attempt in range(10):
+            self.assertTrue(0 <= DKCloudAPI._get_backoff(cfg, attempt) <= 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
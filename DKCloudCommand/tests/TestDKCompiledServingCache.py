@@ -0,0 +1,95 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKMemoryCache import DKMemoryCache
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKCompiledServingCache(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._server = DKCloudAPIFakeServer()
+        self._server.add_recipe('master', 'simple', {'description.json': '{"db": "{{db}}"}\n'})
+        self._server.start()
+        self._api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache'),
+             DKCloudCommandConfig.DK_CLOUD_COMPILED_CACHE_MAX_BYTES: 1024 * 1024}))
+        self._api.login()
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _compile_count(self):
+        return self._server.get_request_counts().get('GET servings/compiled', 0)
+
+    def test_compiles_only_what_changed(self):
+        self._api.modify_kitchen_settings('master', add=[('db', 'one')])
+        first = self._api.get_compiled_serving('master', 'simple', 'variation1').get_payload()
+        self.assertEqual(first['description.json'], '{"db": "one"}\n')
+        self.assertEqual(self._api.get_compiled_serving('master', 'simple', 'variation1').get_payload(), first)
+        self.assertEqual(self._compile_count(), 1)
+
+        # another variation is another entry
+        self._api.get_compiled_serving('master', 'simple', 'variation2')
+        self.assertEqual(self._compile_count(), 2)
+
+        # a new override changes the settings hash
+        self._api.modify_kitchen_settings('master', add=[('db', 'two')])
+        second = self._api.get_compiled_serving('master', 'simple', 'variation1').get_payload()
+        self.assertEqual(second['description.json'], '{"db": "two"}\n')
+        self.assertEqual(self._compile_count(), 3)
+
+        # a changed file changes the recipe tree sha
+        self._api.update_file('master', 'simple', 'm', 'description.json', '{"database": "{{db}}"}\n')
+        third = self._api.get_compiled_serving('master', 'simple', 'variation1').get_payload()
+        self.assertEqual(third['description.json'], '{"database": "two"}\n')
+        self.assertEqual(self._compile_count(), 4)
+
+        # --no-cache, without reading what the key is made of
+        self._server.reset_request_counts()
+        self._api.get_compiled_serving('master', 'simple', 'variation1', use_cache=False)
+        self.assertEqual(self._server.get_request_counts(), {'GET servings/compiled': 1})
+
+        # no compiled serving written to disk
+        self.assertFalse(os.path.exists(os.path.join(self._temp_dir, 'cache', 'compiled')))
+        self.assertEqual([key for key in self._api._get_http_cache().keys() if 'servings/compiled' in key], [])
+
+    def test_off_by_default(self):
+        api = DKCloudAPI(self._server.make_config())
+        api.login()
+        self._server.reset_request_counts()
+        for i in range(2):
+            self.assertTrue(api.get_compiled_serving('master', 'simple', 'variation1').ok())
+        self.assertEqual(self._server.get_request_counts(), {'GET servings/compiled': 2})
+
+    def test_memory_cache(self):
+        cache = DKMemoryCache(100)
+        self.assertTrue(cache.put('a', {'x': 'a' * 40}))
+        value = cache.get('a')
+        value['x'] = 'changed'
+        self.assertEqual(cache.get('a'), {'x': 'a' * 40})
+        self.assertTrue(cache.put('b', {'x': 'b' * 40}))
+        cache.get('a')
+        self.assertTrue(cache.put('c', {'x': 'c' * 40}))
+        self.assertEqual(cache.keys(), ['a', 'c'])
+        self.assertFalse(cache.put('d', 'd' * 200))
+
+    def test_recipe_tree_sha(self):
+        tree = {'simple': [{'filename': 'b', 'sha': '2'}, {'filename': 'a', 'sha': '1'}], 'simple/x': []}
+        same = {'simple/x': [], 'simple': [{'filename': 'a', 'sha': '1'}, {'filename': 'b', 'sha': '2'}]}
+        other = {'simple': [{'filename': 'a', 'sha': '1'}, {'filename': 'b', 'sha': '3'}], 'simple/x': []}
+        self.assertEqual(DKCloudAPI.get_recipe_tree_sha(tree), DKCloudAPI.get_recipe_tree_sha(same))
+        self.assertNotEqual(DKCloudAPI.get_recipe_tree_sha(tree), DKCloudAPI.get_recipe_tree_sha(other))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import base64
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKConflictStore import DKConflictStore
+from DKRecipeDisk import DKRecipeDisk
+from DKKitchenDisk import DKKitchenDisk
+from DKCloudCommandRunner import DKCloudCommandRunner
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKConflictStore(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        DKKitchenDisk.write_kitchen('child', self._temp_dir)
+        self._kitchen_dir = os.path.join(self._temp_dir, 'child')
+        self._recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir('simple', self._kitchen_dir)
+        os.makedirs(self._recipe_meta_dir)
+        os.makedirs(os.path.join(self._kitchen_dir, 'simple', 'resources'))
+        with open(os.path.join(self._recipe_meta_dir, 'RECIPE_META'), 'w') as f:
+            f.write('simple')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _conflict(filename, from_kitchen='child', to_kitchen='parent'):
+        return {'filename': filename, 'from_kitchen': from_kitchen, 'to_kitchen': to_kitchen, 'sha': 'none',
+                'conflict_tags': 'PDw8'}
+
+    def test_batched_add_writes_once_in_the_legacy_format(self):
+        store = DKRecipeDisk.get_conflict_store('simple', self._kitchen_dir)
+        for i in range(200):
+            store.add_conflict(self._conflict('file%d.sql' % i), 'simple/resources', 'simple')
+        store.add_conflict(self._conflict('other.sql', 'feature', 'parent'), 'simple', 'simple')
+        self.assertFalse(os.path.exists(store.get_path()))
+        self.assertTrue(store.save())
+        mtime = os.stat(store.get_path()).st_mtime_ns
+        # nothing changed, nothing written
+        self.assertTrue(store.save())
+        self.assertEqual(os.stat(store.get_path()).st_mtime_ns, mtime)
+
+        with open(store.get_path()) as f:
+            on_disk = json.load(f)
+        self.assertEqual(len(on_disk['simple/resources']), 200)
+        info = on_disk['simple/resources']['child|parent|simple|simple/resources|file7.sql']
+        self.assertEqual(info['status'], 'unresolved')
+        self.assertEqual(info['folder_in_recipe'], 'simple/resources')
+
+        unresolved = DKRecipeDisk.get_unresolved_conflicts_meta(self._recipe_meta_dir)
+        self.assertEqual(sum(len(folder) for folder in unresolved.values()), 201)
+        unresolved = DKRecipeDisk.get_unresolved_conflicts_meta(self._recipe_meta_dir, 'feature', 'parent')
+        self.assertEqual(list(unresolved.keys()), ['simple'])
+
+    def test_resolve(self):
+        DKRecipeDisk.add_conflict_to_conflicts_meta(self._conflict('a.sql'), 'simple/resources', 'simple',
+                                                    self._kitchen_dir)
+        DKRecipeDisk.add_conflict_to_conflicts_meta(self._conflict('b.sql'), 'simple/resources', 'simple',
+                                                    self._kitchen_dir)
+
+        store = DKConflictStore(self._recipe_meta_dir)
+        self.assertFalse(store.resolve('resources/missing.sql', 'simple'))
+        self.assertTrue(store.resolve('resources/a.sql', 'simple'))
+        self.assertFalse(store.resolve('resources/a.sql', 'simple'))
+        self.assertTrue(store.save())
+
+        self.assertEqual(DKConflictStore(self._recipe_meta_dir).count(DKConflictStore.UNRESOLVED), 1)
+        resolved = DKRecipeDisk.get_resolved_conflicts_meta(self._recipe_meta_dir, 'child', 'parent')
+        self.assertEqual(list(resolved['simple/resources'].keys()),
+                         ['child|parent|simple|simple/resources|a.sql'])
+
+        # adding the same file again makes it unresolved again, without a duplicate
+        store = DKConflictStore(self._recipe_meta_dir)
+        store.add_conflict(self._conflict('a.sql'), 'simple/resources', 'simple')
+        self.assertEqual(store.count(DKConflictStore.UNRESOLVED), 2)
+        self.assertEqual(store.count(), 2)
+
+    def test_kitchen_index(self):
+        kitchen_meta_dir = DKKitchenDisk.find_kitchen_meta_dir(self._kitchen_dir)
+        for recipe in ['clean%d' % i for i in range(20)]:
+            os.makedirs(DKKitchenDisk.get_recipe_meta_dir(recipe, self._kitchen_dir))
+        self.assertEqual(DKKitchenDisk.get_unresolved_conflicts('child', 'parent', self._kitchen_dir), {})
+
+        store = DKRecipeDisk.get_conflict_store('simple', self._kitchen_dir)
+        store.add_conflict(self._conflict('a.sql'), 'simple/resources', 'simple')
+        store.add_conflict(self._conflict('b.sql'), 'simple/resources', 'simple')
+        store.save()
+        self.assertEqual(DKKitchenDisk.get_conflicts_index(kitchen_meta_dir),
+                         {'simple': {'child|parent': {'unresolved': 2}}})
+
+        unresolved = DKKitchenDisk.get_unresolved_conflicts('child', 'parent', self._kitchen_dir)
+        self.assertEqual(list(unresolved.keys()), ['simple'])
+        self.assertEqual(DKKitchenDisk.get_unresolved_conflicts('other', 'parent', self._kitchen_dir), {})
+
+        DKRecipeDisk.resolve_conflict(self._recipe_meta_dir, os.path.join(self._kitchen_dir, 'simple'),
+                                      os.path.join(self._kitchen_dir, 'simple', 'resources', 'a.sql'))
+        self.assertEqual(DKKitchenDisk.get_conflicts_index(kitchen_meta_dir),
+                         {'simple': {'child|parent': {'unresolved': 1, 'resolved': 1}}})
+        resolved = DKKitchenDisk.get_resolved_conflicts(None, None, self._kitchen_dir)
+        self.assertEqual(len(resolved['simple']['simple/resources']), 1)
+
+        # a kitchen from before the index gets one rebuilt on first use
+        os.remove(os.path.join(kitchen_meta_dir, 'conflicts_index.json'))
+        unresolved = DKKitchenDisk.get_unresolved_conflicts(None, None, self._kitchen_dir)
+        self.assertEqual(len(unresolved['simple']['simple/resources']), 1)
+        self.assertTrue(os.path.isfile(os.path.join(kitchen_meta_dir, 'conflicts_index.json')))
+
+    def test_write_recipe_merge_conflicts(self):
+        contents = dict(('file%d.sql' % i, ('<<<<<<< your file%d\n%s=======\n>>>>>>> their\n' %
+                                            (i, 'select 1;\n' * i)).encode('utf-8')) for i in range(50))
+        conflicts = [{'filename': name, 'from_kitchen': 'child', 'to_kitchen': 'parent', 'sha': 'none',
+                      'conflict_tags': base64.b64encode(data).decode('ascii')} for name, data in contents.items()]
+        merge_info = {'conflicts': {'simple': {'simple/resources': conflicts}}}
+
+        rc = DKCloudCommandRunner.write_recipe_merge_conflicts(merge_info, 'simple', self._kitchen_dir)
+        self.assertTrue(rc.ok())
+        for name, data in contents.items():
+            with open(os.path.join(self._kitchen_dir, 'simple', 'resources', name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+        self.assertEqual(DKConflictStore(self._recipe_meta_dir).count(DKConflictStore.UNRESOLVED), 50)
+
+        del conflicts[3]['conflict_tags']
+        rc = DKCloudCommandRunner.write_recipe_merge_conflicts(merge_info, 'simple', self._kitchen_dir)
+        self.assertFalse(rc.ok())
+        self.assertIn("Can't find conflict tags", rc.get_message())
+
+    def test_write_base64_file_in_chunks(self):
+        data = os.urandom(10000)
+        path = os.path.join(self._temp_dir, 'out.bin')
+        DKRecipeDisk.write_base64_file(path, base64.b64encode(data).decode('ascii'), chunk_size=64)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        # wrapped at 76 characters, like MIME
+        DKRecipeDisk.write_base64_file(path, base64.encodebytes(data), chunk_size=64)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import os
+import stat
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKDaemon import DKDaemon
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKDaemon(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._socket_path = os.path.join(self._temp_dir, 'daemon.sock')
+        self._requests = list()
+        self._daemon = None
+        self._thread = None
+
+    def tearDown(self):
+        if self._daemon is not None:
+            self._daemon.stop()
+            self._thread.join(5)
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _handle(self, request):
+        self._requests.append(request)
+        if request['args'][0] == 'watch':
+            return {'fallback': True}
+        if request['args'][0] == 'slow':
+            time.sleep(2 * DKDaemon.CONNECT_TIMEOUT)
+        if request['args'][0] == 'broken':
+            raise ValueError('broken handler')
+        return {'exit_code': 3, 'out': 'ran %s in %s\n' % (request['args'], request['cwd']), 'err': ''}
+
+    def _start(self):
+        self._daemon = DKDaemon(self._socket_path, self._handle, '/some/config.json')
+        self.assertTrue(self._daemon.bind().ok())
+        self._thread = threading.Thread(target=self._daemon.serve)
+        self._thread.start()
+
+    def test_run_and_status(self):
+        self.assertIsNone(DKDaemon.get_status(self._socket_path))
+        self._start()
+        # only the user running the daemon can connect
+        self.assertEqual(stat.S_IMODE(os.stat(self._socket_path).st_mode) & 0o077, 0)
+
+        response = DKDaemon.send({'op': 'run', 'args': ['kitchen-list'], 'cwd': '/tmp'}, self._socket_path)
+        self.assertEqual(response, {'exit_code': 3, 'out': "ran ['kitchen-list'] in /tmp\n", 'err': ''})
+        self.assertEqual(DKDaemon.send({'op': 'run', 'args': ['watch'], 'cwd': '/'}, self._socket_path),
+                         {'fallback': True})
+        response = DKDaemon.send({'op': 'run', 'args': ['broken'], 'cwd': '/'}, self._socket_path)
+        self.assertEqual(response['exit_code'], 1)
+        self.assertIn('broken handler', response['err'])
+
+        status = DKDaemon.get_status(self._socket_path)
+        self.assertEqual(status['pid'], os.getpid())
+        self.assertEqual(status['config'], '/some/config.json')
+        self.assertEqual(status['served'], 2)
+
+        # a second daemon does not take the socket over
+        rc = DKDaemon(self._socket_path, self._handle).bind()
+        self.assertFalse(rc.ok())
+        self.assertIn('already running', rc.get_message())
+
+        self.assertTrue(DKDaemon.stop_daemon(self._socket_path).ok())
+        self._thread.join(5)
+        self.assertFalse(self._thread.is_alive())
+        self.assertFalse(os.path.exists(self._socket_path))
+        self.assertFalse(DKDaemon.stop_daemon(self._socket_path).ok())
+        self._daemon = None
+
+    def test_busy_daemon_is_not_replaced(self):
+        self._start()
+        slow = threading.Thread(target=DKDaemon.send,
+                                args=({'op': 'run', 'args': ['slow'], 'cwd': '/'}, self._socket_path))
+        slow.start()
+        time.sleep(0.2)
+        self.assertEqual(DKDaemon.get_status(self._socket_path), {'busy': True})
+        self.assertFalse(DKDaemon(self._socket_path, self._handle).bind().ok())
+        slow.join()
+
+    def test_stale_socket(self):
+        # a socket file left by a killed daemon
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self._socket_path)
+        stale.close()
+        self.assertIsNone(DKDaemon.get_status(self._socket_path))
+        self.assertIsNone(DKDaemon.send({'op': 'run', 'args': ['kitchen-list']}, self._socket_path))
+        self._start()
+        self.assertIsNotNone(DKDaemon.get_status(self._socket_path))
+
+    def test_find_command(self):
+        with_value = ['-c', '--config', '--profile-trace']
+        self.assertEqual(DKDaemon.find_command(['-c', 'a.json', '--profile', 'kl', '-k', 'x'], with_value),
+                         ({'-c': 'a.json', '--profile': True}, 'kl'))
+        self.assertEqual(DKDaemon.find_command(['--config=a.json', 'recipe-status'], with_value),
+                         ({'--config': 'a.json'}, 'recipe-status'))
+        self.assertEqual(DKDaemon.find_command(['-ca.json', '--profile-trace', 't.json', 'kitchen-list'],
+                                               with_value),
+                         ({'-c': 'a.json', '--profile-trace': 't.json'}, 'kitchen-list'))
+        self.assertEqual(DKDaemon.find_command(['--version'], with_value), ({'--version': True}, None))
+
+    def test_get_environment(self):
+        environ = {'HOME': '/home/me', 'DKCLI_CONFIG_LOCATION': 'a.json', DKDaemon.SOCKET_ENV: '/s.sock',
+                   DKDaemon.DISABLE_ENV: '1', 'PWD': '/somewhere', 'HTTPS_PROXY': 'http://proxy:3128'}
+        self.assertEqual(DKDaemon.get_environment(environ), {'HOME': '/home/me', 'DKCLI_CONFIG_LOCATION': 'a.json',
+                                                             'HTTPS_PROXY': 'http://proxy:3128'})
+
+
+if __name__ == '__main__':
+    unittest.main()
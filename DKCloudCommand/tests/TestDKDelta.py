@@ -0,0 +1,145 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKDelta import make_delta, apply_delta
+from githash import githash_data
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKDelta(DKCommonUnitTestSettings):
+    _BIG_SQL = ''.join('select %d from some_table where some_column = %d;\n' % (i, i) for i in range(500))
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._server = DKCloudAPIFakeServer()
+        self._server.add_recipe('master', 'simple', {'description.json': '{}\n', 'resources/big.sql': self._BIG_SQL})
+        self._server.start()
+        self._api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache'),
+             DKCloudCommandConfig.DK_CLOUD_DELTA_UPDATES: True}))
+        self._api.login()
+        self._sizes = list()
+        request = self._api._request
+
+        def record_size(method, url, idempotent=None, **kwargs):
+            if kwargs.get('data') is not None:
+                self._sizes.append((url.split('/v2/')[1].split('/')[1], len(kwargs['data'])))
+            return request(method, url, idempotent, **kwargs)
+
+        self._api._request = record_size
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _write(self, name, contents):
+        path = os.path.join(self._temp_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(contents)
+        return path
+
+    def test_make_and_apply(self):
+        base = 'a\nb\nc\nd\n'
+        for contents in ['a\nb\nc\nd\n', 'a\nB\nc\nd\n', 'x\na\nb\nc\nd\ny', '', 'a\nc\n', 'a\r\nb\nc\nd\n']:
+            delta = make_delta(base, contents)
+            self.assertEqual(apply_delta(base, json.loads(json.dumps(delta))), contents)
+        self.assertEqual(make_delta(base, 'a\nB\nc\nd\n'), [['=', 1], ['-', 1], ['+', 'B\n'], ['=', 2]])
+        self.assertEqual(apply_delta('', make_delta('', 'new\n')), 'new\n')
+        with self.assertRaises(ValueError):
+            apply_delta('a\n', [['=', 2]])
+        with self.assertRaises(ValueError):
+            apply_delta('a\nb\n', [['=', 1]])
+        with self.assertRaises(ValueError):
+            apply_delta('a\n', [['?', 1]])
+
+    def test_update_sends_delta(self):
+        # a get does not keep the files, the first update sends the file whole
+        rc = self._api.get_recipe('master', 'simple')
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(self._api._get_blob_cache().keys(), [])
+        base = self._BIG_SQL.replace('select 1 ', 'select 10 ')
+        path = self._write('big.sql', base)
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path,
+                                   base_sha=githash_data(self._BIG_SQL))
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual([route for route, size in self._sizes], ['update'])
+
+        changed = base.replace('select 250 ', 'select 2500 ')
+        path = self._write('big.sql', changed)
+        self._sizes = list()
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path, base_sha=githash_data(base))
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/big.sql'], changed)
+        self.assertEqual([route for route, size in self._sizes], ['update-delta'])
+        self.assertLess(self._sizes[0][1], len(changed) // 20)
+
+        # the new content is now the base of the next delta
+        changed_again = changed + 'select 1;\n'
+        path = self._write('big.sql', changed_again)
+        self._sizes = list()
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path, base_sha=githash_data(changed))
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual([route for route, size in self._sizes], ['update-delta'])
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/big.sql'], changed_again)
+
+    def test_falls_back_to_full_update(self):
+        changed = self._BIG_SQL.replace('select 250 ', 'select 2500 ')
+        path = self._write('big.sql', changed)
+        base_sha = githash_data(self._BIG_SQL)
+
+        # the base is not known
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path, base_sha=base_sha)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual([route for route, size in self._sizes], ['update'])
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/big.sql'], changed)
+
+        # the server has another version than the base
+        self._sizes = list()
+        self._api._remember_blob(self._BIG_SQL)
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path, base_sha=base_sha)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual([route for route, size in self._sizes], ['update-delta', 'update'])
+
+        # a server without deltas
+        self._server.deltas = False
+        self._sizes = list()
+        self._api._remember_blob(changed)
+        changed_again = changed + 'select 1;\n'
+        path = self._write('big.sql', changed_again)
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path, base_sha=githash_data(changed))
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual([route for route, size in self._sizes], ['update-delta', 'update'])
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/big.sql'], changed_again)
+
+    def test_held_blobs_are_written_at_once(self):
+        self._api.hold_blobs()
+        self._api._remember_blob(self._BIG_SQL)
+        self._api._remember_blob(self._BIG_SQL + 'select 1;\n')
+        self.assertEqual(self._api._get_blob_cache().keys(), [])
+        self._api.flush_blobs()
+        self.assertEqual(len(self._api._get_blob_cache().keys()), 2)
+
+    def test_disabled(self):
+        # off by default
+        self.assertFalse(self._server.make_config().get_delta_updates())
+        api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache'),
+             DKCloudCommandConfig.DK_CLOUD_DELTA_UPDATES: False}))
+        api.login()
+        self.assertTrue(api.get_recipe('master', 'simple').ok())
+        self.assertIsNone(api._get_blob_cache())
+        path = self._write('big.sql', self._BIG_SQL + 'select 1;\n')
+        self.assertIsNone(api.update_file_delta('master', 'simple', 'm', 'resources/big.sql', path,
+                                                githash_data(self._BIG_SQL)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKDiskCache import DKDiskCache
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class CountingDiskCache(DKDiskCache):
+    scans = 0
+
+    def _scan(self):
+        self.scans += 1
+        return DKDiskCache._scan(self)
+
+
+class TestDKDiskCache(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._cache_dir = os.path.join(self._temp_dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def test_put_get_delete(self):
+        cache = DKDiskCache(self._cache_dir)
+        self.assertIsNone(cache.get('a'))
+        self.assertTrue(cache.put('a', {'x': [1, 2]}, meta={'etag': 'e1'}))
+        self.assertEqual(cache.get('a'), {'x': [1, 2]})
+        self.assertEqual(cache.get_entry('a')['meta'], {'etag': 'e1'})
+        # another process sees the same entry
+        self.assertEqual(DKDiskCache(self._cache_dir).get('a'), {'x': [1, 2]})
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_ttl(self):
+        cache = DKDiskCache(self._cache_dir, default_ttl=0.05)
+        cache.put('short', 1)
+        cache.put('long', 2, ttl=60)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('short'))
+        self.assertEqual(cache.get('long'), 2)
+
+    def test_lru_eviction(self):
+        cache = DKDiskCache(self._cache_dir, max_entries=3)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, key)
+            time.sleep(0.01)
+        cache.get('a')  # a is now the most recently used
+        time.sleep(0.01)
+        cache.put('d', 'd')
+        self.assertEqual(sorted(cache.keys()), ['a', 'c', 'd'])
+
+    def test_size_eviction(self):
+        cache = DKDiskCache(self._cache_dir, max_entries=None, max_bytes=3000)
+        for i in range(5):
+            cache.put('key%d' % i, 'x' * 1000)
+            time.sleep(0.01)
+        self.assertEqual(sorted(cache.keys()), ['key3', 'key4'])
+
+    def test_writes_do_not_list_the_cache(self):
+        cache = CountingDiskCache(self._cache_dir, max_entries=100)
+        for i in range(300):
+            cache.put('key%d' % i, i)
+        # evicted to 90 entries each time it went over 100
+        self.assertEqual(len(cache.keys()), 91)
+        # one scan to start with, then one per 10 writes over the bound, never one per write
+        self.assertLessEqual(cache.scans, 1 + 200 // 10 + 1)
+
+        cache.scans = 0
+        cache.delete('key299')
+        self.assertEqual(cache.put_many({'many%d' % i: i for i in range(20)}), 20)
+        self.assertEqual(cache.scans, 1)
+        self.assertEqual(len(cache.keys()), 90)
+
+        # another process starts from what is on disk
+        other = CountingDiskCache(self._cache_dir, max_entries=100)
+        other.put('other', 1)
+        self.assertEqual(other.scans, 1)
+        self.assertEqual(len(cache.keys()), 91)
+
+    def test_entries_are_private(self):
+        cache = DKDiskCache(self._cache_dir)
+        cache.put('a', 'secret')
+        self.assertEqual(os.stat(self._cache_dir).st_mode & 0o777, 0o700)
+        for name in os.listdir(self._cache_dir):
+            self.assertEqual(os.stat(os.path.join(self._cache_dir, name)).st_mode & 0o777, 0o600)
+
+    def test_unwritable_cache_is_silent(self):
+        open(self._cache_dir, 'w').close()
+        self.assertFalse(DKDiskCache(self._cache_dir).put('a', 1))
+
+    def test_delete_matching(self):
+        cache = DKDiskCache(self._cache_dir)
+        for key in ['k|1', 'k|2', 'other']:
+            cache.put(key, key)
+        cache.delete_matching(lambda key: key.startswith('k|'))
+        self.assertEqual(cache.keys(), ['other'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import os
+import random
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudCommandRunner import DKCloudCommandRunner
+
+__author__ = 'DataKitchen, Inc.'
+
+
+def _legacy_find_minimal_paths_to_get(paths_to_check):
+    # the nested loops find_minimal_paths_to_get used before, as the reference and the benchmark baseline
+    minimum_paths = {}
+    skip_paths = {}
+    paths_to_check = sorted(paths_to_check)
+    for outer in range(0, len(paths_to_check)):
+        this_path = paths_to_check[outer]
+        if this_path not in skip_paths:
+            if outer == len(paths_to_check) - 1 and this_path not in skip_paths and this_path not in minimum_paths:
+                minimum_paths[this_path] = False
+                continue
+            for inner in range(outer + 1, len(paths_to_check)):
+                next_path = paths_to_check[inner]
+                if next_path not in skip_paths:
+                    if DKCloudCommandRunner.is_subdirectory(next_path, this_path):
+                        minimum_paths[this_path] = True
+                        skip_paths[next_path] = True
+        if this_path not in skip_paths and this_path not in minimum_paths:
+            minimum_paths[this_path] = False
+    return minimum_paths
+
+
+class TestDKFindMinimalPaths(DKCommonUnitTestSettings):
+
+    @staticmethod
+    def _make_folders(count, seed):
+        generator = random.Random(seed)
+        names = ['node1', 'node2', 'node1-old', 'data_sinks', 'data_sources', 'resources', 'sub', 'sub.d']
+        folders = list()
+        for i in range(count):
+            depth = generator.randint(1, 4)
+            folders.append(os.sep.join(generator.choice(names) for j in range(depth)))
+        return folders
+
+    def test_collapses_nested_folders(self):
+        paths = ['node2/data_sinks', 'node1/data_sinks', 'node2', 'node1-old/data_sinks', 'node1',
+                 'node1/data_sources', 'resources', 'node2/data_sources/deeper', 'node1-old']
+        self.assertEqual(DKCloudCommandRunner.find_minimal_paths_to_get(paths),
+                         {'node1': True, 'node1-old': True, 'node2': True, 'resources': False})
+        self.assertEqual(DKCloudCommandRunner.find_minimal_paths_to_get(['a/', 'a/b', 'ab']),
+                         {'a/': True, 'ab': False})
+        self.assertEqual(DKCloudCommandRunner.find_minimal_paths_to_get([]), {})
+
+    def test_same_as_legacy(self):
+        for seed in range(5):
+            folders = self._make_folders(150, seed)
+            self.assertEqual(DKCloudCommandRunner.find_minimal_paths_to_get(folders),
+                             _legacy_find_minimal_paths_to_get(folders))
+
+    def test_same_as_legacy_for_many_folders(self):
+        folders = self._make_folders(300, 42)
+        self.assertEqual(DKCloudCommandRunner.find_minimal_paths_to_get(folders),
+                         _legacy_find_minimal_paths_to_get(folders))
+
+    @unittest.skipUnless(os.environ.get('DK_BENCHMARKS'), 'set DK_BENCHMARKS to run the benchmarks')
+    def test_benchmark(self):
+        folders = self._make_folders(300, 42)
+        start = time.time()
+        _legacy_find_minimal_paths_to_get(folders)
+        legacy_seconds = time.time() - start
+        start = time.time()
+        DKCloudCommandRunner.find_minimal_paths_to_get(folders)
+        sweep_seconds = time.time() - start
+
+        many_folders = ['%s/f%d' % (folder, i) for i, folder in enumerate(self._make_folders(50000, 7))]
+        start = time.time()
+        DKCloudCommandRunner.find_minimal_paths_to_get(many_folders)
+        many_seconds = time.time() - start
+        print('\nfind_minimal_paths_to_get, %d folders: %.4fs, nested loops %.4fs; %d folders: %.4fs' %
+              (len(folders), sweep_seconds, legacy_seconds, len(many_folders), many_seconds))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKGitIndex import DKGitIndex
+from DKRecipeDisk import get_directory_sha
+from githash import githash_data
+
+__author__ = 'DataKitchen, Inc.'
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class TestDKGitIndex(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._recipe_dir = os.path.join(self._temp_dir, 'kitchen', 'simple')
+        self._files = {'description.json': '{}\n', 'resources/a.sql': 'select 1;\n',
+                       'resources/more/b.sql': 'select 2;\n'}
+        for path, contents in self._files.items():
+            self._write(path, contents)
+        self._git('init', '-q')
+        # the files must be older than the index, or git and DKGitIndex take them as racily clean
+        time.sleep(0.05)
+        self._git('add', '.')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _git(self, *args):
+        subprocess.check_call(['git', '-c', 'core.autocrlf=false'] + list(args), cwd=self._temp_dir,
+                              env=dict(os.environ, HOME=self._temp_dir, XDG_CONFIG_HOME=self._temp_dir))
+
+    def _write(self, path, contents):
+        full_path = os.path.join(self._recipe_dir, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'w') as f:
+            f.write(contents)
+
+    def _find(self):
+        # no user level git config of whoever runs the tests
+        os.environ['HOME'], home = self._temp_dir, os.environ.get('HOME')
+        try:
+            return DKGitIndex.find(self._recipe_dir)
+        finally:
+            if home is not None:
+                os.environ['HOME'] = home
+
+    def test_shas_from_index(self):
+        index = self._find()
+        self.assertIsNotNone(index)
+        for path, contents in self._files.items():
+            full_path = os.path.join(self._recipe_dir, path)
+            self.assertEqual(index.get_sha(full_path, os.stat(full_path)), githash_data(contents))
+
+        # a changed file is hashed again
+        time.sleep(0.05)
+        self._write('resources/a.sql', 'select 10;\n')
+        full_path = os.path.join(self._recipe_dir, 'resources/a.sql')
+        self.assertIsNone(index.get_sha(full_path, os.stat(full_path)))
+        self._write('untracked.sql', 'select 3;\n')
+        full_path = os.path.join(self._recipe_dir, 'untracked.sql')
+        self.assertIsNone(index.get_sha(full_path, os.stat(full_path)))
+
+        self.assertEqual(get_directory_sha(self._recipe_dir, use_git_index=True), get_directory_sha(self._recipe_dir))
+
+    def test_index_versions(self):
+        with open(os.path.join(self._temp_dir, '.git', 'index'), 'rb') as f:
+            entries = DKGitIndex.parse(f.read())
+        self.assertEqual(sorted(entries), ['kitchen/simple/description.json', 'kitchen/simple/resources/a.sql',
+                                           'kitchen/simple/resources/more/b.sql'])
+        for version in ['3', '4']:
+            self._git('update-index', '--index-version', version)
+            with open(os.path.join(self._temp_dir, '.git', 'index'), 'rb') as f:
+                self.assertEqual(DKGitIndex.parse(f.read()), entries)
+        self.assertIsNone(DKGitIndex.parse(b'not an index'))
+
+    def test_not_used_with_filters(self):
+        self._git('config', 'core.autocrlf', 'true')
+        self.assertIsNone(self._find())
+        self._git('config', 'core.autocrlf', 'false')
+        self.assertIsNotNone(self._find())
+        with open(os.path.join(self._temp_dir, '.gitattributes'), 'w') as f:
+            f.write('*.sql filter=lfs\n')
+        self._git('add', '.gitattributes')
+        self.assertIsNone(self._find())
+        self.assertIsNone(DKGitIndex.find(tempfile.gettempdir()))
+
+    def test_not_used_with_untracked_attributes(self):
+        # git add applies a .gitattributes on disk whether it is tracked or not
+        attributes = os.path.join(self._temp_dir, 'kitchen', '.gitattributes')
+        with open(attributes, 'w') as f:
+            f.write('*.sql filter=lfs\n')
+        self.assertIsNone(self._find())
+        os.remove(attributes)
+
+        index = self._find()
+        self.assertIsNotNone(index)
+        self._write('resources/more/.gitattributes', '*.sql text eol=crlf\n')
+        for path, under_attributes in [('description.json', False), ('resources/a.sql', False),
+                                       ('resources/more/b.sql', True)]:
+            full_path = os.path.join(self._recipe_dir, path)
+            sha = index.get_sha(full_path, os.stat(full_path))
+            self.assertEqual(sha, None if under_attributes else githash_data(self._files[path]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKHttpCache(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._cache_dir = os.path.join(self._temp_dir, 'cache')
+        self._server = DKCloudAPIFakeServer()
+        self._server.add_recipe('master', 'simple', {'description.json': '{}\n', 'resources/a.sql': 'select 1;\n'})
+        self._server.start()
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _make_api(self, extra=None):
+        config = {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: self._cache_dir}
+        config.update(extra or {})
+        api = DKCloudAPI(self._server.make_config(config))
+        api.login()
+        return api
+
+    def test_revalidated_with_etags(self):
+        tree = self._make_api().recipe_tree('master', 'simple').get_payload()
+        self._server.reset_request_counts()
+
+        # the next dk command: a 304, same payload
+        api = self._make_api()
+        self.assertEqual(api.recipe_tree('master', 'simple').get_payload(), tree)
+        self.assertEqual(api.list_recipe('master').get_payload(), ['simple'])
+        self.assertEqual(api.list_recipe('master').get_payload(), ['simple'])
+        self.assertEqual(self._server.get_not_modified_counts(), {'GET recipe/tree': 1,
+                                                                  'GET kitchen/recipenames': 1})
+
+        # a change on the server is seen at once
+        api.update_file('master', 'simple', 'm', 'resources/a.sql', 'select 2;\n')
+        changed = api.recipe_tree('master', 'simple').get_payload()
+        self.assertNotEqual(changed, tree)
+        self.assertEqual(self._server.get_not_modified_counts()['GET recipe/tree'], 1)
+        self.assertEqual(api.recipe_tree('master', 'simple').get_payload(), changed)
+        self.assertEqual(self._server.get_not_modified_counts()['GET recipe/tree'], 2)
+
+        # settings keep their ETag for the If-Match of modify_kitchen_settings
+        self.assertTrue(api.modify_kitchen_settings('master', add=[('db', 'one')]).ok())
+        self.assertTrue(api.modify_kitchen_settings('master', add=[('db', 'two')]).ok())
+        overrides = api.get_kitchen_settings('master').get_payload()['recipeoverrides']
+        self.assertEqual([(o['variable'], o['value']) for o in overrides], [('db', 'two')])
+        # settings are never written to disk
+        self.assertEqual([key for key in api._get_http_cache().keys() if 'kitchen/settings' in key], [])
+
+    def test_ttl_without_validators(self):
+        self._server.etags = False
+        api = self._make_api({DKCloudCommandConfig.DK_CLOUD_HTTP_CACHE_TTLS: {'kitchen/list': 60}})
+        self._server.reset_request_counts()
+        for i in range(3):
+            self.assertTrue(api.list_kitchen().ok())
+            self.assertTrue(api.list_recipe('master').ok())
+        self.assertEqual(self._server.get_request_counts(), {'GET kitchen/list': 1, 'GET kitchen/recipenames': 3})
+
+    def test_size_bound(self):
+        api = self._make_api({DKCloudCommandConfig.DK_CLOUD_HTTP_CACHE_MAX_BYTES: 1500})
+        for i in range(10):
+            self._server.add_recipe('master', 'recipe%d' % i, {'description.json': '{}\n'})
+            self.assertTrue(api.recipe_tree('master', 'recipe%d' % i).ok())
+        total = sum(os.path.getsize(os.path.join(self._cache_dir, 'http', name))
+                    for name in os.listdir(os.path.join(self._cache_dir, 'http')))
+        self.assertLessEqual(total, 1500)
+
+    def test_config(self):
+        config = self._server.make_config({DKCloudCommandConfig.DK_CLOUD_HTTP_CACHE_TTLS: {'kitchen': 5,
+                                                                                            'kitchen/list': 10}})
+        self.assertEqual(config.get_http_cache_ttl('kitchen/list'), 10)
+        self.assertEqual(config.get_http_cache_ttl('kitchen/recipenames/master'), 5)
+        self.assertEqual(config.get_http_cache_ttl('recipe/tree/master/simple'), 0)
+        self.assertEqual(config.get_http_cache_max_bytes(), DKCloudCommandConfig.DEFAULT_HTTP_CACHE_MAX_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
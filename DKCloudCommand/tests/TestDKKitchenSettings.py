@@ -0,0 +1,120 @@
+import unittest
+import io
+import threading
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKCloudCommandRunner import DKCloudCommandRunner
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class InterferingAPI(DKCloudAPI):
+    """
+    Another writer adds an override right after our first read of the settings.
+    """
+    def __init__(self, dk_cli_config, other_api):
+        DKCloudAPI.__init__(self, dk_cli_config)
+        self._other_api = other_api
+        self.reads = 0
+
+    def _get_kitchen_settings_and_version(self, kitchen_name):
+        self.reads += 1
+        rv = DKCloudAPI._get_kitchen_settings_and_version(self, kitchen_name)
+        if self.reads == 1:
+            self._other_api.modify_kitchen_settings(kitchen_name, add=[('theirs', '1')])
+        return rv
+
+
+class TestDKKitchenSettings(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        self._server.start()
+
+    def tearDown(self):
+        self._server.stop()
+
+    def _make_config(self):
+        return self._server.make_config({DKCloudCommandConfig.DK_CLOUD_RETRY_BACKOFF: 0.01})
+
+    def _make_api(self):
+        api = DKCloudAPI(self._make_config())
+        api.login()
+        return api
+
+    def _get_overrides(self, api):
+        overrides = api.get_kitchen_settings('master').get_payload()['recipeoverrides']
+        return dict((override['variable'], override['value']) for override in overrides)
+
+    def test_batched_edit_is_one_read_and_one_write(self):
+        api = self._make_api()
+        api.modify_kitchen_settings('master', add=[('a', '1'), ('b', '2'), ('c', '3')])
+        self._server.reset_request_counts()
+
+        rc = DKCloudCommandRunner.config_kitchen(api, 'master', add=[('a', '10'), ('d', '4')], unset=['b', 'zzz'])
+        self.assertTrue(rc.ok())
+        self.assertEqual(self._server.get_request_counts(),
+                         {'GET kitchen/settings': 1, 'PUT kitchen/settings': 1})
+        self.assertEqual(self._get_overrides(api), {'a': '10', 'c': '3', 'd': '4'})
+
+        # nothing changes, nothing is written
+        self._server.reset_request_counts()
+        self.assertTrue(api.modify_kitchen_settings('master', add=[('a', '10')], unset='zzz').ok())
+        self.assertEqual(self._server.get_request_counts(), {'GET kitchen/settings': 1})
+
+        rc = DKCloudCommandRunner.config_kitchen(api, 'master', get=('a', 'b', 'c'))
+        self.assertEqual(rc.get_message(), '10\nnone\n3\n')
+
+    def test_concurrent_edits_are_not_lost(self):
+        apis = [self._make_api() for i in range(8)]
+
+        def modify(i):
+            apis[i].modify_kitchen_settings('master', add=[('var%d' % i, str(i))])
+
+        threads = [threading.Thread(target=modify, args=(i,)) for i in range(len(apis))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        overrides = self._get_overrides(apis[0])
+        self.assertEqual(overrides, dict(('var%d' % i, str(i)) for i in range(len(apis))))
+
+    def test_conflict_without_etags(self):
+        self._server.etags = False
+        other_api = self._make_api()
+        api = InterferingAPI(self._make_config(), other_api)
+        api.login()
+
+        rc = api.modify_kitchen_settings('master', add=[('mine', '2')])
+        self.assertTrue(rc.ok())
+        # read, check (changed), read again, check, write
+        self.assertEqual(api.reads, 4)
+        self.assertEqual(self._get_overrides(api), {'theirs': '1', 'mine': '2'})
+
+    def test_duplicate_variables_use_the_first_override(self):
+        overrides = [{'variable': 'a', 'value': '1'}, {'variable': 'b', 'value': '2'},
+                     {'variable': 'a', 'value': '3'}]
+        self.assertIs(DKCloudAPI.get_overrides_by_variable(overrides)['a'], overrides[0])
+        new_overrides, msg, commit_message = DKCloudAPI._apply_override_changes([dict(o) for o in overrides],
+                                                                                add=[('a', '10')])
+        self.assertEqual([o['value'] for o in new_overrides], ['10', '2', '3'])
+        new_overrides, msg, commit_message = DKCloudAPI._apply_override_changes([dict(o) for o in overrides],
+                                                                                unset=['a'])
+        self.assertEqual([o['value'] for o in new_overrides], ['2', '3'])
+
+    def test_parse_override_entries(self):
+        add, unset = DKCloudCommandRunner.parse_override_entries(io.StringIO('# c\n\na=1\nb=x=y\nc=\n'))
+        self.assertEqual(add, [('a', '1'), ('b', 'x=y')])
+        self.assertEqual(unset, ['c'])
+
+        add, unset = DKCloudCommandRunner.parse_override_entries(io.StringIO('{"a": "1", "c": null}'))
+        self.assertEqual(add, [('a', '1')])
+        self.assertEqual(unset, ['c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
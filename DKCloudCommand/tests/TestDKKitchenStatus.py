@@ -0,0 +1,100 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKCloudCommandRunner import DKCloudCommandRunner
+from DKKitchenDisk import DKKitchenDisk
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKKitchenStatus(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        for recipe in ['recipe1', 'recipe2', 'recipe3']:
+            self._server.add_recipe('master', recipe, {'description.json': '{}\n',
+                                                       'resources/a.sql': 'select 1;\n',
+                                                       'resources/b.sql': 'select 2;\n'})
+        self._server.start()
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache')}))
+        self._api.login()
+        self._kitchen_dir = os.path.join(self._temp_dir, 'master')
+        rc = DKCloudCommandRunner.get_kitchen(self._api, 'master', self._temp_dir, ['recipe1', 'recipe2', 'recipe3'])
+        self.assertTrue(rc.ok(), rc.get_message())
+        self._server.reset_request_counts()
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _change_files(self):
+        with open(os.path.join(self._kitchen_dir, 'recipe1', 'resources', 'a.sql'), 'w') as f:
+            f.write('select 10;\n')
+        with open(os.path.join(self._kitchen_dir, 'recipe3', 'resources', 'c.sql'), 'w') as f:
+            f.write('select 3;\n')
+        os.remove(os.path.join(self._kitchen_dir, 'recipe3', 'resources', 'b.sql'))
+
+    def test_kitchen_status(self):
+        self._change_files()
+        rc = DKCloudCommandRunner.kitchen_status(self._api, 'master', self._kitchen_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        statuses = rc.get_payload()
+        self.assertEqual(sorted(statuses), ['recipe1', 'recipe2', 'recipe3'])
+        self.assertEqual(list(statuses['recipe1']['different']), ['recipe1/resources'])
+        self.assertEqual(statuses['recipe2']['different'], {})
+        self.assertEqual(list(statuses['recipe3']['only_local']), ['recipe3/resources'])
+        self.assertEqual(list(statuses['recipe3']['only_remote']), ['recipe3/resources'])
+        self.assertIn("Recipe 'recipe1':\n1 files are modified:\n\tresources/a.sql", rc.get_message())
+        self.assertIn('2 of 3 recipes have changes', rc.get_message())
+        self.assertEqual(self._server.get_request_counts(), {'GET recipe/tree': 3})
+
+        # from the trees kept by the status, without the server
+        self._server.reset_request_counts()
+        rc = DKCloudCommandRunner.kitchen_status(DKCloudAPI(self._server.make_config()), 'master', self._kitchen_dir,
+                                                 cached=True)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('2 of 3 recipes have changes', rc.get_message())
+        self.assertEqual(self._server.get_request_counts(), {})
+
+    def test_kitchen_status_fails_for_a_local_only_recipe(self):
+        os.makedirs(os.path.join(self._kitchen_dir, 'recipe4'))
+        os.makedirs(DKKitchenDisk.get_recipe_meta_dir('recipe4', self._kitchen_dir))
+        rc = DKCloudCommandRunner.kitchen_status(self._api, 'master', self._kitchen_dir)
+        self.assertFalse(rc.ok())
+        self.assertIn('0 of 4 recipes have changes', rc.get_message())
+        self.assertIn('1 recipes failed:\n\trecipe4', rc.get_message())
+
+    def test_kitchen_update(self):
+        self._change_files()
+        os.chdir(os.path.join(self._kitchen_dir, 'recipe2'))
+        rc = DKCloudCommandRunner.kitchen_update(self._api, 'master', 'm', self._kitchen_dir, dryrun=True)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('2 of 3 recipes would be updated', rc.get_message())
+        self.assertEqual(self._server.get_recipe_files('master', 'recipe1')['resources/a.sql'], 'select 1;\n')
+
+        rc = DKCloudCommandRunner.kitchen_update(self._api, 'master', 'm', self._kitchen_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('2 of 3 recipes updated', rc.get_message())
+        self.assertEqual(os.getcwd(), os.path.join(self._kitchen_dir, 'recipe2'))
+        self.assertEqual(self._server.get_recipe_files('master', 'recipe1')['resources/a.sql'], 'select 10;\n')
+        recipe3_files = self._server.get_recipe_files('master', 'recipe3')
+        self.assertEqual(recipe3_files['resources/c.sql'], 'select 3;\n')
+        self.assertNotIn('resources/b.sql', recipe3_files)
+
+        rc = DKCloudCommandRunner.kitchen_status(self._api, 'master', self._kitchen_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('0 of 3 recipes have changes', rc.get_message())
+
+
+if __name__ == '__main__':
+    unittest.main()
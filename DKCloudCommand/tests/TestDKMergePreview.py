@@ -0,0 +1,50 @@
+import unittest
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandRunner import DKCloudCommandRunner
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKMergePreview(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        self._server.start()
+        self._server.add_recipe('master', 'simple', {'description.json': '{}', 'resources/a.sql': 'select 1;',
+                                                     'resources/b.sql': 'select 2;'})
+        self._server.add_recipe('master', 'other', {'description.json': '{}'})
+        self._server.add_kitchen('feature', 'master')
+        self._server.add_recipe('feature', 'simple', {'description.json': '{}', 'resources/a.sql': 'select 10;',
+                                                      'resources/new/c.sql': 'select 3;'})
+        self._server.add_recipe('feature', 'brand-new', {'description.json': '{}'})
+        self._api = DKCloudAPI(self._server.make_config())
+        self._api.login()
+
+    def tearDown(self):
+        self._server.stop()
+
+    def test_preview(self):
+        self._server.reset_request_counts()
+        rc = DKCloudCommandRunner.preview_merge_kitchens(self._api, 'feature', 'master')
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(rc.get_payload(), {'simple': {'different': ['resources/a.sql'],
+                                                       'only_source': ['resources/new/c.sql'],
+                                                       'only_target': ['resources/b.sql']}})
+        msg = rc.get_message()
+        self.assertIn("Recipes only in 'feature', merged as new: brand-new", msg)
+        self.assertIn('1 files differ in 1 of 2 common recipes', msg)
+        # no merge was run
+        counts = self._server.get_request_counts()
+        self.assertNotIn('POST kitchen/merge', counts)
+        self.assertEqual(counts['GET recipe/tree'], 4)
+
+    def test_preview_missing_kitchen(self):
+        rc = DKCloudCommandRunner.preview_merge_kitchens(self._api, 'nope', 'master')
+        self.assertFalse(rc.ok())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import json
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+from .TestDKCloudAPIRetries import FakeResponse, FakeSession
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKProfiler import DKProfiler, profiled
+
+__author__ = 'DataKitchen, Inc.'
+
+
+@profiled('test')
+def slow_function():
+    time.sleep(0.01)
+    return 'done'
+
+
+class TestDKProfiler(DKCommonUnitTestSettings):
+
+    def tearDown(self):
+        DKProfiler().disable()
+
+    def test_disabled_records_nothing(self):
+        DKProfiler().enable()
+        DKProfiler().disable()
+        self.assertEqual(slow_function(), 'done')
+        self.assertEqual(len(DKProfiler().get_spans()), 0)
+
+    def test_profiled_function_and_api_requests(self):
+        DKProfiler().enable()
+        self.assertEqual(slow_function(), 'done')
+
+        response = FakeResponse(200)
+        response.content = b'0123456789'
+        api = DKCloudAPI(DKCloudCommandConfig())
+        login_response = FakeResponse(200)
+        login_response.content = b''
+        api._session = FakeSession([response, login_response])
+        api._request('POST', 'http://localhost:0/v2/recipe/get/kitchen/recipe', data='abc')
+        api._request('POST', 'http://localhost:0/v2/login', data={'username': 'u', 'password': 'p'})
+
+        spans = DKProfiler().get_spans()
+        self.assertEqual([span['name'] for span in spans], ['slow_function', 'POST recipe/get', 'POST login'])
+        self.assertTrue(spans[0]['duration'] >= 0.01)
+        self.assertEqual(spans[1]['bytes_sent'], 3)
+        self.assertEqual(spans[1]['bytes_received'], 10)
+        # a form is not a size
+        self.assertEqual(spans[2]['bytes_sent'], 0)
+        self.assertIn('POST recipe/get', DKProfiler().summary())
+
+    def test_write_trace(self):
+        DKProfiler().enable()
+        slow_function()
+        slow_function()
+        trace_path = os.path.join(self._TEMPFILE_LOCATION, 'dk_profile_trace.json')
+        DKProfiler().write_trace(trace_path)
+        with open(trace_path) as trace_file:
+            trace = json.load(trace_file)
+        os.remove(trace_path)
+        self.assertEqual(len(trace['traceEvents']), 2)
+        for event in trace['traceEvents']:
+            self.assertEqual(event['ph'], 'X')
+            self.assertEqual(event['name'], 'slow_function')
+            self.assertTrue(event['dur'] >= 10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
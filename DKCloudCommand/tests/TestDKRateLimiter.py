@@ -0,0 +1,91 @@
+import unittest
+import threading
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+from .TestDKCloudAPIRetries import FakeResponse, FakeSession
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKRateLimiter import DKRateLimiter, get_rate_limiter, reset_rate_limiters
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKRateLimiter(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        reset_rate_limiters()
+
+    def tearDown(self):
+        reset_rate_limiters()
+
+    def test_token_bucket(self):
+        limiter = DKRateLimiter(rate=50, burst=5)
+        start = time.time()
+        for i in range(15):
+            limiter.acquire()
+            limiter.release()
+        elapsed = time.time() - start
+        # 5 from the burst, then 10 at 50/s
+        self.assertTrue(0.15 < elapsed < 1.0, elapsed)
+
+    def test_max_in_flight(self):
+        limiter = DKRateLimiter(max_in_flight=2)
+        state = {'now': 0, 'max': 0}
+        lock = threading.Lock()
+
+        def call():
+            limiter.acquire()
+            with lock:
+                state['now'] += 1
+                state['max'] = max(state['max'], state['now'])
+            time.sleep(0.05)
+            with lock:
+                state['now'] -= 1
+            limiter.release()
+
+        threads = [threading.Thread(target=call) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(state['max'], 2)
+
+    def test_throttle_and_recover(self):
+        limiter = DKRateLimiter(rate=10)
+        limiter.on_throttled()
+        self.assertEqual(limiter.get_rate(), 5)
+        for i in range(20):
+            limiter.on_success()
+        self.assertEqual(limiter.get_rate(), 10)
+
+    def test_one_limiter_per_host(self):
+        a = get_rate_limiter('host:1', {'rate': 3})
+        self.assertIs(a, get_rate_limiter('host:1'))
+        self.assertIsNot(a, get_rate_limiter('host:2'))
+
+    def test_config_rate_limits(self):
+        cfg = DKCloudCommandConfig()
+        cfg.init_from_dict({DKCloudCommandConfig.DK_CLOUD_MAX_CONNECTIONS: 6,
+                            DKCloudCommandConfig.DK_CLOUD_RATE_LIMITS: {'dkapp': {'rate': 20},
+                                                                        '*': {'rate': 1}}})
+        self.assertEqual(cfg.get_rate_limits('dkapp:443'), {'rate': 20})
+        self.assertEqual(cfg.get_rate_limits('other'), {'rate': 1})
+        cfg.init_from_dict({DKCloudCommandConfig.DK_CLOUD_MAX_CONNECTIONS: 6})
+        self.assertEqual(cfg.get_rate_limits('other'), {'max-in-flight': 6})
+
+    def test_request_retries_429(self):
+        cfg = DKCloudCommandConfig()
+        cfg.init_from_dict({DKCloudCommandConfig.DK_CLOUD_RETRIES: 2,
+                            DKCloudCommandConfig.DK_CLOUD_RATE_LIMITS: {'localhost': {'rate': 8}}})
+        api = DKCloudAPI(cfg)
+        api._session = FakeSession([FakeResponse(429, {'Retry-After': '0.1'}), FakeResponse(200)])
+        # a 429 is retried even for a write, the server did not act on it
+        response = api._request('PUT', 'http://localhost:0/v2/order/create/k/r/v')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(api._session.calls), 2)
+        self.assertEqual(get_rate_limiter('localhost:0').get_rate(), 4.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
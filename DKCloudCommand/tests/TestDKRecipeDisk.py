@@ -144,7 +144,13 @@ class TestDKRecipeDisk(DKCommonUnitTestSettings):
         shutil.rmtree(temp_dir)
 
     def test_flatten_tree(self):
-        print('hello')
+        r = get_directory_sha(os.path.join(os.getcwd(), 'files', 'recipe01'))
+        flat = flatten_tree(r)
+        self.assertEqual(len(flat), 5)
+        self.assertEqual(flat['file_01_01.txt'], 'c9536cbfeddf3b47bce62052c516550d742e6840')
+        self.assertEqual(flat['sub01/file_01_01_01.txt'], '3da4c3e0af822e6e38dcf9ac3772c10a283a388d')
+        self.assertEqual(flat['sub01/sub02/file_01_01_02_02.txt'], '615487a0933769879c9114e38c45c6a55ed84f1d')
+        self.assertEqual(flatten_tree({}), {})
 
     def test_build_sha1_directory(self):
         fp = os.path.join(os.getcwd(), 'files', 'recipe01')
@@ -165,6 +171,29 @@ class TestDKRecipeDisk(DKCommonUnitTestSettings):
         self.assertEqual(root[0]['filename'], 'file_01_01.txt')
         self.assertEqual(root[0]['sha'], 'c9536cbfeddf3b47bce62052c516550d742e6840')
 
+    def test_walk_recipe(self):
+        temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=TestDKRecipeDisk._TEMPFILE_LOCATION)
+        recipe_dir = os.path.join(temp_dir, 'recipe01')
+        shutil.copytree(os.path.join(os.getcwd(), 'files', 'recipe01'), recipe_dir)
+        os.makedirs(os.path.join(recipe_dir, 'sub01', '.dk', 'deep'))
+        with open(os.path.join(recipe_dir, 'sub01', '.dk', 'deep', 'meta.json'), 'w') as f:
+            f.write('{}')
+        os.mkdir(os.path.join(recipe_dir, 'empty'))
+
+        walked = [(path, entry.is_dir()) for path, entry in walk_recipe(recipe_dir, DKIgnore())]
+        self.assertEqual(walked, [('empty', True), ('file_01_01.txt', False), ('file_01_02.txt', False),
+                                  ('sub01', True), ('sub01/file_01_01_01.txt', False), ('sub01/sub02', True),
+                                  ('sub01/sub02/file_01_01_02_01.txt', False),
+                                  ('sub01/sub02/file_01_01_02_02.txt', False)])
+        self.assertIn('sub01/.dk/deep/meta.json', [path for path, entry in walk_recipe(recipe_dir)])
+
+        # the ignored folder is not even listed, the rest is what it was
+        r = get_directory_sha(recipe_dir)
+        self.assertEqual(sorted(r), ['recipe01', 'recipe01/empty', 'recipe01/sub01', 'recipe01/sub01/sub02'])
+        self.assertEqual(r, dict(get_directory_sha(os.path.join(os.getcwd(), 'files', 'recipe01')),
+                                 **{'recipe01/empty': []}))
+        shutil.rmtree(temp_dir)
+
     # <kitchen_name>
     #   .dk
     #       KITCHEN_META
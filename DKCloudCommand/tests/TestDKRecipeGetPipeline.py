@@ -0,0 +1,175 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKCloudCommandRunner import DKCloudCommandRunner
+from DKRecipeGetPipeline import DKRecipeGetPipeline
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class SlowDiskPipeline(DKRecipeGetPipeline):
+    """
+    Writes a batch in write_seconds, and counts the batches downloaded and not yet written.
+    """
+    write_seconds = 0
+
+    def __init__(self, dk_api, *args, **kwargs):
+        DKRecipeGetPipeline.__init__(self, _ApiWrapper(dk_api, self._counted_get_recipe), *args, **kwargs)
+        self._get_recipe = dk_api.get_recipe
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.write_count = 0
+        self._counts_lock = threading.Lock()
+
+    def _counted_get_recipe(self, *args):
+        rc = self._get_recipe(*args)
+        with self._counts_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return rc
+
+    def _write_batch(self, folders):
+        time.sleep(self.write_seconds)
+        DKRecipeGetPipeline._write_batch(self, folders)
+        with self._counts_lock:
+            self.in_flight -= 1
+            self.write_count += 1
+
+
+class _ApiWrapper(object):
+    def __init__(self, api, get_recipe):
+        self._api = api
+        self.get_recipe = get_recipe
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+
+class TestDKRecipeGetPipeline(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        files = {'description.json': '{}\n', 'resources/a.sql': 'select 1;\n'}
+        for i in range(60):
+            files['node%d/data_sources/source%d.json' % (i % 6, i)] = '{"source": %d}\n' % i
+        self._server.add_recipe('master', 'simple', files)
+        self._server.start()
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache')}))
+        self._api.login()
+        rc = DKCloudCommandRunner.get_kitchen(self._api, 'master', self._temp_dir, ['simple'])
+        self.assertTrue(rc.ok(), rc.get_message())
+        self._kitchen_dir = os.path.join(self._temp_dir, 'master')
+        self._recipe_dir = os.path.join(self._kitchen_dir, 'simple')
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _remove_local(self):
+        for i in range(6):
+            shutil.rmtree(os.path.join(self._recipe_dir, 'node%d' % i))
+
+    def test_get_recipe_into_existing_folder(self):
+        os.remove(os.path.join(self._recipe_dir, 'node1', 'data_sources', 'source1.json'))
+        shutil.rmtree(os.path.join(self._recipe_dir, 'node2'))
+        with open(os.path.join(self._recipe_dir, 'local.sql'), 'w') as f:
+            f.write('select 0;\n')
+        self._server.add_recipe('master', 'simple', dict(self._server.get_recipe_files('master', 'simple'),
+                                                         **{'resources/b.sql': 'select 2;\n',
+                                                            'resources/data.bin': bytes(range(256))}))
+
+        rc = DKCloudCommandRunner.get_recipe(self._api, 'master', 'simple', self._kitchen_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('13 new or missing files from remote:\n\tnode1/data_sources/source1.json\n'
+                      '\tnode2/data_sources/source14.json', rc.get_message())
+        self.assertIn('\tresources/data.bin', rc.get_message())
+        with open(os.path.join(self._recipe_dir, 'resources', 'data.bin'), 'rb') as f:
+            self.assertEqual(f.read(), bytes(range(256)))
+
+        status = self._api.recipe_status('master', 'simple', self._recipe_dir).get_payload()
+        self.assertEqual(status['different'], {})
+        self.assertEqual(status['only_remote'], {})
+        self.assertEqual(list(status['only_local']), ['simple'])
+
+        rc = DKCloudCommandRunner.get_recipe(self._api, 'master', 'simple', self._kitchen_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(rc.get_message(), 'Nothing to do')
+
+    def test_reports_different_files(self):
+        with open(os.path.join(self._recipe_dir, 'resources', 'a.sql'), 'w') as f:
+            f.write('select 10;\n')
+        os.remove(os.path.join(self._recipe_dir, 'description.json'))
+        rc = DKRecipeGetPipeline(self._api, 'master', 'simple', self._kitchen_dir).run()
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(rc.get_payload()['different'],
+                         {'simple/resources': [{'filename': 'a.sql', 'sha': self._api.recipe_tree(
+                             'master', 'simple').get_payload()['simple/resources'][0]['sha']}]})
+        self.assertEqual(rc.get_payload()['only_remote'], ['description.json'])
+        with open(os.path.join(self._recipe_dir, 'resources', 'a.sql')) as f:
+            self.assertEqual(f.read(), 'select 10;\n')
+
+    def test_queues_are_bounded(self):
+        self._remove_local()
+        pipeline = SlowDiskPipeline(self._api, 'master', 'simple', self._kitchen_dir, batch_size=2, queue_size=2,
+                                    download_workers=2, write_workers=1)
+        pipeline.write_seconds = 0.01
+        rc = pipeline.run()
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(len(rc.get_payload()['only_remote']), 60)
+        self.assertEqual(rc.get_payload()['only_remote_folders'][:2], ['node0', 'node0/data_sources'])
+        self.assertEqual(pipeline.write_count, 30)
+        # the write queue, plus a batch in each downloader and in the writer
+        self.assertLessEqual(pipeline.max_in_flight, 2 + 2 + 1)
+
+    def test_downloads_overlap_writes(self):
+        self._remove_local()
+        self._server.latency = 0.03
+        pipeline = SlowDiskPipeline(self._api, 'master', 'simple', self._kitchen_dir, batch_size=5,
+                                    download_workers=1, write_workers=1)
+        pipeline.write_seconds = 0.03
+        start = time.time()
+        rc = pipeline.run()
+        elapsed = time.time() - start
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(pipeline.write_count, 12)
+        # one after the other: 12 downloads and 12 writes of 0.03 seconds, plus the tree
+        self.assertLess(elapsed, 0.03 * 25 * 0.8)
+
+    def test_unexpected_payload_fails_instead_of_hanging(self):
+        self._remove_local()
+
+        def bad_get_recipe(*args):
+            rc = self._api.get_recipe(*args)
+            rc.set(rc.DK_SUCCESS, None, {'recipes': {}})
+            return rc
+
+        pipeline = DKRecipeGetPipeline(_ApiWrapper(self._api, bad_get_recipe), 'master', 'simple',
+                                       self._kitchen_dir, batch_size=2, queue_size=1, download_workers=1)
+        result = list()
+        thread = threading.Thread(target=lambda: result.append(pipeline.run()))
+        thread.daemon = True
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(result[0].ok())
+        self.assertIn('Unable to get 2 files', result[0].get_message())
+
+    def test_failed_tree(self):
+        rc = DKRecipeGetPipeline(self._api, 'master', 'missing', self._kitchen_dir).run()
+        self.assertFalse(rc.ok())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import os
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKRecipeTree import RecipeTree
+from DKRecipeDisk import get_directory_sha, compare_sha
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKRecipeTree(DKCommonUnitTestSettings):
+
+    _TREE = {'simple': [{'filename': 'description.json', 'sha': 'd1'}],
+             'simple/resources': [{'filename': 'b.sql', 'sha': 'b1'}, {'filename': 'a.sql', 'sha': 'a1'}],
+             'simple/resources/more': [{'filename': 'c.sql', 'sha': 'c1'}],
+             'simple/resources-old': [{'filename': 'x.sql', 'sha': 'x1'}],
+             'simple/empty': []}
+
+    def test_from_tree(self):
+        tree = RecipeTree.from_tree(self._TREE)
+        self.assertEqual(tree.get_recipe_name(), 'simple')
+        self.assertEqual(len(tree), 5)
+        self.assertEqual(tree.get_paths(), ['description.json', 'resources-old/x.sql', 'resources/a.sql',
+                                            'resources/b.sql', 'resources/more/c.sql'])
+        self.assertEqual(tree.get_folders(), ['', 'empty', 'resources', 'resources-old', 'resources/more'])
+        self.assertEqual(tree.get_sha('resources/b.sql'), 'b1')
+        self.assertIsNone(tree.get_sha('resources/z.sql'))
+        self.assertIn('resources/more/c.sql', tree)
+        self.assertNotIn('resources', tree)
+        self.assertTrue(tree.has_folder('empty'))
+
+        round_trip = tree.to_tree()
+        self.assertEqual(sorted(round_trip), sorted(self._TREE))
+        self.assertEqual(sorted(f['filename'] for f in round_trip['simple/resources']), ['a.sql', 'b.sql'])
+        self.assertEqual(round_trip['simple/empty'], [])
+
+    def test_folders(self):
+        tree = RecipeTree.from_tree(self._TREE)
+        self.assertEqual(tree.get_files_in_folder('resources'), ['resources/a.sql', 'resources/b.sql'])
+        self.assertEqual(tree.get_files_in_folder('resources', recursive=True),
+                         ['resources/a.sql', 'resources/b.sql', 'resources/more/c.sql'])
+        self.assertEqual(tree.get_files_in_folder(''), ['description.json'])
+        self.assertEqual(tree.get_files_in_folder('empty'), [])
+        self.assertEqual(tree.get_files_in_folder('missing'), [])
+
+        subtree = tree.subtree('resources')
+        self.assertEqual(subtree.to_dict(), {'resources/a.sql': 'a1', 'resources/b.sql': 'b1',
+                                             'resources/more/c.sql': 'c1'})
+        self.assertEqual(subtree.get_folders(), ['resources', 'resources/more'])
+
+    def test_compare(self):
+        remote = RecipeTree.from_tree(self._TREE)
+        local_tree = dict(self._TREE)
+        local_tree['simple/resources'] = [{'filename': 'a.sql', 'sha': 'a2'}, {'filename': 'new.sql', 'sha': 'n1'}]
+        local_tree['simple/local'] = []
+        del local_tree['simple/resources/more']
+        compared = remote.compare(RecipeTree.from_tree(local_tree))
+        self.assertEqual(compared['same'], ['description.json', 'resources-old/x.sql'])
+        self.assertEqual(compared['different'], ['resources/a.sql'])
+        self.assertEqual(compared['only_local'], ['resources/new.sql'])
+        self.assertEqual(compared['only_remote'], ['resources/b.sql', 'resources/more/c.sql'])
+        self.assertEqual(compared['only_local_folders'], ['local'])
+        self.assertEqual(compared['only_remote_folders'], ['resources/more'])
+
+    def test_same_as_compare_sha(self):
+        local_sha = get_directory_sha(os.path.join(os.getcwd(), 'files', 'recipe01'))
+        remote_sha = dict((folder, [dict(f) for f in files]) for folder, files in local_sha.items())
+        remote_sha['recipe01/sub01'][0]['sha'] = 'changed'
+        remote_sha['recipe01'].pop()
+        compared = RecipeTree.from_tree(remote_sha).compare(RecipeTree.from_tree(local_sha))
+        legacy = compare_sha(remote_sha, local_sha)
+        for key in ['same', 'different', 'only_local', 'only_remote']:
+            self.assertEqual(compared[key], sorted(RecipeTree.get_path_in_recipe(folder, f['filename'])
+                                                   for folder, files in legacy[key].items() for f in files))
+        self.assertEqual(compared['different'], ['sub01/file_01_01_01.txt'])
+        self.assertEqual(compared['only_local'], ['file_01_02.txt'])
+
+    def test_get_path_in_recipe(self):
+        self.assertEqual(RecipeTree.get_path_in_recipe('simple/resources/more', 'c.sql'), 'resources/more/c.sql')
+        self.assertEqual(RecipeTree.get_path_in_recipe('simple', 'description.json'), 'description.json')
+        self.assertEqual(RecipeTree.get_path_in_recipe('simple/resources'), 'resources')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandRunner import DKCloudCommandRunner
+from DKKitchenDisk import DKKitchenDisk
+from DKIgnore import DKIgnore
+from DKRecipeWatcher import DKRecipeWatcher, _InotifySource
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKRecipeWatcher(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        self._server.add_recipe('master', 'simple', {'description.json': '{}\n', 'resources/a.sql': 'select 1;\n',
+                                                     'resources/b.sql': 'select 2;\n'})
+        self._server.start()
+        self._api = DKCloudAPI(self._server.make_config())
+        self._api.login()
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        DKKitchenDisk.write_kitchen('master', self._temp_dir)
+        kitchen_dir = os.path.join(self._temp_dir, 'master')
+        self.assertTrue(DKCloudCommandRunner.get_recipe(self._api, 'master', 'simple', kitchen_dir).ok())
+        self._recipe_dir = os.path.join(kitchen_dir, 'simple')
+        self._watcher = None
+
+    def tearDown(self):
+        if self._watcher is not None:
+            self._watcher.close()
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _write(self, path, contents):
+        full_path = os.path.join(self._recipe_dir, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'w') as f:
+            f.write(contents)
+
+    def _start(self, use_inotify):
+        self._watcher = DKRecipeWatcher(self._api, 'master', 'simple', self._recipe_dir, 'watch', debounce=0.2,
+                                        use_inotify=use_inotify)
+        rc = self._watcher.start()
+        self.assertTrue(rc.ok(), rc.get_message())
+        self._server.reset_request_counts()
+        return rc
+
+    def test_sync_sends_only_what_changed(self):
+        self._write('resources/b.sql', 'select 20;\n')
+        rc = self._start(False)
+        self.assertIn('1 files differ from the server', rc.get_message())
+        self.assertIn('resources/b.sql', rc.get_message())
+
+        self._write('resources/a.sql', 'select 10;\n')
+        self._write('resources/new.sql', 'select 3;\n')
+        rc = self._watcher.sync(['resources/a.sql', 'resources/new.sql', 'description.json'])
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(rc.get_payload(), [('update', 'resources/a.sql'), ('add', 'resources/new.sql')])
+        self.assertEqual(self._server.get_request_counts(), {'POST recipe/update': 1, 'PUT recipe/create': 1})
+
+        # saved again without a change: nothing is sent
+        self._write('resources/a.sql', 'select 10;\n')
+        rc = self._watcher.sync(['resources/a.sql'])
+        self.assertEqual(rc.get_payload(), [])
+
+        os.remove(os.path.join(self._recipe_dir, 'resources', 'new.sql'))
+        rc = self._watcher.sync(['resources/new.sql'])
+        self.assertEqual(rc.get_payload(), [('delete', 'resources/new.sql')])
+
+        files = self._server.get_recipe_files('master', 'simple')
+        self.assertEqual(files['resources/a.sql'], 'select 10;\n')
+        self.assertNotIn('resources/new.sql', files)
+        # the untouched difference is left alone
+        self.assertEqual(files['resources/b.sql'], 'select 2;\n')
+
+    def test_removed_folder(self):
+        self._write('resources/more/c.sql', 'select 3;\n')
+        self._start(False)
+        self.assertTrue(self._watcher.sync(['resources/more/c.sql']).ok())
+        shutil.rmtree(os.path.join(self._recipe_dir, 'resources', 'more'))
+        rc = self._watcher.sync(['resources/more'])
+        self.assertEqual(rc.get_payload(), [('delete', 'resources/more/c.sql')])
+
+    def _check_run_once(self, use_inotify):
+        self._start(use_inotify)
+        self.assertIsNone(self._watcher.run_once(0.1))
+
+        def edit():
+            self._write('resources/a.sql', 'select 100;\n')
+            self._write('resources/other/d.sql', 'select 4;\n')
+
+        timer = threading.Timer(0.2, edit)
+        timer.start()
+        rc = self._watcher.run_once(5)
+        timer.join()
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(sorted(rc.get_payload()), [('add', 'resources/other/d.sql'), ('update', 'resources/a.sql')])
+        files = self._server.get_recipe_files('master', 'simple')
+        self.assertEqual(files['resources/a.sql'], 'select 100;\n')
+        self.assertEqual(files['resources/other/d.sql'], 'select 4;\n')
+
+    def test_run_once_polling(self):
+        self._check_run_once(False)
+
+    @unittest.skipUnless(_InotifySource.is_available(), 'inotify is only on Linux')
+    def test_run_once_inotify(self):
+        self._check_run_once(True)
+
+    @unittest.skipUnless(_InotifySource.is_available(), 'inotify is only on Linux')
+    def test_inotify_drops_the_watches_of_removed_folders(self):
+        source = _InotifySource(self._recipe_dir, DKIgnore())
+        try:
+            watches = len(source._watches)
+            self._write('resources/more/deeper/c.sql', 'select 3;\n')
+            source.wait(1)
+            self.assertEqual(len(source._watches), watches + 2)
+            shutil.rmtree(os.path.join(self._recipe_dir, 'resources', 'more'))
+            source.wait(1)
+            self.assertEqual(len(source._watches), watches)
+        finally:
+            source.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKCloudCommandRunner import DKCloudCommandRunner
+from DKKitchenDisk import DKKitchenDisk
+from DKRecipeDisk import DKRecipeDisk
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKRemoteTree(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        self._server.add_recipe('master', 'simple', {'description.json': '{}\n', 'resources/a.sql': 'select 1;\n'})
+        self._server.start()
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache')}))
+        self._api.login()
+        DKKitchenDisk.write_kitchen('master', self._temp_dir)
+        self._kitchen_dir = os.path.join(self._temp_dir, 'master')
+        self.assertTrue(DKCloudCommandRunner.get_recipe(self._api, 'master', 'simple', self._kitchen_dir).ok())
+        self._recipe_dir = os.path.join(self._kitchen_dir, 'simple')
+        self._recipe_meta_dir = DKKitchenDisk.get_recipe_meta_dir('simple', self._recipe_dir)
+        self._server.reset_request_counts()
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def test_cached_needs_a_snapshot(self):
+        api = DKCloudAPI(self._server.make_config())
+        rc = DKCloudCommandRunner.recipe_status(api, 'master', 'simple', self._recipe_dir, cached=True)
+        self.assertFalse(rc.ok())
+        self.assertIn('without --cached first', rc.get_message())
+        self.assertEqual(self._server.get_request_counts(), {})
+
+    def test_status_keeps_and_revalidates_the_tree(self):
+        rc = DKCloudCommandRunner.recipe_status(self._api, 'master', 'simple', self._recipe_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('2 files are unchanged', rc.get_message())
+        snapshot = DKRecipeDisk.read_remote_tree(self._recipe_meta_dir, 'master', 'simple')
+        self.assertIsNotNone(snapshot['etag'])
+        self.assertIsNotNone(snapshot['head'])
+        self.assertIn('simple/resources', snapshot['tree'])
+        self.assertIsNone(DKRecipeDisk.read_remote_tree(self._recipe_meta_dir, 'dev', 'simple'))
+
+        # nothing changed on the server: a 304
+        rc = DKCloudCommandRunner.recipe_status(self._api, 'master', 'simple', self._recipe_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(self._server.get_not_modified_counts(), {'GET recipe/tree': 1})
+
+        # the server moved on: the tree is fetched and kept again
+        self._server.add_recipe('master', 'simple', {'description.json': '{}\n', 'resources/a.sql': 'select 2;\n'})
+        rc = DKCloudCommandRunner.recipe_status(self._api, 'master', 'simple', self._recipe_dir)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('1 files are modified', rc.get_message())
+        self.assertEqual(self._server.get_not_modified_counts(), {'GET recipe/tree': 1})
+        self.assertNotEqual(DKRecipeDisk.read_remote_tree(self._recipe_meta_dir, 'master', 'simple')['etag'],
+                            snapshot['etag'])
+
+    def test_cached_status_without_the_server(self):
+        self.assertTrue(DKCloudCommandRunner.recipe_status(self._api, 'master', 'simple', self._recipe_dir).ok())
+        with open(os.path.join(self._recipe_dir, 'resources', 'a.sql'), 'w') as f:
+            f.write('select 3;\n')
+        # never logged in, and no server to ask
+        api = DKCloudAPI(self._server.make_config())
+        self._server.stop()
+        rc = DKCloudCommandRunner.recipe_status(api, 'master', 'simple', self._recipe_dir, cached=True)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('the server was not asked', rc.get_message())
+        self.assertIn('1 files are modified:\n\tresources/a.sql', rc.get_message())
+
+
+if __name__ == '__main__':
+    unittest.main()
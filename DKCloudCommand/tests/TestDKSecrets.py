@@ -0,0 +1,94 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from DKCloudCommandRunner import DKCloudCommandRunner
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKSecrets(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._server = DKCloudAPIFakeServer()
+        self._server.start()
+        self._api = DKCloudAPI(self._server.make_config(
+            {DKCloudCommandConfig.DK_CLOUD_CACHE_DIR: os.path.join(self._temp_dir, 'cache')}))
+        self._api.login()
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def test_bulk_write_and_delete(self):
+        values_file = os.path.join(self._temp_dir, 'value.txt')
+        with open(values_file, 'w') as f:
+            f.write('from a file')
+        lines = ['# comment', '', 'env/a=1', 'env/b=x=y'] + ['env/many/%d=%d' % (i, i) for i in range(20)] + \
+                ['env/c=@%s' % values_file]
+        entries = DKCloudCommandRunner.parse_secret_entries(lines)
+        self.assertEqual(entries[1], ('env/b', 'x=y'))
+        self.assertEqual(entries[-1], ('env/c', 'from a file'))
+
+        rc = DKCloudCommandRunner.secret_write_many(self._api, entries)
+        self.assertTrue(rc.ok())
+        self.assertEqual(rc.get_message(), '23 secrets written.')
+        self.assertEqual(len(self._api.secret_list('env').get_payload()), 23)
+
+        rc = DKCloudCommandRunner.secret_delete_many(self._api, ['env/a', 'env/missing'])
+        self.assertFalse(rc.ok())
+        self.assertIn('1 secrets deleted.', rc.get_message())
+        self.assertIn('env/missing', rc.get_message())
+
+    def test_list_cache(self):
+        self._api.secret_write('env/a', '1')
+        self._api.secret_write('env/b', '2')
+        self._server.reset_request_counts()
+
+        self.assertEqual(self._api.secret_list('env').get_payload(), ['env/a', 'env/b'])
+        for i in range(5):
+            self.assertEqual(self._api.secret_list('env').get_payload(), ['env/a', 'env/b'])
+            self.assertTrue(self._api.secret_exists('env/a').get_payload())
+            self.assertFalse(self._api.secret_exists('env/zzz').get_payload())
+        self.assertEqual(self._server.get_request_counts(), {'GET secret/env': 1})
+
+        # writes invalidate the cached listings of every parent
+        self._api.secret_write('env/c', '3')
+        self.assertTrue(self._api.secret_exists('env/c').get_payload())
+        self.assertEqual(self._api.secret_list('env').get_payload(), ['env/a', 'env/b', 'env/c'])
+        self._api.secret_delete('env/a')
+        self.assertEqual(self._api.secret_list('env').get_payload(), ['env/b', 'env/c'])
+
+        # values are never cached
+        for key in self._api._get_secret_cache().keys():
+            self.assertNotIn('secret_write', key)
+        self._api.secret_list('env', use_cache=False)
+        self.assertEqual(self._server.get_request_counts()['GET secret/env'], 4)
+
+    def test_no_cache_by_default(self):
+        config = DKCloudCommandConfig()
+        config.init_from_dict({DKCloudCommandConfig.DK_CLOUD_IP: 'http://127.0.0.1',
+                               DKCloudCommandConfig.DK_CLOUD_PORT: str(self._server.get_port()),
+                               DKCloudCommandConfig.DK_CLOUD_USERNAME: 'u', DKCloudCommandConfig.DK_CLOUD_PASSWORD: 'p'})
+        self.assertIsNone(config.get_cache_dir())
+        self.assertIsNone(DKCloudAPI(config)._get_secret_cache())
+
+    def test_exists_trusts_only_the_folder_listing(self):
+        self._api.secret_write('env/a', '1')
+        self._api.secret_write('env/deep/d', '2')
+        self._server.reset_request_counts()
+        self.assertEqual(self._api.secret_list('env').get_payload(), ['env/a', 'env/deep/d'])
+        self.assertTrue(self._api.secret_exists('env/a').get_payload())
+        # a vault listing is one level deep, the listing of env does not answer for env/deep/d
+        self.assertTrue(self._api.secret_exists('env/deep/d').get_payload())
+        self.assertEqual(self._server.get_request_counts(), {'GET secret/env': 1, 'GET secret/check': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import os
+import shutil
+import tempfile
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandRunner import DKCloudCommandRunner
+from DKKitchenDisk import DKKitchenDisk
+from DKReturnCode import DKReturnCode
+from DKUpdateJournal import DKUpdateJournal
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class FlakyAPI(DKCloudAPI):
+    """
+    Fails the update of one file, like a network blip in the middle of a recipe-update.
+    """
+    fail_on = None
+
+    def update_file(self, kitchen, recipe, message, api_file_key, file_contents):
+        if api_file_key == self.fail_on:
+            rc = DKReturnCode()
+            rc.set(rc.DK_FAIL, 'connection reset')
+            return rc
+        return DKCloudAPI.update_file(self, kitchen, recipe, message, api_file_key, file_contents)
+
+
+class TestDKUpdateJournal(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._server = DKCloudAPIFakeServer()
+        files = {'description.json': '{}\n'}
+        for i in range(10):
+            files['resources/file%d.sql' % i] = 'select %d;\n' % i
+        self._server.add_recipe('master', 'simple', files)
+        self._server.start()
+        self._api = FlakyAPI(self._server.make_config())
+        self._api.login()
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        DKKitchenDisk.write_kitchen('master', self._temp_dir)
+        self._kitchen_dir = os.path.join(self._temp_dir, 'master')
+        self.assertTrue(DKCloudCommandRunner.get_recipe(self._api, 'master', 'simple', self._kitchen_dir).ok())
+        self._recipe_dir = os.path.join(self._kitchen_dir, 'simple')
+        os.chdir(self._recipe_dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _journal_path(self):
+        return os.path.join(DKKitchenDisk.get_recipe_meta_dir('simple', self._recipe_dir), 'UPDATE_JOURNAL')
+
+    def test_resume_after_failure(self):
+        for i in range(10):
+            with open(os.path.join('resources', 'file%d.sql' % i), 'w') as f:
+                f.write('select %d0;\n' % i)
+        with open(os.path.join('resources', 'new.sql'), 'w') as f:
+            f.write('select 11;\n')
+
+        self._api.fail_on = 'resources/file6.sql'
+        rc = DKCloudCommandRunner.update_all_files(self._api, 'master', 'simple', self._recipe_dir, 'm')
+        self.assertFalse(rc.ok())
+        self.assertTrue(os.path.isfile(self._journal_path()))
+
+        self._api.fail_on = None
+        self._server.reset_request_counts()
+        rc = DKCloudCommandRunner.update_all_files(self._api, 'master', 'simple', self._recipe_dir, 'm')
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertIn('Resuming an interrupted update, 6 of 11 changes were already sent.', rc.get_message())
+        # no remote tree, only the 4 updates and the 1 add that were left
+        self.assertEqual(self._server.get_request_counts(), {'POST recipe/update': 4, 'PUT recipe/create': 1})
+        self.assertFalse(os.path.isfile(self._journal_path()))
+
+        files = self._server.get_recipe_files('master', 'simple')
+        for i in range(10):
+            self.assertEqual(files['resources/file%d.sql' % i], 'select %d0;\n' % i)
+        self.assertEqual(files['resources/new.sql'], 'select 11;\n')
+
+    def test_changes_outside_the_plan_start_over(self):
+        with open(os.path.join('resources', 'file1.sql'), 'w') as f:
+            f.write('select 10;\n')
+        with open(os.path.join('resources', 'file2.sql'), 'w') as f:
+            f.write('select 20;\n')
+        self._api.fail_on = 'resources/file2.sql'
+        self.assertFalse(DKCloudCommandRunner.update_all_files(self._api, 'master', 'simple', self._recipe_dir,
+                                                               'm').ok())
+
+        # a planned file edited again is sent again
+        journal = DKUpdateJournal(os.path.dirname(self._journal_path()))
+        with open(os.path.join('resources', 'file1.sql'), 'w') as f:
+            f.write('select 100;\n')
+        plan, done = journal.resume('master', 'simple', DKUpdateJournal.take_snapshot(self._recipe_dir))
+        self.assertEqual(sorted(plan['update']), ['resources/file1.sql', 'resources/file2.sql'])
+        self.assertEqual(done, set())
+
+        # a file outside of the plan changed: the journal is not trusted
+        with open(os.path.join('resources', 'file3.sql'), 'w') as f:
+            f.write('select 300;\n')
+        self.assertEqual(journal.resume('master', 'simple', DKUpdateJournal.take_snapshot(self._recipe_dir)),
+                         (None, None))
+        self.assertEqual(journal.resume('other', 'simple', DKUpdateJournal.take_snapshot(self._recipe_dir)),
+                         (None, None))
+
+        self._api.fail_on = None
+        rc = DKCloudCommandRunner.update_all_files(self._api, 'master', 'simple', self._recipe_dir, 'm')
+        self.assertTrue(rc.ok())
+        self.assertNotIn('Resuming', rc.get_message())
+        self.assertIn('3 files updated', rc.get_message())
+
+
+if __name__ == '__main__':
+    unittest.main()
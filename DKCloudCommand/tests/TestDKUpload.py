@@ -0,0 +1,102 @@
+import unittest
+import os
+import shutil
+import tempfile
+from requests.exceptions import ConnectionError
+from .DKCommonUnitTestSettings import DKCommonUnitTestSettings
+
+from DKCloudAPI import DKCloudAPI
+from DKCloudAPIFakeServer import DKCloudAPIFakeServer
+from DKCloudCommandConfig import DKCloudCommandConfig
+from githash import githash_path
+
+__author__ = 'DataKitchen, Inc.'
+
+
+class TestDKUpload(DKCommonUnitTestSettings):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='unit-tests', dir=self._TEMPFILE_LOCATION)
+        self._server = DKCloudAPIFakeServer()
+        self._server.add_recipe('master', 'simple', {'description.json': '{}\n', 'resources/a.sql': 'select 1;\n'})
+        self._server.start()
+        self._api = DKCloudAPI(self._server.make_config({DKCloudCommandConfig.DK_CLOUD_UPLOAD_THRESHOLD: 1000,
+                                                         DKCloudCommandConfig.DK_CLOUD_UPLOAD_PART_SIZE: 256}))
+        self._api.login()
+        self._server.reset_request_counts()
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _write(self, name, contents):
+        path = os.path.join(self._temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    def test_small_text_file(self):
+        path = self._write('a.sql', b'select 2;\n')
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/a.sql', path)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(self._server.get_request_counts(), {'POST recipe/update': 1})
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/a.sql'], 'select 2;\n')
+
+    def test_large_and_binary_files_in_parts(self):
+        contents = ''.join('select %d;\n' % i for i in range(200)).encode('utf-8')
+        path = self._write('big.sql', contents)
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/big.sql', path, add=True)
+        self.assertTrue(rc.ok(), rc.get_message())
+        parts = (len(contents) + 255) // 256
+        self.assertEqual(self._server.get_request_counts(), {'POST recipe/upload': 2, 'PUT recipe/upload': parts})
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/big.sql'],
+                         contents.decode('utf-8'))
+
+        binary = bytes(range(256)) * 2
+        path = self._write('data.bin', binary)
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/data.bin', path, add=True)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/data.bin'], binary)
+        tree = self._api.recipe_tree('master', 'simple').get_payload()
+        self.assertIn({'filename': 'data.bin', 'sha': githash_path(path)}, tree['simple/resources'])
+
+    def test_resume(self):
+        contents = os.urandom(1000)
+        path = self._write('data.bin', contents)
+        request = self._api._request
+
+        def network_down_at_part_2(method, url, idempotent=None, **kwargs):
+            if '/upload/part/' in url and url.endswith('/2'):
+                raise ConnectionError('network down')
+            return request(method, url, idempotent, **kwargs)
+
+        self._api._request = network_down_at_part_2
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/data.bin', path, add=True)
+        self.assertFalse(rc.ok())
+        self.assertIn('running the command again sends the missing parts', rc.get_message())
+        self.assertNotIn('resources/data.bin', self._server.get_recipe_files('master', 'simple'))
+
+        self._api._request = request
+        self._server.reset_request_counts()
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/data.bin', path, add=True)
+        self.assertTrue(rc.ok(), rc.get_message())
+        # parts 0 and 1 were kept by the server
+        self.assertEqual(self._server.get_request_counts(), {'POST recipe/upload': 2, 'PUT recipe/upload': 2})
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/data.bin'], contents)
+
+    def test_server_without_uploads(self):
+        self._server.uploads = False
+        contents = ''.join('select %d;\n' % i for i in range(200))
+        path = self._write('a.sql', contents.encode('utf-8'))
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/a.sql', path)
+        self.assertTrue(rc.ok(), rc.get_message())
+        self.assertEqual(self._server.get_recipe_files('master', 'simple')['resources/a.sql'], contents)
+
+        path = self._write('data.bin', bytes(range(256)))
+        rc = self._api.upload_file('master', 'simple', 'm', 'resources/data.bin', path, add=True)
+        self.assertFalse(rc.ok())
+        self.assertIn('not a text file', rc.get_message())
+
+
+if __name__ == '__main__':
+    unittest.main()